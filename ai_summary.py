@@ -0,0 +1,289 @@
+import contextvars
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import types
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import METER
+
+logger = logging.getLogger(__name__)
+
+MODEL = "claude-3-opus-20240229"
+
+# Content-addressed store of AI responses. The key is a hash of everything that determines the
+# response (model, max_tokens, system prompt and the exact user content), so a repo whose
+# truncated commit log hasn't changed never reaches the API again.
+class SummaryCache:
+  def __init__(self, path, maxAge=90 * 24 * 3600, maxEntries=None):
+    self.PATH = path
+    self.MAX_AGE = maxAge
+    self.MAX_ENTRIES = maxEntries
+    self.hits = 0
+    self.misses = 0
+
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute("""CREATE TABLE IF NOT EXISTS summaries (
+      key TEXT PRIMARY KEY,
+      model TEXT,
+      response TEXT,
+      created_at REAL,
+      accessed_at REAL
+    )""")
+    self._conn.commit()
+    self.evict()
+
+  def get(self, key):
+    with self._lock:
+      row = self._conn.execute("SELECT response FROM summaries WHERE key = ?", (key,)).fetchone()
+      if row is None:
+        self.misses += 1
+        return None
+      self.hits += 1
+      self._conn.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+      self._conn.commit()
+    return row[0]
+
+  def put(self, key, model, response):
+    now = time.time()
+    with self._lock:
+      self._conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)", (key, model, response, now, now))
+      self._conn.commit()
+
+  def evict(self):
+    with self._lock:
+      if self.MAX_AGE:
+        self._conn.execute("DELETE FROM summaries WHERE created_at < ?", (time.time() - self.MAX_AGE,))
+      if self.MAX_ENTRIES:
+        self._conn.execute(
+          "DELETE FROM summaries WHERE key NOT IN (SELECT key FROM summaries ORDER BY accessed_at DESC LIMIT ?)",
+          (self.MAX_ENTRIES,)
+        )
+      self._conn.commit()
+
+  def close(self):
+    self.evict()
+    with self._lock:
+      self._conn.close()
+
+def prompt_key(model, system, content, maxTokens):
+  payload = json.dumps({"model": model, "system": system, "content": content, "max_tokens": maxTokens}, sort_keys=True)
+  return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Token bucket for the API's input-tokens-per-minute limit. Callers block in acquire until the
+# bucket has refilled enough for their prompt.
+class TokenRateLimiter:
+  def __init__(self, tokensPerMinute):
+    self.TOKENS_PER_MINUTE = tokensPerMinute
+    self._available = float(tokensPerMinute)
+    self._updated = time.monotonic()
+    self._lock = threading.Lock()
+
+  def acquire(self, tokens):
+    tokens = min(tokens, self.TOKENS_PER_MINUTE)
+    while True:
+      with self._lock:
+        now = time.monotonic()
+        self._available = min(self.TOKENS_PER_MINUTE, self._available + (now - self._updated) * self.TOKENS_PER_MINUTE / 60)
+        self._updated = now
+        if self._available >= tokens:
+          self._available -= tokens
+          return
+        wait = (tokens - self._available) * 60 / self.TOKENS_PER_MINUTE
+      time.sleep(wait)
+
+# Offline stand-in for the Anthropic client with the same messages / batches surface. Returns a
+# deterministic summary so the pipeline can be run and tested without network or API keys.
+class StubClient:
+  def __init__(self):
+    self.calls = 0
+    self.messages = types.SimpleNamespace(create=self.create, batches=types.SimpleNamespace(create=self._batch_create, retrieve=self._batch_retrieve, results=self._batch_results))
+    self._batches = {}
+
+  def create(self, max_tokens, system, messages, model):
+    self.calls += 1
+    content = messages[0]["content"]
+    text = f"Stub summary ({model}) of {len(content)} characters: {' '.join(content.split()[:12])}"
+    usage = types.SimpleNamespace(input_tokens=len((system + content).split()), output_tokens=len(text.split()))
+    return types.SimpleNamespace(content=[types.SimpleNamespace(text=text)], usage=usage)
+
+  def _batch_create(self, requests):
+    batchId = f"stub_batch_{len(self._batches)}"
+    self._batches[batchId] = [
+      types.SimpleNamespace(custom_id=r["custom_id"], result=types.SimpleNamespace(type="succeeded", message=self.create(**r["params"])))
+      for r in requests
+    ]
+    return types.SimpleNamespace(id=batchId, processing_status="ended")
+
+  def _batch_retrieve(self, batchId):
+    return types.SimpleNamespace(id=batchId, processing_status="ended")
+
+  def _batch_results(self, batchId):
+    return iter(self._batches[batchId])
+
+# Front for every Claude call. Looks the prompt up in the summary cache first; in offline mode a
+# miss returns None instead of calling the API. Calls that reach the API wait on the limiter.
+class Summarizer:
+  def __init__(self, client, model=MODEL, tokenCounter=None):
+    self.client = client
+    self.MODEL = model
+    self.cache = None
+    self.offline = False
+    self.limiter = None
+    self.tokenCounter = tokenCounter
+    self.metrics = None
+
+  def _record_usage(self, messages, seconds, batch=False):
+    if self.metrics is None:
+      return
+    usages = [getattr(m, "usage", None) for m in messages]
+    self.metrics.record_llm(
+      sum(u.input_tokens for u in usages if u is not None),
+      sum(u.output_tokens for u in usages if u is not None),
+      seconds,
+      batch=batch
+    )
+
+  def _record_cache_hit(self):
+    if self.metrics is not None:
+      self.metrics.record_llm_cache_hit()
+
+  def summarize(self, system, content, maxTokens=1024):
+    key = prompt_key(self.MODEL, system, content, maxTokens)
+    if self.cache is not None:
+      cached = self.cache.get(key)
+      if cached is not None:
+        logger.info(f"AI summary cache hit: {key}")
+        self._record_cache_hit()
+        return cached
+
+    if self.offline:
+      logger.info(f"Offline and no cached AI summary for {key}")
+      return None
+
+    if self.limiter is not None and self.tokenCounter is not None:
+      self.limiter.acquire(self.tokenCounter.count(system) + self.tokenCounter.count(content))
+
+    start = time.perf_counter()
+    message = self.client.messages.create(
+      max_tokens=maxTokens,
+      system=system,
+      messages=[
+        {
+          "role": "user",
+          "content": content,
+        }
+      ],
+      model=self.MODEL,
+    )
+    self._record_usage([message], time.perf_counter() - start)
+    text = message.content[0].text
+
+    if self.cache is not None:
+      self.cache.put(key, self.MODEL, text)
+    return text
+
+  # Submits every uncached prompt as one Message Batches request and waits for it to finish.
+  # Returns the summaries in prompt order; failed or offline-missing entries are None. meters, one
+  # per prompt (or None), are charged the tokens of their prompt's response.
+  def summarize_batch(self, prompts, maxTokens=1024, pollInterval=30, meters=None):
+    results = [None] * len(prompts)
+    pending = {}
+    requests = []
+    for idx, (system, content) in enumerate(prompts):
+      key = prompt_key(self.MODEL, system, content, maxTokens)
+      cached = self.cache.get(key) if self.cache is not None else None
+      if cached is not None:
+        self._record_cache_hit()
+        results[idx] = cached
+        continue
+      if self.offline:
+        continue
+      customId = f"summary-{idx}"
+      pending[customId] = (idx, key)
+      requests.append({
+        "custom_id": customId,
+        "params": {
+          "max_tokens": maxTokens,
+          "system": system,
+          "messages": [{"role": "user", "content": content}],
+          "model": self.MODEL,
+        },
+      })
+
+    if not requests:
+      return results
+
+    start = time.perf_counter()
+    batch = self.client.messages.batches.create(requests=requests)
+    logger.info(f"Submitted AI summary batch {batch.id} with {len(requests)} requests")
+    while batch.processing_status != "ended":
+      time.sleep(pollInterval)
+      batch = self.client.messages.batches.retrieve(batch.id)
+
+    succeeded = []
+    for entry in self.client.messages.batches.results(batch.id):
+      idx, key = pending[entry.custom_id]
+      if entry.result.type != "succeeded":
+        logger.info(f"AI summary batch entry {entry.custom_id} {entry.result.type}")
+        continue
+      succeeded.append(entry.result.message)
+      results[idx] = entry.result.message.content[0].text
+      if self.cache is not None:
+        self.cache.put(key, self.MODEL, results[idx])
+      usage = getattr(entry.result.message, "usage", None)
+      if meters is not None and meters[idx] is not None and usage is not None:
+        meters[idx].add(llmTokens=usage.input_tokens + usage.output_tokens)
+    self._record_usage(succeeded, time.perf_counter() - start, batch=True)
+    return results
+
+# Summarization stage that runs independently of fetching. Producers submit prompts and get a
+# Future back; a bounded pool of workers drains them, or in batch mode everything submitted is
+# sent as a single Message Batches request on flush(). Either way a summary's tokens are charged
+# to the meter of whoever submitted it.
+class SummaryPipeline:
+  def __init__(self, summarizer, workers=4, batch=False):
+    self.summarizer = summarizer
+    self.WORKERS = workers
+    self.BATCH = batch
+    self._pool = None
+    self._queued = []
+    self._lock = threading.Lock()
+
+  def submit(self, system, content):
+    if self.BATCH:
+      future = Future()
+      with self._lock:
+        self._queued.append((system, content, future, METER.get()))
+      return future
+
+    with self._lock:
+      if self._pool is None:
+        self._pool = ThreadPoolExecutor(max_workers=max(1, self.WORKERS), thread_name_prefix="summary")
+    return self._pool.submit(contextvars.copy_context().run, self.summarizer.summarize, system, content)
+
+  def flush(self):
+    with self._lock:
+      queued, self._queued = self._queued, []
+    if not queued:
+      return
+    try:
+      results = self.summarizer.summarize_batch([(system, content) for system, content, _, _ in queued], meters=[meter for _, _, _, meter in queued])
+    except Exception as exc:
+      for _, _, future, _ in queued:
+        future.set_exception(exc)
+      return
+    for (_, _, future, _), result in zip(queued, results):
+      future.set_result(result)
+
+  def close(self):
+    self.flush()
+    with self._lock:
+      pool, self._pool = self._pool, None
+    if pool is not None:
+      pool.shutdown(wait=True)
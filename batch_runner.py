@@ -0,0 +1,45 @@
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+def read_org_names(orgNames, orgFile=None):
+  names = list(orgNames or [])
+  if orgFile:
+    with open(orgFile, 'r') as f:
+      names += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+  # keep the first occurrence of every org, in order
+  return list(dict.fromkeys(names))
+
+# Runs every org in the same process so they share the transport (and with it one rate-limit
+# budget), the caches and the fetch / summary / chart worker pools. Up to maxParallelOrgs run at
+# once so one org's I/O overlaps another's; a failing org is recorded and the others carry on.
+def run_batch(configs, runOrg, maxParallelOrgs=4, summaryPath=None):
+  def run(analysisConfig):
+    start = time.time()
+    status, error = "done", None
+    try:
+      runOrg(analysisConfig)
+    except (Exception, SystemExit) as exc:
+      logger.exception(f"Analysis failed for {analysisConfig.ORG_NAME}")
+      status, error = "failed", repr(exc)
+    return {"org": analysisConfig.ORG_NAME, "status": status, "error": error, "seconds": round(time.time() - start, 2)}
+
+  results = {}
+  with ThreadPoolExecutor(max_workers=max(1, maxParallelOrgs), thread_name_prefix="org") as pool:
+    futures = {pool.submit(run, c): c.ORG_NAME for c in configs}
+    for n, future in enumerate(as_completed(futures), 1):
+      result = future.result()
+      results[result["org"]] = result
+      print(f"[{n}/{len(configs)}] {result['org']}: {result['status']} in {result['seconds']:.1f}s" + (f" ({result['error']})" if result['error'] else ""))
+
+  ordered = [results[c.ORG_NAME] for c in configs]
+  if summaryPath:
+    with open(summaryPath, "w") as f:
+      json.dump(ordered, f, indent=2)
+  failed = [r["org"] for r in ordered if r["status"] != "done"]
+  if failed:
+    logger.info(f"Batch finished with failures: {', '.join(failed)}")
+  return ordered
@@ -0,0 +1,85 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Anthropic Messages API (POST /v1/messages). Answers after a fixed
+# latency with a short deterministic summary and a usage block estimated from the prompt, so the
+# real SDK client, the rate limiter and the summary pipeline are exercised end to end.
+class FakeAnthropic:
+  def __init__(self, latency=0.0, errorRate=0.0, seed=1):
+    self.LATENCY = latency
+    self.ERROR_RATE = errorRate
+    self._random = random.Random(seed)
+    self._lock = threading.Lock()
+    self.requests = 0
+    self.inputTokens = 0
+    self.outputTokens = 0
+    self.server = None
+    self.url = None
+
+  def start(self, host="127.0.0.1", port=0):
+    fake = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def do_POST(self):
+        fake.handle(self)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer((host, port), Handler)
+    self.server.daemon_threads = True
+    self.url = f"http://{host}:{self.server.server_address[1]}"
+    threading.Thread(target=self.server.serve_forever, name="fake-anthropic", daemon=True).start()
+    return self
+
+  def stop(self):
+    if self.server is not None:
+      self.server.shutdown()
+      self.server.server_close()
+
+  def handle(self, request):
+    length = int(request.headers.get("Content-Length") or 0)
+    body = json.loads(request.rfile.read(length) or b"{}")
+    if self.LATENCY:
+      time.sleep(self.LATENCY)
+
+    if request.path.rstrip("/") != "/v1/messages":
+      return self._send(request, 404, {"type": "error", "error": {"type": "not_found_error", "message": request.path}})
+
+    with self._lock:
+      self.requests += 1
+      failed = self._random.random() < self.ERROR_RATE
+    if failed:
+      return self._send(request, 529, {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+
+    prompt = (body.get("system") or "") + "".join(m.get("content", "") for m in body.get("messages", []) if isinstance(m.get("content"), str))
+    inputTokens = max(1, len(prompt) // 4)
+    text = f"Synthetic summary of {len(prompt)} characters. The repository shows steady maintenance with no major risks."
+    outputTokens = len(text) // 4
+    with self._lock:
+      self.inputTokens += inputTokens
+      self.outputTokens += outputTokens
+
+    self._send(request, 200, {
+      "id": f"msg_bench_{self.requests}",
+      "type": "message",
+      "role": "assistant",
+      "model": body.get("model"),
+      "content": [{"type": "text", "text": text}],
+      "stop_reason": "end_turn",
+      "stop_sequence": None,
+      "usage": {"input_tokens": inputTokens, "output_tokens": outputTokens},
+    })
+
+  def _send(self, request, status, payload):
+    data = json.dumps(payload).encode()
+    request.send_response(status)
+    request.send_header("Content-Type", "application/json")
+    request.send_header("Content-Length", str(len(data)))
+    request.end_headers()
+    request.wfile.write(data)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+LANGUAGES = ["Go", "Rust", "TypeScript", "Python", "Solidity", None]
+
+# Deterministic synthetic organization: repos (a share of them forks), commits per repo, members
+# and their profiles, all in the shape the GitHub REST API returns them.
+class SyntheticOrg:
+  def __init__(self, name="bench-org", repos=20, commitsPerRepo=300, members=30, forkRatio=0.2, seed=1):
+    rnd = random.Random(seed)
+    self.name = name
+    now = datetime(2024, 6, 1, tzinfo=timezone.utc)
+    authors = [f"dev{i}" for i in range(max(1, members))]
+
+    self.org = {"login": name, "name": name.title(), "description": f"Synthetic {name}", "public_repos": repos, "followers": rnd.randint(0, 5000), "created_at": "2020-01-01T00:00:00Z", "updated_at": "2024-06-01T00:00:00Z"}
+    self.repos = []
+    self.commits = {}
+    for i in range(repos):
+      repoName = f"repo-{i}"
+      isFork = rnd.random() < forkRatio
+      commits = []
+      for j in range(commitsPerRepo):
+        date = (now - timedelta(hours=j * 7 + i)).isoformat().replace("+00:00", "Z")
+        login = rnd.choice(authors)
+        linked = rnd.random() > 0.1
+        bot = rnd.random() < 0.05
+        commits.append({
+          "sha": hashlib.sha1(f"{repoName}-{j}".encode()).hexdigest(),
+          "author": {"login": "dependabot[bot]" if bot else login, "avatar_url": f"https://avatars.example/{login}", "type": "Bot" if bot else "User"} if linked else None,
+          "committer": {"avatar_url": f"https://avatars.example/{login}", "type": "User"} if rnd.random() > 0.05 else None,
+          "commit": {
+            "author": {"name": login.upper()},
+            "committer": {"date": date},
+            "message": rnd.choice(["chore: bump deps", "fix: handle empty pages", "feat: add batch endpoint", "refactor storage layer\n\nLonger body text describing the change."]) + f" #{j}",
+          },
+        })
+      self.commits[repoName] = commits
+      self.repos.append({
+        "name": repoName,
+        "description": f"Synthetic repository {i}",
+        "created_at": "2021-01-01T00:00:00Z",
+        "updated_at": commits[0]["commit"]["committer"]["date"] if commits else "2021-01-01T00:00:00Z",
+        "pushed_at": commits[0]["commit"]["committer"]["date"] if commits else "2021-01-01T00:00:00Z",
+        "size": rnd.randint(10, 200000),
+        "stargazers_count": int(rnd.paretovariate(1.2)) - 1,
+        "watchers_count": rnd.randint(0, 300),
+        "language": rnd.choice(LANGUAGES),
+        "open_issues_count": rnd.randint(0, 150),
+        "license": {"name": "MIT License"} if rnd.random() > 0.3 else None,
+        "fork": isFork,
+      })
+    self.members = [{"login": login, "avatar_url": f"https://avatars.example/{login}"} for login in authors[:members]]
+    self.users = {login: {"login": login, "name": login.title(), "followers": rnd.randint(0, 2000)} for login in authors}
+    # org events API feed, newest first
+    self.events = []
+    self._lock = threading.Lock()
+
+  # Adds count new commits on top of a repo, moves its pushed_at and records a PushEvent. Returns
+  # the payload GitHub would deliver to a push webhook.
+  def push(self, repoName, count=1, author="dev0", message="feat: pushed change"):
+    with self._lock:
+      repo = next(r for r in self.repos if r["name"] == repoName)
+      commits = self.commits[repoName]
+      newest = datetime.fromisoformat(repo["pushed_at"].replace("Z", "+00:00"))
+      pushed = []
+      for n in range(count):
+        date = (newest + timedelta(minutes=n + 1)).isoformat().replace("+00:00", "Z")
+        pushed.insert(0, {
+          "sha": hashlib.sha1(f"{repoName}-push-{len(commits) + n}".encode()).hexdigest(),
+          "author": {"login": author, "avatar_url": f"https://avatars.example/{author}", "type": "User"},
+          "committer": {"avatar_url": f"https://avatars.example/{author}", "type": "User"},
+          "commit": {"author": {"name": author.upper()}, "committer": {"date": date}, "message": f"{message} {len(commits) + n}"},
+        })
+      self.commits[repoName] = pushed + commits
+      repo["pushed_at"] = repo["updated_at"] = pushed[0]["commit"]["committer"]["date"]
+      self.events.insert(0, {"id": str(len(self.events) + 1), "type": "PushEvent", "repo": {"name": f"{self.name}/{repoName}"}, "created_at": repo["pushed_at"]})
+    return {
+      "ref": "refs/heads/main",
+      "repository": {"name": repoName, "full_name": f"{self.name}/{repoName}", "owner": {"login": self.name}},
+      "organization": {"login": self.name},
+      "commits": [{"id": c["sha"], "message": c["commit"]["message"]} for c in pushed],
+    }
+
+  def total_commits(self):
+    return sum(len(c) for c in self.commits.values())
+
+# Local stand-in for api.github.com serving a SyntheticOrg, including the org events feed.
+# Emulates page/per_page pagination with Link headers, since= filtering, ETag / If-None-Match,
+# X-RateLimit-* headers, per-request latency and injected 5xx / secondary-rate-limit errors.
+class FakeGitHub:
+  def __init__(self, org, latency=0.0, errorRate=0.0, throttleRate=0.0, rateLimit=5000, seed=1):
+    self.ORG = org
+    self.LATENCY = latency
+    self.ERROR_RATE = errorRate
+    self.THROTTLE_RATE = throttleRate
+    self.RATE_LIMIT = rateLimit
+    self._random = random.Random(seed)
+    self._lock = threading.Lock()
+    self.remaining = rateLimit
+    self.reset = int(time.time()) + 3600
+    self.requests = {}
+    self.notModified = 0
+    self.errors = 0
+    self.server = None
+    self.url = None
+
+  def start(self, host="127.0.0.1", port=0):
+    fake = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def do_GET(self):
+        fake.handle(self)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer((host, port), Handler)
+    self.server.daemon_threads = True
+    self.url = f"http://{host}:{self.server.server_address[1]}"
+    threading.Thread(target=self.server.serve_forever, name="fake-github", daemon=True).start()
+    return self
+
+  def stop(self):
+    if self.server is not None:
+      self.server.shutdown()
+      self.server.server_close()
+
+  def total_requests(self):
+    with self._lock:
+      return sum(self.requests.values())
+
+  def _count(self, kind):
+    with self._lock:
+      self.requests[kind] = self.requests.get(kind, 0) + 1
+      self.remaining = max(0, self.remaining - 1)
+      return self.remaining
+
+  def _page(self, items, query, path):
+    page = int(query.get("page", ["1"])[0])
+    perPage = int(query.get("per_page", ["30"])[0])
+    last = max(1, -(-len(items) // perPage))
+    links = []
+    if page < last:
+      links.append(f'<{self.url}{path}?page={page + 1}&per_page={perPage}>; rel="next"')
+    links.append(f'<{self.url}{path}?page={last}&per_page={perPage}>; rel="last"')
+    return items[(page - 1) * perPage:page * perPage], {"Link": ", ".join(links)}
+
+  def route(self, path, query):
+    org = self.ORG
+    if path == f"/orgs/{org.name}":
+      return "org", org.org, {}
+    if path == f"/orgs/{org.name}/members":
+      return ("members",) + self._page(org.members, query, path)
+    if path == f"/orgs/{org.name}/repos":
+      return ("repos",) + self._page(org.repos, query, path)
+    if path == f"/orgs/{org.name}/events":
+      return ("events",) + self._page(org.events, query, path)
+    m = re.fullmatch(rf"/repos/{re.escape(org.name)}/([\w.-]+)/commits", path)
+    if m and m.group(1) in org.commits:
+      commits = org.commits[m.group(1)]
+      if "since" in query:
+        commits = [c for c in commits if c["commit"]["committer"]["date"] >= query["since"][0]]
+      return ("commits",) + self._page(commits, query, path)
+    m = re.fullmatch(rf"/repos/{re.escape(org.name)}/([\w.-]+)", path)
+    if m and m.group(1) in org.commits:
+      return "repo", {"name": m.group(1), "parent": {"full_name": f"upstream/{m.group(1)}"}}, {}
+    m = re.fullmatch(r"/users/([\w\[\].-]+)/orgs", path)
+    if m:
+      return "user_orgs", [{"login": org.name}, {"login": f"other-{len(m.group(1)) % 3}"}], {}
+    m = re.fullmatch(r"/users/([\w\[\].-]+)", path)
+    if m and m.group(1) in org.users:
+      return "user", org.users[m.group(1)], {}
+    return "not_found", {"message": "Not Found"}, {}
+
+  def handle(self, request):
+    if self.LATENCY:
+      time.sleep(self.LATENCY)
+    parsed = urlparse(request.path)
+    kind, body, headers = self.route(parsed.path, parse_qs(parsed.query))
+    remaining = self._count(kind)
+    headers.update({"X-RateLimit-Limit": str(self.RATE_LIMIT), "X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(self.reset)})
+
+    roll = self._random.random()
+    if roll < self.ERROR_RATE:
+      with self._lock:
+        self.errors += 1
+      return self._send(request, 502, {"message": "Bad Gateway"}, headers)
+    if roll < self.ERROR_RATE + self.THROTTLE_RATE:
+      with self._lock:
+        self.errors += 1
+      headers["Retry-After"] = "1"
+      return self._send(request, 403, {"message": "You have exceeded a secondary rate limit"}, headers)
+
+    status = 404 if kind == "not_found" else 200
+    payload = json.dumps(body).encode()
+    etag = '"' + hashlib.md5(payload).hexdigest() + '"'
+    headers["ETag"] = etag
+    if status == 200 and request.headers.get("If-None-Match") == etag:
+      with self._lock:
+        self.notModified += 1
+      return self._send(request, 304, None, headers)
+    return self._send(request, status, payload, headers)
+
+  def _send(self, request, status, body, headers):
+    if isinstance(body, dict):
+      body = json.dumps(body).encode()
+    request.send_response(status)
+    request.send_header("Content-Type", "application/json; charset=utf-8")
+    request.send_header("Content-Length", str(len(body or b"")))
+    for key, value in headers.items():
+      request.send_header(key, value)
+    request.end_headers()
+    if body:
+      request.wfile.write(body)
@@ -0,0 +1,157 @@
+# Local event replayer for the org_analysis refresh daemon (the "serve" stage). Either replays
+# recorded webhook deliveries (one JSON object per line: {"event": ..., "payload": ..., "delay": s})
+# against a running daemon:
+#   python bench/replay_events.py --url http://127.0.0.1:8787 --file deliveries.jsonl
+# or, without --url, runs a daemon in-process against the local GitHub and Claude stand-ins, pushes
+# bursts of commits to a synthetic org and reports what the initial full refresh and the
+# incremental refreshes cost:
+#   python bench/replay_events.py --repos 30 --pushes 12 --burst 4 --debounce 1
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_github import FakeGitHub, SyntheticOrg
+from fake_anthropic import FakeAnthropic
+
+logger = logging.getLogger(__name__)
+
+def deliver(url, event, payload, secret=None):
+  body = json.dumps(payload).encode()
+  headers = {"Content-Type": "application/json", "X-GitHub-Event": event, "X-GitHub-Delivery": str(uuid.uuid4())}
+  if secret:
+    headers["X-Hub-Signature-256"] = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+  request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+  try:
+    with urllib.request.urlopen(request) as response:
+      return response.status
+  except urllib.error.HTTPError as error:
+    return error.code
+
+def replay_file(args):
+  with open(args.file, "r") as f:
+    deliveries = [json.loads(line) for line in f if line.strip()]
+  statuses = {}
+  for delivery in deliveries:
+    time.sleep(delivery.get("delay", 0) / args.speed)
+    status = deliver(args.url, delivery["event"], delivery["payload"], args.secret)
+    statuses[status] = statuses.get(status, 0) + 1
+  print(json.dumps({"deliveries": len(deliveries), "statuses": statuses}, indent=2))
+
+def counts(github, anthropic):
+  return {"github_requests": github.total_requests(), "llm_requests": anthropic.requests}
+
+def since(after, before):
+  return {k: after[k] - before[k] for k in after}
+
+def replay_synthetic(args):
+  import org_analysis as oa
+  from metrics import RunMetrics
+  from refresh_daemon import RefreshDaemon
+
+  rnd = random.Random(args.seed)
+  org = SyntheticOrg(repos=args.repos, commitsPerRepo=args.commits, members=args.members, seed=args.seed)
+  github = FakeGitHub(org, latency=args.latency_ms / 1000, seed=args.seed).start()
+  anthropic = FakeAnthropic(latency=args.llm_latency_ms / 1000, seed=args.seed).start()
+  recorded = []
+  try:
+    with tempfile.TemporaryDirectory(prefix="org_analysis_replay_") as outputDir:
+      oa.CONFIG = {"GITHUB_API_KEY": "replay", "ANTHROPIC_API_KEY": "replay", "GITHUB_API_URL": github.url, "ANTHROPIC_BASE_URL": anthropic.url, "GITHUB_WEBHOOK_SECRET": args.secret}
+      oa.METRICS = RunMetrics()
+      analysisConfig = oa.OrgAnalysisConfig(org.name, numCommits=args.commits, outputDir=outputDir, chartWorkers=0, streaming=args.streaming)
+      oa.setup_run(analysisConfig, "refresh")
+      daemon = RefreshDaemon([analysisConfig], oa.refresh_tracked_org, pollEvents=oa.poll_org_events, debounce=args.debounce, maxDelay=args.max_delay, pollInterval=args.poll_interval, secret=args.secret)
+      daemon.start(port=None if args.poll_interval else 0)
+
+      before = counts(github, anthropic)
+      daemon.wait_idle()
+      initial = since(counts(github, anthropic), before)
+      logger.info(f"Initial full refresh: {initial}")
+
+      before = counts(github, anthropic)
+      started = time.perf_counter()
+      pushed = set()
+      for n in range(args.pushes):
+        if n and n % args.burst == 0:
+          time.sleep(args.burst_gap)
+        repoName = rnd.choice(org.repos)["name"]
+        pushed.add(repoName)
+        payload = org.push(repoName, count=rnd.randint(1, 3))
+        recorded.append({"event": "push", "payload": payload, "delay": args.burst_gap if n and n % args.burst == 0 else 0})
+        if daemon.url:
+          deliver(daemon.url, "push", payload, args.secret)
+      if args.poll_interval:
+        # let the poller see the last pushes before waiting for the refreshes they trigger
+        time.sleep(args.poll_interval * 2)
+      daemon.wait_idle()
+      incremental = since(counts(github, anthropic), before)
+      incremental["seconds"] = round(time.perf_counter() - started, 2)
+      daemon.stop()
+
+      report = {
+        "params": {k: v for k, v in vars(args).items() if k not in ("url", "file", "record", "secret")},
+        "initial_refresh": initial,
+        "incremental_refreshes": incremental,
+        "repos_pushed": len(pushed),
+        "refreshes": daemon.history,
+        "daemon": daemon.stats,
+        "report": os.path.exists(f"{outputDir}/{org.name}_report.html"),
+      }
+    oa.CHARTS.close()
+    oa.SUMMARY_PIPELINE.close()
+  finally:
+    github.stop()
+    anthropic.stop()
+
+  print(json.dumps(report, indent=2))
+  if args.record:
+    with open(args.record, "w") as f:
+      for delivery in recorded:
+        f.write(json.dumps(delivery) + "\n")
+
+def main():
+  parser = argparse.ArgumentParser(description="Replay GitHub webhook deliveries against the org_analysis refresh daemon")
+  parser.add_argument("--url", type=str, default=None, help="Webhook URL of a running daemon; without it a daemon is run in-process against local stand-ins")
+  parser.add_argument("--file", type=str, default=None, help="Recorded deliveries to replay against --url (JSON lines)")
+  parser.add_argument("--speed", type=float, default=1.0, help="Replay the recorded delays this many times faster")
+  parser.add_argument("--secret", type=str, default=None, help="Sign deliveries with this webhook secret")
+  parser.add_argument("--repos", type=int, default=20, help="Repositories in the synthetic org")
+  parser.add_argument("--commits", type=int, default=200, help="Commits per repository (and commits analyzed per repo)")
+  parser.add_argument("--members", type=int, default=10, help="Public members of the synthetic org")
+  parser.add_argument("--pushes", type=int, default=10, help="Pushes to random repos after the initial refresh")
+  parser.add_argument("--burst", type=int, default=5, help="Pushes delivered back to back before a pause")
+  parser.add_argument("--burst-gap", type=float, default=2.0, help="Seconds between bursts")
+  parser.add_argument("--debounce", type=float, default=1.0, help="Passed through as --debounce")
+  parser.add_argument("--max-delay", type=float, default=10.0, help="Passed through as --max-delay")
+  parser.add_argument("--poll-interval", type=float, default=None, help="Discover the pushes by polling the events API instead of webhooks")
+  parser.add_argument("--streaming", action="store_true", help="Passed through as --streaming")
+  parser.add_argument("--latency-ms", type=float, default=5, help="Latency of every fake GitHub response")
+  parser.add_argument("--llm-latency-ms", type=float, default=50, help="Latency of every fake Claude response")
+  parser.add_argument("--record", type=str, default=None, help="Write the synthetic deliveries to this file for --file replays")
+  parser.add_argument("--seed", type=int, default=1, help="Seed of the synthetic org and pushes")
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+  for name in ("org_analysis", "transport", "http_cache", "ai_summary", "tokens", "charts", "httpx", "matplotlib", "rollups", "run_manifest", "generate_report", "columnar"):
+    logging.getLogger(name).setLevel(logging.WARNING)
+
+  if args.url:
+    if not args.file:
+      parser.error("--url needs --file")
+    replay_file(args)
+  else:
+    replay_synthetic(args)
+
+if __name__ == "__main__":
+  main()
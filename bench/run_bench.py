@@ -0,0 +1,176 @@
+# Offline benchmarks for org_analysis: a synthetic org served by a local GitHub stand-in and a
+# stub Claude endpoint, timed per scenario. Not part of any test run; results can be appended to
+# a JSON-lines file to track a revision against the previous ones, e.g.
+#   python bench/run_bench.py --repos 50 --commits 1000 --latency-ms 30 --output bench/results.jsonl
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_github import FakeGitHub, SyntheticOrg
+from fake_anthropic import FakeAnthropic
+
+import org_analysis as oa
+from metrics import RunMetrics
+
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ("paged_request", "commit_info", "org_members_info", "aggRepo", "repoOutput", "end_to_end")
+
+def git_revision():
+  try:
+    return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+  except OSError:
+    return None
+
+def peak_rss_mb():
+  # ru_maxrss is in kilobytes on Linux
+  return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+# Runs fn once, returning its result with wall time, the requests both fake servers saw and the
+# peak traced Python allocation while it ran.
+def measure(name, fn, github, anthropic, traceMemory):
+  githubBefore = github.total_requests()
+  anthropicBefore = anthropic.requests
+  if traceMemory:
+    tracemalloc.start()
+  start = time.perf_counter()
+  try:
+    result = fn()
+  finally:
+    seconds = time.perf_counter() - start
+    peak = None
+    if traceMemory:
+      peak = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+      tracemalloc.stop()
+  return result, {
+    "scenario": name,
+    "seconds": round(seconds, 4),
+    "github_requests": github.total_requests() - githubBefore,
+    "llm_requests": anthropic.requests - anthropicBefore,
+    "peak_traced_mb": peak,
+    "peak_rss_mb": peak_rss_mb(),
+  }
+
+def make_config(org, outputDir, args):
+  return oa.OrgAnalysisConfig(
+    org.name,
+    numCommits=args.commits,
+    outputDir=outputDir,
+    concurrency=args.concurrency,
+    useCache=False,
+    llmWorkers=args.llm_workers,
+    chartWorkers=args.chart_workers,
+    streaming=args.streaming,
+  )
+
+def run_scenarios(args, org, github, anthropic, outputDir):
+  oa.CONFIG = {"GITHUB_API_KEY": "bench", "ANTHROPIC_API_KEY": "bench", "GITHUB_API_URL": github.url, "ANTHROPIC_BASE_URL": anthropic.url}
+  oa.METRICS = RunMetrics()
+  analysisConfig = make_config(org, outputDir, args)
+  oa.setup_run(analysisConfig)
+  # loaded up front so the first scenario doesn't pay for the imports
+  import pandas, matplotlib.figure
+
+  results = []
+  largest = max(org.repos, key=lambda r: len(org.commits[r["name"]]))["name"]
+  orgSummary = oa.org_info(org.org, analysisConfig)
+  repoStats = commitStats = None
+
+  for name in args.scenarios:
+    if name == "paged_request":
+      _, stats = measure(name, lambda: oa.make_paged_request(oa.REPO_COMMITS_URL, args.commits, analysisConfig, repo_name=largest), github, anthropic, args.trace_memory)
+      stats["items"] = min(args.commits, len(org.commits[largest]))
+    elif name == "commit_info":
+      commits = org.commits[largest][:args.commits]
+      _, stats = measure(name, lambda: oa.summary_result(oa.commit_info(commits, False, orgSummary, "")[1]), github, anthropic, args.trace_memory)
+      stats["items"] = len(commits)
+    elif name == "org_members_info":
+      _, stats = measure(name, lambda: oa.org_members_info(org.members, analysisConfig), github, anthropic, args.trace_memory)
+      stats["items"] = len(org.members)
+    elif name == "aggRepo":
+      (repoStats, commitStats, _), stats = measure(name, lambda: oa.aggRepo(org.repos, analysisConfig, orgSummary), github, anthropic, args.trace_memory)
+      stats["items"] = len(commitStats)
+      stats["repos"] = len(repoStats)
+    elif name == "repoOutput":
+      if repoStats is None:
+        repoStats, commitStats, _ = oa.aggRepo(org.repos, analysisConfig, orgSummary)
+      _, stats = measure(name, lambda: oa.repoOutput(repoStats, commitStats, analysisConfig), github, anthropic, args.trace_memory)
+      stats["items"] = len(commitStats)
+    elif name == "end_to_end":
+      oa.METRICS = RunMetrics()
+      _, stats = measure(name, lambda: oa.main(make_config(org, outputDir, args)), github, anthropic, args.trace_memory)
+      snapshot = oa.METRICS.snapshot(org.name)
+      stats["stages"] = snapshot["stages"].get(org.name, {})
+      stats["http"] = {k: snapshot["http"][k] for k in ("requests", "retries", "bytes")}
+      stats["coverage"] = snapshot.get("coverage", {}).get(org.name)
+      stats["items"] = stats["coverage"]["repos"].get("covered", 0) if stats["coverage"] else None
+    if stats.get("items") is not None and stats["seconds"] > 0:
+      stats["items_per_s"] = round(stats["items"] / stats["seconds"], 1)
+    if stats["github_requests"] and stats["seconds"] > 0:
+      stats["requests_per_s"] = round(stats["github_requests"] / stats["seconds"], 1)
+    logger.info(json.dumps(stats))
+    results.append(stats)
+  return results
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark org_analysis against local stand-ins for the GitHub and Anthropic APIs")
+  parser.add_argument("--repos", type=int, default=20, help="Repositories in the synthetic org")
+  parser.add_argument("--commits", type=int, default=300, help="Commits per repository (and commits analyzed per repo)")
+  parser.add_argument("--members", type=int, default=30, help="Public members of the synthetic org")
+  parser.add_argument("--fork-ratio", type=float, default=0.2, help="Share of repositories that are forks")
+  parser.add_argument("--latency-ms", type=float, default=20, help="Latency of every fake GitHub response")
+  parser.add_argument("--error-rate", type=float, default=0.0, help="Share of GitHub responses that are 502s")
+  parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of GitHub responses that are secondary rate limits")
+  parser.add_argument("--llm-latency-ms", type=float, default=200, help="Latency of every fake Claude response")
+  parser.add_argument("--llm-error-rate", type=float, default=0.0, help="Share of Claude responses that are 529 overloaded errors")
+  parser.add_argument("--concurrency", type=int, default=8, help="Passed through as --concurrency")
+  parser.add_argument("--llm-workers", type=int, default=4, help="Passed through as --llm-workers")
+  parser.add_argument("--chart-workers", type=int, default=0, help="Passed through as --chart-workers")
+  parser.add_argument("--streaming", action="store_true", help="Passed through as --streaming")
+  parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="Scenarios to run, in order")
+  parser.add_argument("--trace-memory", action="store_true", help="Report peak traced Python allocations per scenario (slower)")
+  parser.add_argument("--output", type=str, default=None, help="Append the results as one JSON line to this file")
+  parser.add_argument("--seed", type=int, default=1, help="Seed of the synthetic org")
+  args = parser.parse_args()
+
+  logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+  for name in ("org_analysis", "transport", "http_cache", "ai_summary", "tokens", "charts", "httpx", "matplotlib"):
+    logging.getLogger(name).setLevel(logging.WARNING)
+
+  org = SyntheticOrg(repos=args.repos, commitsPerRepo=args.commits, members=args.members, forkRatio=args.fork_ratio, seed=args.seed)
+  github = FakeGitHub(org, latency=args.latency_ms / 1000, errorRate=args.error_rate, throttleRate=args.throttle_rate, seed=args.seed).start()
+  anthropic = FakeAnthropic(latency=args.llm_latency_ms / 1000, errorRate=args.llm_error_rate, seed=args.seed).start()
+  try:
+    with tempfile.TemporaryDirectory(prefix="org_analysis_bench_") as outputDir:
+      results = run_scenarios(args, org, github, anthropic, outputDir)
+    oa.CHARTS.close()
+    oa.SUMMARY_PIPELINE.close()
+  finally:
+    github.stop()
+    anthropic.stop()
+
+  report = {
+    "revision": git_revision(),
+    "timestamp": time.time(),
+    "params": {k: v for k, v in vars(args).items() if k not in ("output", "scenarios")},
+    "total_commits": org.total_commits(),
+    "github": {"requests": dict(github.requests), "not_modified": github.notModified, "injected_errors": github.errors},
+    "llm": {"requests": anthropic.requests, "input_tokens": anthropic.inputTokens, "output_tokens": anthropic.outputTokens},
+    "results": results,
+  }
+  print(json.dumps(report, indent=2))
+  if args.output:
+    with open(args.output, "a") as f:
+      f.write(json.dumps(report) + "\n")
+
+if __name__ == "__main__":
+  main()
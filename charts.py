@@ -0,0 +1,144 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+CHART_FORMATS = ("png", "svg", "webp")
+
+# matplotlib is only imported by the processes that actually render
+def init_style():
+  import matplotlib
+  matplotlib.use("Agg")
+  # Quicksand falls back to sans-serif when it isn't installed; don't log that for every label
+  logging.getLogger("matplotlib.font_manager").setLevel(logging.ERROR)
+  matplotlib.rcParams['font.family'] = ['Quicksand', 'sans-serif']
+  matplotlib.rcParams['font.size'] = 12
+
+def render_histogram(values, xlabel, ylabel, title, paths, dpi):
+  from matplotlib.figure import Figure
+
+  fig = Figure(figsize=(12, 12))
+  try:
+    ax = fig.subplots()
+    fig.patch.set_facecolor('floralwhite')
+    ax.set_facecolor('floralwhite')
+
+    ax.hist(values, bins=30, color='lightskyblue', edgecolor='steelblue', linewidth=0.5)
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+
+    ax.set_xlabel(xlabel, labelpad=25)
+    ax.set_ylabel(ylabel, labelpad=25)
+    ax.set_title(title, fontweight='bold', fontsize=16)
+    ax.tick_params(axis='x', labelrotation=45)
+    for path in paths:
+      fig.savefig(path, dpi=dpi)
+  finally:
+    fig.clear()
+  return paths
+
+def render_pie(countSlice, labelSlice, title, paths, pieChartThreshold, dpi):
+  import matplotlib
+  import matplotlib.patheffects as path_effects
+  from matplotlib.figure import Figure
+  from matplotlib.patches import Circle
+
+  def my_autopct(pct):
+    return f'{pct:.1f}%' if pct >= pieChartThreshold * 100 else ''
+
+  total = sum(countSlice)
+  texts = [text if size/total >= pieChartThreshold else '' for size, text in zip(countSlice, labelSlice)]
+
+  fig = Figure(figsize=(15, 15), facecolor='floralwhite')
+  try:
+    ax = fig.subplots()
+    _, _, autotexts = ax.pie(
+      countSlice,
+      radius=1,
+      labels=texts,
+      autopct=my_autopct,
+      pctdistance=0.75,
+      startangle=180,
+      labeldistance=1.1,
+      colors=matplotlib.colormaps['Set2'].colors,
+      wedgeprops={'edgecolor': 'white', 'linewidth': 1},
+      textprops={'fontsize': 14}
+    )
+
+    # Add the center circle to make it a donut chart
+    ax.add_artist(Circle((0, 0), 0.50, fc='floralwhite'))
+
+    for text in autotexts:
+      text.set_color('white')
+      text.set_fontweight('bold')
+      text.set_fontsize(15)
+      text.set_fontname('Quicksand')
+      text.set_path_effects([path_effects.withStroke(linewidth=1, foreground='gray')])
+
+    ax.axis('equal')
+    ax.set_title(title, pad=70, loc='center', fontweight='bold', fontsize=16)
+    for path in paths:
+      fig.savefig(path, dpi=dpi)
+  finally:
+    fig.clear()
+  return paths
+
+# Renders charts off the main process. Each chart is a self-contained job that builds its own
+# Figure through the object-oriented API and releases it once saved, so nothing accumulates in
+# pyplot's global state. With workers=0 charts are rendered inline.
+class ChartRenderer:
+  def __init__(self, workers=0, formats=("png",), dpi=100):
+    self.WORKERS = workers
+    self.FORMATS = formats
+    self.DPI = dpi
+    self._pool = None
+    self._pending = []
+    self._styled = False
+    self._lock = threading.Lock()
+
+  def _paths(self, fileDir, fileName, stamp):
+    return [f"{fileDir}{fileName}_{stamp}.{ext}" for ext in self.FORMATS]
+
+  def _submit(self, fn, *args):
+    if self.WORKERS <= 0:
+      with self._lock:
+        if not self._styled:
+          init_style()
+          self._styled = True
+        job = fn(*args)
+    else:
+      with self._lock:
+        if self._pool is None:
+          # spawn keeps workers independent of the threads running in this process
+          self._pool = ProcessPoolExecutor(max_workers=self.WORKERS, mp_context=multiprocessing.get_context("spawn"), initializer=init_style)
+        job = self._pool.submit(fn, *args)
+    with self._lock:
+      self._pending.append(job)
+    return job
+
+  def histogram(self, values, xlabel, ylabel, title, fileName, fileDir, stamp):
+    import numpy as np
+    return self._submit(render_histogram, np.asarray(values), xlabel, ylabel, title, self._paths(fileDir, fileName, stamp), self.DPI)
+
+  def pie(self, countSlice, labelSlice, title, fileName, fileDir, pieChartThreshold, stamp):
+    return self._submit(render_pie, list(countSlice), list(labelSlice), title, self._paths(fileDir, fileName, stamp), pieChartThreshold, self.DPI)
+
+  # Blocks until the given charts (or every submitted chart) are written and returns their paths.
+  def wait(self, jobs=None):
+    with self._lock:
+      if jobs is None:
+        jobs, self._pending = self._pending, []
+      else:
+        self._pending = [job for job in self._pending if not any(job is j for j in jobs)]
+    paths = []
+    for job in jobs:
+      paths += job if isinstance(job, list) else job.result()
+    return paths
+
+  def close(self):
+    self.wait()
+    if self._pool is not None:
+      self._pool.shutdown(wait=True)
+      self._pool = None
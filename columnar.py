@@ -0,0 +1,283 @@
+import logging
+import os
+import shutil
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ("json", "parquet", "feather")
+
+# pyarrow is only needed for the columnar formats, so it is imported when one is used.
+def _arrow():
+  try:
+    import pyarrow
+  except ImportError:
+    raise Exception("The parquet and feather output formats need pyarrow (pip install pyarrow)")
+  return pyarrow
+
+def repo_schema():
+  pa = _arrow()
+  return pa.schema([
+    ("name", pa.string()),
+    ("description", pa.string()),
+    ("updated_at", pa.string()),
+    ("created_at", pa.string()),
+    ("size", pa.int64()),
+    ("stars", pa.int64()),
+    ("watchers", pa.int64()),
+    ("language", pa.dictionary(pa.int32(), pa.string())),
+    ("issues", pa.int64()),
+    ("license", pa.string()),
+    ("isFork", pa.bool_()),
+    ("forkOf", pa.string()),
+    ("AICommitSummary", pa.string()),
+  ])
+
+def commit_schema():
+  pa = _arrow()
+  return pa.schema([
+    ("login", pa.dictionary(pa.int32(), pa.string())),
+    ("avatar_url", pa.string()),
+    ("type", pa.dictionary(pa.int32(), pa.string())),
+    ("date", pa.timestamp("ms")),
+    ("isFork", pa.bool_()),
+  ])
+
+SCHEMAS = {"repo_stats": repo_schema, "commit_stats": commit_schema}
+
+# Datasets are stamped with the run that wrote them like every other artifact, so a manifest's
+# checksums stay valid for files a later run reuses or writes anew. Without a run ID this is the
+# path of output directories from before run manifests.
+def dataset_path(outputPath, orgName, kind, fmt, runId=None):
+  stem = f"{outputPath}{orgName}_{kind}" + (f"_{runId}" if runId else "")
+  if fmt == "parquet":
+    return stem
+  return f"{stem}.arrow"
+
+def to_table(df, kind):
+  pa = _arrow()
+  schema = SCHEMAS[kind]()
+  df = df.copy()
+  for field in schema:
+    if pa.types.is_integer(field.type):
+      df[field.name] = df[field.name].astype("Int64")
+  return pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+
+# Writes a stats frame as a dataset of the run. Parquet goes to a hive-partitioned dataset
+# directory (commits optionally partitioned by month); feather to a single uncompressed Arrow IPC
+# file so readers can memory-map it.
+def write_dataset(df, kind, outputPath, orgName, fmt, partitionByDate=False, runId=None):
+  pa = _arrow()
+  table = to_table(df, kind)
+  path = dataset_path(outputPath, orgName, kind, fmt, runId)
+
+  if fmt == "parquet":
+    import pyarrow.parquet as pq
+    if os.path.isdir(path):
+      shutil.rmtree(path)
+    partitionCols = None
+    if partitionByDate and kind == "commit_stats":
+      table = table.append_column("month", pa.array(df["date"].dt.strftime("%Y-%m").to_numpy(), pa.string()))
+      partitionCols = ["month"]
+    pq.write_to_dataset(table, root_path=path, partition_cols=partitionCols)
+  elif fmt == "feather":
+    import pyarrow.feather as feather
+    feather.write_feather(table, path, compression="uncompressed")
+  else:
+    raise Exception(f"Unknown dataset format: {fmt}")
+
+  logger.info(f"Wrote {table.num_rows} rows to {path}")
+  return path
+
+# Reads only the requested columns (and, for partitioned parquet, only the matching partitions)
+# of a dataset written by write_dataset. Arrow files are memory-mapped rather than loaded.
+def read_dataset(path, columns=None, filter=None):
+  pa = _arrow()
+  if os.path.isdir(path):
+    import pyarrow.dataset as ds
+    table = ds.dataset(path, format="parquet", partitioning="hive").to_table(columns=columns, filter=filter)
+  else:
+    with pa.memory_map(path, "r") as source:
+      table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+      table = table.select(columns)
+  return table.to_pandas()
+
+# Yields the rows of a dataset written by write_dataset as dicts, one record batch at a time, so
+# a consumer streaming them out never holds more than batchSize rows in Python objects.
+def iter_dataset(path, columns=None, batchSize=1024):
+  pa = _arrow()
+  if os.path.isdir(path):
+    import pyarrow.dataset as ds
+    batches = ds.dataset(path, format="parquet", partitioning="hive").to_batches(columns=columns, batch_size=batchSize)
+    for batch in batches:
+      yield from batch.to_pylist()
+    return
+  with pa.memory_map(path, "r") as source:
+    reader = pa.ipc.open_file(source)
+    for i in range(reader.num_record_batches):
+      batch = reader.get_batch(i)
+      if columns is not None:
+        batch = batch.select(columns)
+      for offset in range(0, batch.num_rows, batchSize):
+        yield from batch.slice(offset, batchSize).to_pylist()
+
+# The schema of a kind with its dictionary columns as plain values, which batches with independent
+# dictionaries (one per page) can share.
+def plain_schema(kind):
+  pa = _arrow()
+  return pa.schema([(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type) for f in SCHEMAS[kind]()])
+
+# An IPC file can only take one dictionary per column, extended by deltas, so batches in
+# plain_schema are encoded against a dictionary per column that grows as new values come along.
+class GrowingDictionaries:
+  def __init__(self, schema):
+    self.SCHEMA = schema
+    self._values = {f.name: {} for f in schema if _arrow().types.is_dictionary(f.type)}
+
+  def encode(self, batch):
+    pa = _arrow()
+    arrays = []
+    for field in self.SCHEMA:
+      column = batch.column(field.name)
+      if field.name in self._values:
+        seen = self._values[field.name]
+        indices = pa.array([None if v is None else seen.setdefault(v, len(seen)) for v in column.to_pylist()], field.type.index_type)
+        column = pa.DictionaryArray.from_arrays(indices, pa.array(list(seen), field.type.value_type))
+      arrays.append(column)
+    return pa.record_batch(arrays, schema=self.SCHEMA)
+
+# Streaming counterpart of write_dataset for batches in plain_schema(kind): each batch is written
+# as it comes, so the dataset is never held in memory as a whole. Returns the path and row count.
+def write_batches(batches, kind, outputPath, orgName, fmt, partitionByDate=False, runId=None):
+  pa = _arrow()
+  schema = SCHEMAS[kind]()
+  path = dataset_path(outputPath, orgName, kind, fmt, runId)
+  rows = 0
+
+  if fmt == "parquet":
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    if os.path.isdir(path):
+      shutil.rmtree(path)
+    partitioned = partitionByDate and kind == "commit_stats"
+    if partitioned:
+      schema = schema.append(pa.field("month", pa.string()))
+
+    def typed():
+      nonlocal rows
+      for batch in batches:
+        rows += batch.num_rows
+        arrays = [batch.column(f.name).cast(f.type) for f in SCHEMAS[kind]()]
+        if partitioned:
+          arrays.append(pc.strftime(batch.column("date"), "%Y-%m"))
+        yield pa.record_batch(arrays, schema=schema)
+
+    ds.write_dataset(typed(), path, schema=schema, format="parquet", partitioning=["month"] if partitioned else None, partitioning_flavor="hive" if partitioned else None)
+  elif fmt == "feather":
+    dictionaries = GrowingDictionaries(schema)
+    with pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)) as writer:
+      for batch in batches:
+        rows += batch.num_rows
+        writer.write_batch(dictionaries.encode(batch))
+  else:
+    raise Exception(f"Unknown dataset format: {fmt}")
+
+  logger.info(f"Wrote {rows} rows to {path}")
+  return path, rows
+
+# Commit rows of a streaming run spilled to disk as they are fetched, one Arrow IPC file per repo
+# in plain_schema. A repo's file is written under a temporary name and renamed once the repo is
+# complete, so a resumed run only ever finds whole repos. A view reads the files of the given repos
+# in that order (all of them by default) one memory-mapped batch at a time, optionally without the
+# bot commits and commits of forks that repo_info drops when IGNORE_FORKS is set.
+class CommitSpill:
+  def __init__(self, directory, repos=None, excludeBots=False, excludeForks=False):
+    self.DIRECTORY = directory
+    self.REPOS = repos
+    self.EXCLUDE_BOTS = excludeBots
+    self.EXCLUDE_FORKS = excludeForks
+    os.makedirs(directory, exist_ok=True)
+
+  def view(self, repos=None, excludeBots=None, excludeForks=None):
+    return CommitSpill(
+      self.DIRECTORY,
+      repos if repos is not None else self.REPOS,
+      self.EXCLUDE_BOTS if excludeBots is None else excludeBots,
+      self.EXCLUDE_FORKS if excludeForks is None else excludeForks,
+    )
+
+  def path(self, repo):
+    return os.path.join(self.DIRECTORY, f"{quote(repo, safe='')}.arrow")
+
+  def has(self, repo):
+    return os.path.exists(self.path(repo))
+
+  def writer(self, repo):
+    return SpillWriter(self.path(repo))
+
+  def paths(self):
+    if self.REPOS is None:
+      return sorted(os.path.join(self.DIRECTORY, f) for f in os.listdir(self.DIRECTORY) if f.endswith(".arrow"))
+    return [p for p in map(self.path, self.REPOS) if os.path.exists(p)]
+
+  def batches(self, columns=None):
+    pa = _arrow()
+    import pyarrow.compute as pc
+    for path in self.paths():
+      with pa.memory_map(path, "r") as source:
+        reader = pa.ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+          batch = reader.get_batch(i)
+          if self.EXCLUDE_BOTS:
+            batch = batch.filter(pc.fill_null(pc.not_equal(batch.column("type"), "Bot"), True))
+          if self.EXCLUDE_FORKS:
+            batch = batch.filter(pc.invert(batch.column("isFork")))
+          if columns is not None:
+            batch = batch.select(columns)
+          if batch.num_rows:
+            yield batch
+
+  def __len__(self):
+    return sum(batch.num_rows for batch in self.batches(["isFork"]))
+
+  @property
+  def empty(self):
+    return next(self.batches(["isFork"]), None) is None
+
+  def clear(self):
+    shutil.rmtree(self.DIRECTORY, ignore_errors=True)
+    os.makedirs(self.DIRECTORY, exist_ok=True)
+
+# Appends pages of commit rows (frames as built by commit_frame) to one repo's spill file.
+class SpillWriter:
+  def __init__(self, path):
+    self.PATH = path
+    self.rows = 0
+    self._writer = None
+
+  def append(self, df):
+    pa = _arrow()
+    table = to_table(df, "commit_stats").cast(plain_schema("commit_stats"))
+    if self._writer is None:
+      self._writer = pa.ipc.new_file(self.PATH + ".tmp", table.schema)
+    self._writer.write_table(table)
+    self.rows += table.num_rows
+
+  def close(self):
+    if self._writer is None:
+      self._writer = _arrow().ipc.new_file(self.PATH + ".tmp", plain_schema("commit_stats"))
+    self._writer.close()
+    os.replace(self.PATH + ".tmp", self.PATH)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, excType, exc, tb):
+    if excType is None:
+      self.close()
+      return
+    if self._writer is not None:
+      self._writer.close()
+    if os.path.exists(self.PATH + ".tmp"):
+      os.remove(self.PATH + ".tmp")
@@ -1,54 +1,32 @@
 import os
-import markdown
+import re
+import io
+import html
 import json
-import pandas as pd
+import base64
+import shutil
 import argparse
+import mimetypes
+from datetime import datetime
+from urllib.parse import quote
+import markdown
+from columnar import iter_dataset
 
-def markdown_to_html(content):
-    processed_content = content.replace('\n', '  \n')
-    return markdown.markdown(processed_content)
-
-def json_to_html_table(json_data):
-    data = json.loads(json_data)
-
-    if isinstance(data, dict):
-        data = [data]
-
-    df = pd.DataFrame(data)
-    df['AICommitSummary'] = df['AICommitSummary'].str.replace('\n', '<br/>')
-
-
-    html_table = df.to_html(index=False, escape=False)
-    
-    return '<div class="table-container">' + html_table + '</div>'
-
-def process_directory(directory):
-    sections = {
-        'markdown': [],
-        'images': [],
-        'html': [],
-        'json': []
-    }
-    
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        
-        if filename.endswith('.md'):
-            with open(filepath, 'r') as f:
-                sections['markdown'].append(markdown_to_html(f.read()))
-        elif filename.endswith(('.jpg', '.png', '.gif')):
-            sections['images'].append(f'<img src="{filepath}" alt="{filename}" width="800">')
-        elif filename.endswith('.html'):
-            with open(filepath, 'r') as f:
-                sections['html'].append(f.read())
-        elif filename.endswith('.json'):
-            if "commit_stats" in filename:
-                continue
-
-            with open(filepath, 'r') as f:
-                sections['json'].append(json_to_html_table(f.read()))
+REPO_TABLE_COLUMNS = ['name', 'description', 'updated_at', 'created_at', 'size', 'stars', 'watchers', 'language', 'issues', 'license', 'isFork', 'forkOf', 'AICommitSummary']
+# in order of preference when a chart was written in several formats
+IMAGE_EXTENSIONS = ('.png', '.svg', '.webp', '.jpg', '.gif')
+# org_analysis suffixes the files it writes with the time they were written
+STAMP = re.compile(r'_(\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2})$')
+PAGE_SIZE = 50
+SECTION_TITLES = {
+    'markdown': '🤖 AI summary',
+    'images': '📈 Charts',
+    'html': '🧑‍🤝‍🧑 Public organization members',
+    'tables': '🗂️ Tables',
+    'metrics': '⏱️ Run metrics',
+}
 
-    css_styles = """
+css_styles = """
 <style>
     table {
     border-collapse: separate;
@@ -102,50 +80,296 @@ def process_directory(directory):
       min-width: 100%;
       width: 1600px;
     }
+
+    .pager {
+      display: flex;
+      gap: 12px;
+      align-items: center;
+      justify-content: center;
+      margin-top: 10px;
+    }
 </style>
 """
-    
-    combined_html = f'''
+
+# Tables are written as one <tbody> per page with all but the first hidden; this flips between them.
+pager_script = """
+<script>
+document.querySelectorAll('table.paged').forEach(function (table) {
+    var pages = table.tBodies;
+    if (pages.length < 2) return;
+    var current = 0;
+    var nav = document.createElement('div');
+    var prev = document.createElement('button');
+    var next = document.createElement('button');
+    var label = document.createElement('span');
+    nav.className = 'pager';
+    prev.textContent = '‹ Previous';
+    next.textContent = 'Next ›';
+    function show(page) {
+        pages[current].hidden = true;
+        current = page;
+        pages[current].hidden = false;
+        label.textContent = 'Page ' + (current + 1) + ' of ' + pages.length;
+        prev.disabled = current === 0;
+        next.disabled = current === pages.length - 1;
+    }
+    prev.onclick = function () { show(current - 1); };
+    next.onclick = function () { show(current + 1); };
+    nav.append(prev, label, next);
+    table.parentNode.after(nav);
+    show(0);
+});
+</script>
+"""
+
+def markdown_to_html(content):
+    processed_content = content.replace('\n', '  \n')
+    return markdown.markdown(processed_content)
+
+# The report section a file of an org's output directory belongs to, or None for files the report
+# doesn't show (commit stats, forked repo lists, caches, state).
+def artifact_section(filename, isDir=False):
+    if isDir or filename.endswith('.arrow'):
+        return 'tables' if 'repo_stats' in filename else None
+    if filename.endswith('.md'):
+        return 'markdown'
+    if filename.endswith(IMAGE_EXTENSIONS):
+        return 'images'
+    if filename.endswith('.html'):
+        return 'html'
+    if filename.endswith('.json'):
+        if 'run_metrics' in filename:
+            return 'metrics'
+        if 'commit_stats' in filename or filename.endswith('_manifest.json'):
+            return None
+        return 'tables'
+    return None
+
+# The artifacts of the latest run in an org's output directory: of every kind of file (its name
+# without timestamp and extension) only the newest is kept, so the leftovers of earlier runs
+# aren't rendered again. Only directory entries are looked at, no file is opened.
+def build_manifest(directory, org=None):
+    latest = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            isDir = entry.is_dir()
+            section = artifact_section(entry.name, isDir)
+            if section is None:
+                continue
+            kind, ext = (entry.name, '') if isDir else os.path.splitext(entry.name)
+            match = STAMP.search(kind)
+            if match:
+                kind, writtenAt = kind[:match.start()], match.group(1)
+            else:
+                # the columnar datasets are overwritten in place rather than stamped
+                writtenAt = datetime.fromtimestamp(entry.stat().st_mtime).isoformat(timespec='seconds').replace(':', '-')
+            if section == 'images':
+                preference = len(IMAGE_EXTENSIONS) - IMAGE_EXTENSIONS.index(ext)
+            else:
+                preference = 0 if ext == '.json' else 1
+            rank = (writtenAt, preference)
+            if (section, kind) not in latest or rank > latest[(section, kind)][0]:
+                latest[(section, kind)] = (rank, {'section': section, 'kind': kind, 'path': entry.name, 'written_at': writtenAt})
+
+    sectionOrder = list(SECTION_TITLES)
+    artifacts = [artifact for _, artifact in latest.values()]
+    artifacts.sort(key=lambda a: (sectionOrder.index(a['section']), a['kind']))
+    return {'org': org or os.path.basename(os.path.normpath(directory)), 'artifacts': artifacts}
+
+# The report's view of a run manifest written by org_analysis (see run_manifest.py): the preferred
+# file of every artifact kind, looked up by kind instead of listing the directory.
+def from_run_manifest(runManifest, directory):
+    def rank(path):
+        ext = os.path.splitext(path)[1]
+        if ext in IMAGE_EXTENSIONS:
+            return IMAGE_EXTENSIONS.index(ext)
+        # the columnar datasets can be streamed in batches
+        return 1 if ext == '.json' else 0
+
+    artifacts = []
+    for kind, entry in runManifest['artifacts'].items():
+        if not entry['paths']:
+            continue
+        path = min(entry['paths'], key=rank)
+        section = artifact_section(os.path.basename(path), os.path.isdir(os.path.join(directory, path)))
+        if section is not None:
+            artifacts.append({'section': section, 'kind': kind, 'path': path, 'written_at': entry.get('run_id')})
+    sectionOrder = list(SECTION_TITLES)
+    artifacts.sort(key=lambda a: (sectionOrder.index(a['section']), a['kind']))
+    return {'org': runManifest.get('org'), 'artifacts': artifacts}
+
+# Reads a manifest listing artifacts by their path relative to the org's output directory, either
+# a run manifest or one in the shape build_manifest returns.
+def load_manifest(path, directory):
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    if isinstance(manifest.get('artifacts'), dict):
+        return from_run_manifest(manifest, directory)
+    return manifest
+
+# The latest run manifest of the org in the directory, if org_analysis wrote one.
+def find_run_manifest(directory, org=None):
+    if org:
+        path = os.path.join(directory, f'{org}_manifest.json')
+        return path if os.path.exists(path) else None
+    with os.scandir(directory) as entries:
+        return next((entry.path for entry in entries if entry.name.endswith('_manifest.json')), None)
+
+def format_cell(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    return html.escape(str(value)).replace('\n', '<br/>')
+
+# Writes rows (dicts) as a table one row at a time. With a page size every pageSize rows start a
+# new, hidden <tbody> that the pager script shows on demand, so browsers only lay out one page.
+def write_table(out, columns, rows, pageSize=None):
+    out.write('<div class="table-container"><table class="dataframe' + (' paged' if pageSize else '') + '">')
+    out.write('<thead><tr>' + ''.join(f'<th>{html.escape(str(c))}</th>' for c in columns) + '</tr></thead><tbody>')
+    for i, row in enumerate(rows):
+        if pageSize and i and i % pageSize == 0:
+            out.write('</tbody><tbody hidden>')
+        out.write('<tr>' + ''.join(f'<td>{format_cell(row.get(c))}</td>' for c in columns) + '</tr>')
+    out.write('</tbody></table></div>')
+
+def write_stats_table(out, path, pageSize=PAGE_SIZE):
+    if os.path.isdir(path) or path.endswith('.arrow'):
+        write_table(out, REPO_TABLE_COLUMNS, iter_dataset(path, columns=REPO_TABLE_COLUMNS), pageSize)
+        return
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = [data]
+    write_table(out, list(data[0]) if data else [], data, pageSize)
+
+def write_metrics(out, metrics):
+    rows = []
+    for org, stages in metrics.get('stages', {}).items():
+        for name, stage in stages.items():
+            rows.append({'org': org, 'stage': name, 'seconds': stage['seconds'], 'count': stage['count']})
+    write_table(out, ['org', 'stage', 'seconds', 'count'], rows)
+
+    http = metrics.get('http', {})
+    cache = metrics.get('cache', {})
+    llm = metrics.get('llm', {})
+    rate = metrics.get('rate_limit', {})
+    summary = [
+        ('Elapsed', f"{metrics.get('elapsed_s')}s (startup {metrics.get('startup_s', '-')}s)"),
+        ('HTTP requests', f"{http.get('requests')} ({http.get('retries')} retries, {http.get('bytes', 0) / 1e6:.2f} MB, p50 {http.get('latency', {}).get('p50_s')}s, p95 {http.get('latency', {}).get('p95_s')}s)"),
+        ('HTTP statuses', ', '.join(f"{k}: {v}" for k, v in http.get('statuses', {}).items())),
+        ('Rate-limit pacing', f"{http.get('paced_s')}s"),
+        ('Response cache', ', '.join(f"{k}: {v}" for k, v in cache.items())),
+        ('Rate limit remaining', ', '.join(f"{k}: {v.get('remaining')} (lowest {v.get('min_remaining')})" for k, v in rate['resources'].items()) if rate.get('resources') else f"{rate.get('remaining')} (lowest {rate.get('min_remaining')})"),
+        ('LLM calls', f"{llm.get('calls')} ({llm.get('cache_hits')} cache hits, {llm.get('batches')} batches, p50 {llm.get('latency', {}).get('p50_s')}s)"),
+        ('LLM tokens', f"{llm.get('input_tokens')} in / {llm.get('output_tokens')} out"),
+    ]
+    write_table(out, ['metric', 'value'], [{'metric': m, 'value': v} for m, v in summary])
+
+# Shrinks a raster chart to the width it is shown at. None when it is already small enough or
+# Pillow (a matplotlib dependency) isn't installed.
+def downscale_image(path, maxWidth):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    with Image.open(path) as image:
+        fmt = image.format
+        if image.width <= maxWidth or fmt not in Image.MIME:
+            return None
+        image.thumbnail((maxWidth, image.height))
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, optimize=True)
+    return buffer.getvalue(), Image.MIME[fmt]
+
+# The src of a chart: a path relative to the report, or with inline a data URI so the report is a
+# single portable file.
+def image_src(path, reportDir, inline=False, maxWidth=800):
+    if not inline:
+        return quote(os.path.relpath(path, reportDir).replace(os.sep, '/'))
+    scaled = None if path.endswith('.svg') else downscale_image(path, maxWidth)
+    if scaled is None:
+        with open(path, 'rb') as f:
+            scaled = f.read(), mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    data, mime = scaled
+    return f'data:{mime};base64,' + base64.b64encode(data).decode('ascii')
+
+# Streams the report for the artifacts of a manifest to out. Sections are written as they are
+# read, so at most one table page batch or image is held in memory at a time.
+def write_report(out, manifest, directory, reportDir=None, inlineImages=False, imageWidth=800, pageSize=PAGE_SIZE):
+    org = html.escape(manifest['org'])
+    reportDir = reportDir or directory
+    bySection = {}
+    for artifact in manifest['artifacts']:
+        bySection.setdefault(artifact['section'], []).append(artifact)
+
+    out.write(f'''
 <html>
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>"celestiaorg" analytics</title>
+    <title>"{org}" analytics</title>
     {css_styles}
 </head>
-<body style="background-color: #fffaf0;font-family: Quicksand, sans-serif;"><div style="max-width: 1000px; margin: 0 auto; padding: 80px 20px;">'''
+<body style="background-color: #fffaf0;font-family: Quicksand, sans-serif;"><div style="max-width: 1000px; margin: 0 auto; padding: 80px 20px;">''')
+    out.write(f'<h1 style="text-align: center;">"{org}" Github Analytics</h1>')
 
-    combined_html += '<h1 style="text-align: center;">"celestiaorg" Github Analytics</h1>'
-    for section, content in sections.items():
-        if content:
+    for section, title in SECTION_TITLES.items():
+        artifacts = bySection.get(section)
+        if not artifacts:
+            continue
+        out.write(f'<h2 style="margin-top: 40px">{title}</h2>')
+        for artifact in artifacts:
+            path = os.path.join(directory, artifact['path'])
             if section == 'markdown':
-                combined_html += f'<h2 style="margin-top: 40px">🤖 AI summary</h2>'
+                with open(path, 'r') as f:
+                    out.write(markdown_to_html(f.read()))
             elif section == 'images':
-                combined_html += f'<h2 style="margin-top: 40px">📈 Charts</h2>'
+                out.write(f'<img src="{image_src(path, reportDir, inlineImages, imageWidth)}" alt="{html.escape(os.path.basename(path))}" width="{imageWidth}">')
             elif section == 'html':
-                combined_html += f'<h2 style="margin-top: 40px">🧑‍🤝‍🧑 Public organization members</h2>'
-            elif section == 'json':
-                combined_html += f'<h2 style="margin-top: 40px">🗂️ Tables</h2>'
+                with open(path, 'r') as f:
+                    shutil.copyfileobj(f, out)
+            elif section == 'tables':
+                write_stats_table(out, path, pageSize)
+            elif section == 'metrics':
+                with open(path, 'r') as f:
+                    write_metrics(out, json.load(f))
+
+    out.write(pager_script)
+    out.write('</div></body></html>')
 
-            combined_html += ''.join(content)
-    combined_html += '</div></body></html>'
-    
-    return combined_html
+# Writes the report of an org's output directory to outputPath. Without a manifest the latest run
+# manifest is used, or for directories without one the newest artifact of every kind.
+def generate_report(directory, outputPath, manifest=None, org=None, inlineImages=False, imageWidth=800, pageSize=PAGE_SIZE):
+    if manifest is None:
+        runManifest = find_run_manifest(directory, org)
+        manifest = load_manifest(runManifest, directory) if runManifest else build_manifest(directory, org)
+    manifest = dict(manifest, org=org or manifest.get('org') or os.path.basename(os.path.normpath(directory)))
+    with open(outputPath, 'w') as f:
+        write_report(f, manifest, directory, os.path.dirname(os.path.abspath(outputPath)), inlineImages, imageWidth, pageSize)
+    return outputPath
+
+def process_directory(directory):
+    runManifest = find_run_manifest(directory)
+    out = io.StringIO()
+    write_report(out, load_manifest(runManifest, directory) if runManifest else build_manifest(directory), directory)
+    return out.getvalue()
 
 
 def main():
     parser = argparse.ArgumentParser(description="Generate a report from a specified directory.")
     parser.add_argument("directory", help="Path to the directory to process")
     parser.add_argument("-o", "--output", default="output.html", help="Output file name (default: output.html)")
+    parser.add_argument("--org", default=None, help="Organization shown in the title (default: the directory name)")
+    parser.add_argument("--manifest", default=None, help="Manifest listing the artifacts to include (default: the latest run manifest, or the newest artifact of every kind in the directory)")
+    parser.add_argument("--inline-images", action="store_true", help="Embed the charts as downscaled data URIs so the report is a single portable file")
+    parser.add_argument("--image-width", type=int, default=800, help="Width charts are shown (and inlined) at")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Table rows per page")
 
     args = parser.parse_args()
 
-    result = process_directory(args.directory)
-
-    with open(args.output, 'w') as f:
-        f.write(result)
+    manifest = load_manifest(args.manifest, args.directory) if args.manifest else None
+    generate_report(args.directory, args.output, manifest, args.org, args.inline_images, args.image_width, args.page_size)
 
     print(f"Report generated and saved to {args.output}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,219 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+GRAPHQL_URL = "https://api.github.com/graphql"
+
+# history() connections are capped at 100 nodes per page
+MAX_HISTORY_PAGE = 100
+
+COMMIT_FIELDS = """
+  oid
+  message
+  committedDate
+  author { name user { login avatarUrl } }
+  committer { user { avatarUrl } }
+"""
+
+ORG_REPOS_QUERY = """
+query($org: String!, $first: Int!, $after: String, $commits: Int!, $isFork: Boolean, $withHistory: Boolean!) {
+  rateLimit { cost remaining resetAt }
+  organization(login: $org) {
+    repositories(first: $first, after: $after, isFork: $isFork, orderBy: {field: CREATED_AT, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        name
+        description
+        createdAt
+        updatedAt
+        pushedAt
+        diskUsage
+        stargazerCount
+        primaryLanguage { name }
+        issues(states: OPEN) { totalCount }
+        pullRequests(states: OPEN) { totalCount }
+        licenseInfo { name }
+        isFork
+        parent { nameWithOwner }
+        defaultBranchRef @include(if: $withHistory) {
+          target {
+            ... on Commit {
+              history(first: $commits) {
+                pageInfo { hasNextPage endCursor }
+                nodes { %s }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+""" % COMMIT_FIELDS
+
+REPO_HISTORY_QUERY = """
+query($org: String!, $name: String!, $first: Int!, $after: String) {
+  rateLimit { cost remaining resetAt }
+  repository(owner: $org, name: $name) {
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          history(first: $first, after: $after) {
+            pageInfo { hasNextPage endCursor }
+            nodes { %s }
+          }
+        }
+      }
+    }
+  }
+}
+""" % COMMIT_FIELDS
+
+def rest_commit(node):
+  author = node.get('author') or {}
+  user = author.get('user')
+  committer = (node.get('committer') or {}).get('user')
+  name = author.get('name')
+
+  if user:
+    restAuthor = {'login': user.get('login'), 'avatar_url': user.get('avatarUrl'), 'type': 'User'}
+  elif name and name.endswith('[bot]'):
+    # bots are not Users in GraphQL, REST reports them as author objects of type Bot
+    restAuthor = {'login': name, 'avatar_url': None, 'type': 'Bot'}
+  else:
+    restAuthor = None
+
+  return {
+    'sha': node.get('oid'),
+    'author': restAuthor,
+    'committer': {'avatar_url': committer.get('avatarUrl'), 'type': 'User'} if committer else None,
+    'commit': {
+      'author': {'name': name},
+      'committer': {'date': node.get('committedDate')},
+      'message': node.get('message'),
+    },
+  }
+
+def history_of(node):
+  ref = node.get('defaultBranchRef') or {}
+  target = ref.get('target') or {}
+  return target.get('history')
+
+# Reshapes a GraphQL repository node into the REST listing payload aggRepo consumes, with the fork
+# parent and commit history already attached under "_forkOf" / "_commits".
+def rest_repo(node, commits):
+  parent = node.get('parent')
+  return {
+    'name': node.get('name'),
+    'description': node.get('description'),
+    'created_at': node.get('createdAt'),
+    'updated_at': node.get('updatedAt'),
+    'pushed_at': node.get('pushedAt'),
+    'size': node.get('diskUsage'),
+    'stargazers_count': node.get('stargazerCount'),
+    # REST's watchers_count is the legacy name of the star count, not the subscriber count
+    'watchers_count': node.get('stargazerCount'),
+    'language': (node.get('primaryLanguage') or {}).get('name'),
+    'open_issues_count': node.get('issues').get('totalCount') + node.get('pullRequests').get('totalCount'),
+    'license': {'name': node.get('licenseInfo').get('name')} if node.get('licenseInfo') else None,
+    'fork': node.get('isFork'),
+    '_forkOf': parent.get('nameWithOwner') if parent else None,
+    '_commits': commits,
+  }
+
+# Pulls repository metadata, fork parents, licenses and the last N commits for many repos per
+# query. The batch size adapts to the reported query cost: it shrinks when a query is expensive
+# or fails and grows back while queries stay cheap. When forks are ignored they are listed
+# separately without their history, which the analysis wouldn't read.
+class GraphQLSource:
+  def __init__(self, transport, batchSize=10, minBatch=1, maxBatch=50, targetCost=20):
+    self.transport = transport
+    self.BATCH_SIZE = batchSize
+    self.MIN_BATCH = minBatch
+    self.MAX_BATCH = maxBatch
+    self.TARGET_COST = targetCost
+    self.requests = 0
+
+  def query(self, query, variables):
+    self.requests += 1
+    response = self.transport.post(GRAPHQL_URL, json={"query": query, "variables": variables})
+    if response is None or response.status_code != 200:
+      logger.info(f"GraphQL query failed: {response.status_code if response is not None else 'no response'}")
+      return None
+
+    payload = response.json()
+    if payload.get('errors'):
+      logger.info(f"GraphQL errors: {payload['errors']}")
+    data = payload.get('data')
+    if data and data.get('rateLimit'):
+      logger.info(f"GraphQL cost {data['rateLimit']['cost']}, remaining {data['rateLimit']['remaining']}")
+    return data
+
+  def _adapt(self, data):
+    if data is None:
+      self.BATCH_SIZE = max(self.MIN_BATCH, self.BATCH_SIZE // 2)
+      return
+    cost = data.get('rateLimit', {}).get('cost', 1)
+    if cost > self.TARGET_COST:
+      self.BATCH_SIZE = max(self.MIN_BATCH, self.BATCH_SIZE // 2)
+    elif cost * 2 <= self.TARGET_COST:
+      self.BATCH_SIZE = min(self.MAX_BATCH, self.BATCH_SIZE * 2)
+
+  def fetch_history(self, orgName, name, cursor, needed):
+    commits = []
+    while cursor and needed > 0:
+      data = self.query(REPO_HISTORY_QUERY, {"org": orgName, "name": name, "first": min(MAX_HISTORY_PAGE, needed), "after": cursor})
+      history = history_of((data or {}).get('repository') or {})
+      if not history:
+        break
+      nodes = history.get('nodes') or []
+      commits += [rest_commit(n) for n in nodes]
+      needed -= len(nodes)
+      cursor = history['pageInfo']['endCursor'] if history['pageInfo']['hasNextPage'] else None
+    return commits
+
+  def fetch_org_repos(self, orgName, numCommits, maxRepos=None, ignoreForks=False):
+    if not ignoreForks:
+      repos = self.list_repos(orgName, numCommits, maxRepos)
+    else:
+      repos = self.list_repos(orgName, numCommits, maxRepos, isFork=False) + self.list_repos(orgName, numCommits, maxRepos, isFork=True, withHistory=False)
+      # back in the listing's newest-first order
+      repos.sort(key=lambda r: r.get('created_at') or "", reverse=True)
+      repos = repos[:maxRepos]
+    logger.info(f"Fetched {len(repos)} repos for {orgName} in {self.requests} GraphQL queries")
+    return repos
+
+  # The org's repos (only forks or only non-forks when isFork is set), with their last numCommits
+  # commits unless withHistory is False.
+  def list_repos(self, orgName, numCommits, maxRepos=None, isFork=None, withHistory=True):
+    repos = []
+    cursor = None
+    firstCommits = min(MAX_HISTORY_PAGE, numCommits)
+    failures = 0
+
+    while maxRepos is None or len(repos) < maxRepos:
+      batch = self.BATCH_SIZE if maxRepos is None else min(self.BATCH_SIZE, maxRepos - len(repos))
+      data = self.query(ORG_REPOS_QUERY, {"org": orgName, "first": batch, "after": cursor, "commits": firstCommits, "isFork": isFork, "withHistory": withHistory})
+      self._adapt(data)
+      if data is None or data.get('organization') is None:
+        failures += 1
+        if failures > 3 or (data is not None and batch <= self.MIN_BATCH):
+          logger.info(f"Giving up on GraphQL repository listing for {orgName}")
+          break
+        continue
+      failures = 0
+
+      connection = data['organization']['repositories']
+      for node in connection.get('nodes') or []:
+        history = history_of(node)
+        commits = []
+        if history:
+          commits = [rest_commit(n) for n in history.get('nodes') or []]
+          if history['pageInfo']['hasNextPage'] and len(commits) < numCommits:
+            commits += self.fetch_history(orgName, node.get('name'), history['pageInfo']['endCursor'], numCommits - len(commits))
+        repos.append(rest_repo(node, commits[:numCommits]))
+
+      if not connection['pageInfo']['hasNextPage']:
+        break
+      cursor = connection['pageInfo']['endCursor']
+    return repos
@@ -0,0 +1,110 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+CACHED_HEADERS = ("ETag", "Last-Modified", "Link", "Content-Type")
+
+# Persistent GitHub response cache keyed by URL. Bodies are stored zlib-compressed together with
+# the validators needed for conditional requests (ETag / Last-Modified) and the Link header so
+# paginated listings can be replayed from disk.
+class ResponseCache:
+  def __init__(self, path, ttl=0, maxAge=30 * 24 * 3600, maxEntries=None):
+    self.PATH = path
+    self.TTL = ttl
+    self.MAX_AGE = maxAge
+    self.MAX_ENTRIES = maxEntries
+    self.hits = 0
+    self.misses = 0
+    self.revalidated = 0
+
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+      url TEXT PRIMARY KEY,
+      etag TEXT,
+      last_modified TEXT,
+      headers TEXT,
+      body BLOB,
+      fetched_at REAL,
+      accessed_at REAL
+    )""")
+    self._conn.commit()
+    self.evict()
+
+  def get(self, url):
+    with self._lock:
+      row = self._conn.execute("SELECT etag, last_modified, headers, body, fetched_at FROM responses WHERE url = ?", (url,)).fetchone()
+    if row is None:
+      return None
+    return {"etag": row[0], "last_modified": row[1], "headers": json.loads(row[2]), "body": row[3], "fetched_at": row[4]}
+
+  def is_fresh(self, entry, ttl=None):
+    ttl = self.TTL if ttl is None else ttl
+    return ttl > 0 and time.time() - entry["fetched_at"] < ttl
+
+  def conditional_headers(self, entry):
+    headers = {}
+    if entry.get("etag"):
+      headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+      headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+  def put(self, url, response):
+    headers = {k: response.headers[k] for k in CACHED_HEADERS if k in response.headers}
+    now = time.time()
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (url, headers.get("ETag"), headers.get("Last-Modified"), json.dumps(headers), zlib.compress(response.content), now, now)
+      )
+      self._conn.commit()
+
+  def touch(self, url, refreshed=False):
+    now = time.time()
+    with self._lock:
+      if refreshed:
+        self._conn.execute("UPDATE responses SET accessed_at = ?, fetched_at = ? WHERE url = ?", (now, now, url))
+      else:
+        self._conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url))
+      self._conn.commit()
+
+  # Counts an outcome ("hits", "misses" or "revalidated") of a lookup; the transport decides which
+  # from several threads at once.
+  def count(self, outcome):
+    with self._lock:
+      setattr(self, outcome, getattr(self, outcome) + 1)
+
+  def to_response(self, url, entry):
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.encoding = "utf-8"
+    response.headers = CaseInsensitiveDict(entry["headers"])
+    response._content = zlib.decompress(entry["body"])
+    return response
+
+  def evict(self):
+    with self._lock:
+      if self.MAX_AGE:
+        self._conn.execute("DELETE FROM responses WHERE fetched_at < ?", (time.time() - self.MAX_AGE,))
+      if self.MAX_ENTRIES:
+        self._conn.execute(
+          "DELETE FROM responses WHERE url NOT IN (SELECT url FROM responses ORDER BY accessed_at DESC LIMIT ?)",
+          (self.MAX_ENTRIES,)
+        )
+      self._conn.commit()
+
+  def close(self):
+    self.evict()
+    with self._lock:
+      self._conn.close()
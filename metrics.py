@@ -0,0 +1,144 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+def percentile(values, pct):
+  if not values:
+    return None
+  ordered = sorted(values)
+  return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def latency_summary(values):
+  return {
+    "count": len(values),
+    "total_s": round(sum(values), 3),
+    "p50_s": round(percentile(values, 50), 3) if values else None,
+    "p95_s": round(percentile(values, 95), 3) if values else None,
+    "max_s": round(max(values), 3) if values else None,
+  }
+
+# The Meter the HTTP requests and LLM tokens recorded in the current context are also charged to.
+# An org's RepoScheduler sets its own while the org's repos are analyzed, and work handed to the
+# worker pools carries it along in a copied context, so the orgs of a batch each count only their
+# own traffic against their budgets.
+METER = contextvars.ContextVar("meter", default=None)
+
+class Meter:
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._totals = {"requests": 0, "llm_tokens": 0}
+
+  def add(self, requests=0, llmTokens=0):
+    with self._lock:
+      self._totals["requests"] += requests
+      self._totals["llm_tokens"] += llmTokens
+
+  def totals(self):
+    with self._lock:
+      return dict(self._totals)
+
+def charge(requests=0, llmTokens=0):
+  meter = METER.get()
+  if meter is not None:
+    meter.add(requests, llmTokens)
+
+# Counters and timers for one process. Stages are timed per org (stages of concurrently running
+# orgs overlap, so their wall times don't add up to the run time); HTTP and LLM figures are shared
+# by every org, like the transport and summarizer they come from.
+class RunMetrics:
+  def __init__(self):
+    self.STARTED = time.time()
+    self._lock = threading.Lock()
+    self._stages = {}
+    self._http = {"requests": 0, "retries": 0, "bytes": 0, "statuses": {}, "paced_s": 0.0}
+    self._httpLatencies = []
+    self._cache = {"hit": 0, "revalidated": 0, "miss": 0, "offline_miss": 0}
+    self._rateLimits = {}
+    self._llm = {"calls": 0, "cache_hits": 0, "input_tokens": 0, "output_tokens": 0, "batches": 0}
+    self._llmLatencies = []
+    self.extra = {}
+
+  @contextmanager
+  def stage(self, name, org=None):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.add_stage_time(name, time.perf_counter() - start, org)
+
+  def add_stage_time(self, name, seconds, org=None):
+    with self._lock:
+      stages = self._stages.setdefault(org or "", {})
+      entry = stages.setdefault(name, {"seconds": 0.0, "count": 0})
+      entry["seconds"] += seconds
+      entry["count"] += 1
+
+  def record_request(self, status, nbytes, seconds, retry=False):
+    with self._lock:
+      self._http["requests"] += 1
+      self._http["retries"] += 1 if retry else 0
+      self._http["bytes"] += nbytes
+      key = str(status)
+      self._http["statuses"][key] = self._http["statuses"].get(key, 0) + 1
+      self._httpLatencies.append(seconds)
+    charge(requests=1)
+
+  def record_pacing(self, seconds):
+    with self._lock:
+      self._http["paced_s"] += seconds
+
+  def record_cache(self, outcome):
+    with self._lock:
+      self._cache[outcome] += 1
+
+  def record_rate_limit(self, remaining, resource="core"):
+    with self._lock:
+      limit = self._rateLimits.setdefault(resource, {"remaining": None, "min_remaining": None})
+      limit["remaining"] = remaining
+      limit["min_remaining"] = remaining if limit["min_remaining"] is None else min(limit["min_remaining"], remaining)
+
+  def record_llm(self, inputTokens, outputTokens, seconds, batch=False):
+    with self._lock:
+      self._llm["calls"] += 1
+      self._llm["batches"] += 1 if batch else 0
+      self._llm["input_tokens"] += inputTokens or 0
+      self._llm["output_tokens"] += outputTokens or 0
+      self._llmLatencies.append(seconds)
+    # a batch mixes the prompts of several orgs; summarize_batch charges each prompt's own meter
+    if not batch:
+      charge(llmTokens=(inputTokens or 0) + (outputTokens or 0))
+
+  def record_llm_cache_hit(self):
+    with self._lock:
+      self._llm["cache_hits"] += 1
+
+  # Running HTTP request and LLM token totals, cheap enough to poll between repos.
+  def totals(self):
+    with self._lock:
+      return {"requests": self._http["requests"], "llm_tokens": self._llm["input_tokens"] + self._llm["output_tokens"]}
+
+  def snapshot(self, org=None):
+    with self._lock:
+      stages = self._stages if org is None else {org: self._stages.get(org, {})}
+      return {
+        "started_at": self.STARTED,
+        "elapsed_s": round(time.time() - self.STARTED, 3),
+        "stages": {o or "run": {name: {"seconds": round(v["seconds"], 3), "count": v["count"]} for name, v in s.items()} for o, s in stages.items()},
+        "http": dict(self._http, paced_s=round(self._http["paced_s"], 3), statuses=dict(self._http["statuses"]), latency=latency_summary(self._httpLatencies)),
+        "cache": dict(self._cache),
+        # the core REST budget, plus every resource seen
+        "rate_limit": dict(self._rateLimits.get("core", {"remaining": None, "min_remaining": None}), resources={k: dict(v) for k, v in self._rateLimits.items()}),
+        "llm": dict(self._llm, latency=latency_summary(self._llmLatencies)),
+        **self.extra,
+      }
+
+  def write(self, path, org=None):
+    with open(path, "w") as f:
+      json.dump(self.snapshot(org), f, indent=2)
+    logger.info(f"Run metrics written to {path}")
+    return path
@@ -1,34 +1,138 @@
-import requests
+import time
+IMPORT_STARTED = time.perf_counter()
+
 import json
-import matplotlib.pyplot as plt
 import math
 import argparse
-from config import loadConfig
-import pandas as pd
+import contextvars
+from config import loadConfig, CONFIG_PATH
 import logging
 import os
-from datetime import datetime
-import matplotlib.patheffects as path_effects
-from anthropic import Anthropic
-
-CONFIG = loadConfig()
-
-AI_client = Anthropic(
-    api_key=CONFIG["ANTHROPIC_API_KEY"]
-)
+import sys
+import threading
+from collections import deque
+from itertools import islice
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, Future
+from urllib.parse import urlparse, parse_qs, quote
+from transport import GitHubTransport
+from http_cache import ResponseCache
+from org_state import OrgState
+from rollups import OrgRollups
+from tokens import TokenBudget
+from graphql_source import GraphQLSource
+from batch_runner import run_batch, read_org_names
+from columnar import write_dataset, write_batches, read_dataset, dataset_path, CommitSpill, OUTPUT_FORMATS
+from charts import ChartRenderer, CHART_FORMATS
+from ai_summary import Summarizer, SummaryCache, SummaryPipeline, TokenRateLimiter, StubClient
+from metrics import RunMetrics
+from run_manifest import RunManifest, input_hash, file_digest, collect_garbage
+from scheduler import RepoScheduler
+
+# Nothing here touches the config file, the network or the heavy libraries at import time. The
+# config and the GitHub / Anthropic clients are created by setup_run for the stages that need
+# them, and pandas / matplotlib / anthropic are imported where they are used.
+CONFIG = None
+CONFIG_LOCK = threading.RLock()
+
+TRANSPORT = None
+
+TOKENS = TokenBudget()
+
+SUMMARIZER = Summarizer(None, tokenCounter=TOKENS)
+
+SUMMARY_PIPELINE = SummaryPipeline(SUMMARIZER)
+
+CHARTS = ChartRenderer()
+
+METRICS = RunMetrics()
+
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+# What each CLI stage needs set up: GitHub access, the Claude client and the chart renderer.
+# "run" is the whole analysis in one go.
+STAGES = {
+  "run": ("github", "ai", "charts"),
+  "fetch": ("github",),
+  "summarize": ("github", "ai"),
+  "render": ("charts",),
+  "report": (),
+  "refresh": ("github", "ai", "charts"),
+}
 
-logging.basicConfig(filename='org_analysis.log', filemode='w', level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
 class OrgAnalysisConfig:
-  def __init__(self, orgName, perPage=100, numCommits=100, pieChartThreshold=0.02, ignoreForks=True, outputDir="output/"):
+  def __init__(self, orgName, perPage=100, numCommits=100, pieChartThreshold=0.02, ignoreForks=True, outputDir="output/", concurrency=8, useCache=True, cacheTTL=0, cacheMaxAge=30 * 24 * 3600, cacheMaxEntries=None, offline=False, incremental=False, summaryCacheMaxAge=90 * 24 * 3600, summaryCacheMaxEntries=None, llmWorkers=4, llmTokensPerMinute=None, llmBatch=False, llmStub=False, chartWorkers=None, chartFormats=("png",), chartDPI=100, userCacheTTL=24 * 3600, source="rest", resume=False, outputFormats=("json",), partitionByDate=False, githubApiUrl=None, reportInlineImages=False, reportPageSize=50, keepRuns=None, retentionDays=None, reuseArtifacts=True, maxRepos=None, timeBudget=None, maxGithubRequests=None, maxLLMTokens=None, inactiveDays=None, skipEmpty=False, rollupWindowDays=None, authorsAllHistory=False, streaming=False):
     self.ORG_NAME = orgName
     self.PER_PAGE = perPage
     self.NUM_COMMITS = numCommits
     self.PIE_CHART_THRESHOLD = pieChartThreshold
     self.IGNORE_FORKS = True
     self.OUTPUT_PATH = f"{outputDir}/{self.ORG_NAME}/"
+    self.CONCURRENCY = concurrency
+    self.USE_CACHE = useCache or offline
+    self.CACHE_PATH = f"{outputDir}/http_cache.sqlite"
+    self.CACHE_TTL = cacheTTL
+    self.CACHE_MAX_AGE = cacheMaxAge
+    self.CACHE_MAX_ENTRIES = cacheMaxEntries
+    self.USER_CACHE_TTL = userCacheTTL
+    self.SOURCE = source
+    self.RESUME = resume
+    self.OUTPUT_FORMATS = tuple(outputFormats)
+    self.PARTITION_BY_DATE = partitionByDate
+    self.GITHUB_API_URL = githubApiUrl
+    self.OFFLINE = offline
+    self.INCREMENTAL = incremental
+    self.STATE_PATH = f"{self.OUTPUT_PATH}{self.ORG_NAME}_state.sqlite"
+    self.STATE = None
+    self.ROLLUP_PATH = f"{self.OUTPUT_PATH}{self.ORG_NAME}_rollups.sqlite"
+    self.ROLLUPS = None
+    self.ROLLUP_WINDOW_DAYS = rollupWindowDays
+    # the authors chart covers every tracked commit rather than the last NUM_COMMITS of each repo
+    self.AUTHORS_ALL_HISTORY = authorsAllHistory
+    # commit rows go through a per-repo disk spill instead of being held until the end
+    self.STREAMING = streaming
+    self.SPILL_PATH = f"{self.OUTPUT_PATH}spill/"
+    self.SPILL = None
+    self.SUMMARY_CACHE_PATH = f"{outputDir}/ai_summary_cache.sqlite"
+    self.SUMMARY_CACHE_MAX_AGE = summaryCacheMaxAge
+    self.SUMMARY_CACHE_MAX_ENTRIES = summaryCacheMaxEntries
+    self.LLM_WORKERS = llmWorkers
+    self.LLM_TOKENS_PER_MINUTE = llmTokensPerMinute
+    self.LLM_BATCH = llmBatch
+    self.LLM_STUB = llmStub
+    # rendering in a separate process only pays off with a spare core
+    self.CHART_WORKERS = chartWorkers if chartWorkers is not None else min(4, (os.cpu_count() or 1) - 1)
+    self.CHART_FORMATS = tuple(chartFormats)
+    self.CHART_DPI = chartDPI
+    self.REPORT_INLINE_IMAGES = reportInlineImages
+    self.REPORT_PAGE_SIZE = reportPageSize
+    self.KEEP_RUNS = keepRuns
+    self.RETENTION_DAYS = retentionDays
+    self.REUSE_ARTIFACTS = reuseArtifacts
+    self.MAX_REPOS = maxRepos
+    self.TIME_BUDGET = timeBudget
+    self.MAX_GITHUB_REQUESTS = maxGithubRequests
+    self.MAX_LLM_TOKENS = maxLLMTokens
+    self.INACTIVE_DAYS = inactiveDays
+    self.SKIP_EMPTY = skipEmpty
+    # the RunManifest of the run in progress; every artifact is named after its run ID
+    self.MANIFEST = None
+    # repos the next refresh re-analyzes (service mode); None re-analyzes them all
+    self.CHANGED_REPOS = None
+
+  # Settings that change what a repo checkpoint contains; checkpoints written under different
+  # settings are not resumed from.
+  def checkpoint_key(self):
+    key = f"{self.NUM_COMMITS}:{self.IGNORE_FORKS}:{self.SOURCE}"
+    # streaming checkpoints keep their commits in the spill rather than in the checkpoint
+    return f"{key}:streaming" if self.STREAMING else key
+
+  # The settings recorded in the run manifest.
+  def as_dict(self):
+    return {k: v for k, v in vars(self).items() if isinstance(v, (str, int, float, bool, tuple, type(None)))}
 
   def __str__(self):
     return (f"Organization: {self.ORG_NAME}\n"
@@ -36,59 +140,172 @@ class OrgAnalysisConfig:
             f"Number of Commits: {self.NUM_COMMITS}\n"
             f"Pie Chart Threshold: {self.PIE_CHART_THRESHOLD}\n"
             f"Ignore Forks: {self.IGNORE_FORKS}\n"
-            f"Output Path: {self.OUTPUT_PATH}")
+            f"Output Path: {self.OUTPUT_PATH}\n"
+            f"Concurrency: {self.CONCURRENCY}\n"
+            f"Cache: {self.CACHE_PATH if self.USE_CACHE else 'disabled'}\n"
+            f"Offline: {self.OFFLINE}\n"
+            f"Incremental: {self.INCREMENTAL}")
 
 ORG_URL = "https://api.github.com/orgs/{org_name}"
-ORG_MEMBERS_URL = "https://api.github.com/orgs/{org_name}/members"
+ORG_MEMBERS_URL = "https://api.github.com/orgs/{org_name}/members?page={page}&per_page={per_page}"
 ORG_REPO_URL = "https://api.github.com/orgs/{org_name}/repos?page={page}&per_page={per_page}"
+ORG_EVENTS_URL = "https://api.github.com/orgs/{org_name}/events?per_page=100"
 
 USER_URL = "https://api.github.com/users/{login}"
-USER_ORGS_URL = "https://api.github.com/users/{login}/orgs"
+USER_ORGS_URL = "https://api.github.com/users/{login}/orgs?per_page=100"
 
 REPO_FULL_URL = "https://api.github.com/repos/{org_name}/{repo_name}"
 REPO_COLLAB_URL = "https://api.github.com/repos/{org_name}/{repo_name}/collaborators"
 REPO_COMMITS_URL = "https://api.github.com/repos/{org_name}/{repo_name}/commits?page={page}&per_page={per_page}"
-# COMMIT_COLUMNS = {'login': [], 'avatar_url':[],  'type': [], 'date': [], 'isFork':[]}
-# REPO_COLUMNS = {'name':[], 'description': [], 'updated_at': [], 'created_at': [], 'size':[], 'stars': [], 'watchers': [],  'language':[], "issues":[], "license": [], "isFork": [], "forkOf": [], "AICommitSummary": []}
-
-def make_paged_request(url, num_entries, analysisConfig: OrgAnalysisConfig, repo_name=""):
-  resp = []
-  i = 1
+REPO_SUMMARY_SYSTEM_PROMPT = "You are a software expert working for an investment firm. You are given summaries of a Github organization, a repository, and a list of commits from that repository. Summarise the commit history in two sentences in general terms. Avoid mentioning the specifics of the changes, instead focusing on how the changes affect the repository. Focus on major changes or updates in the repository and ignore non-substantial changes (documentation changes, minor fixes, package tracker updates, etc.) Read between the lines. If there are no major changes or updates, mention this. Identify any potential risks or concerns in the repository in one sentence. Identify how the repository contriubtes to the organization's product in one sentence. Do not mention needed further evaluation or due dilligence needed as this is a given."
+ORG_SUMMARY_SYSTEM_PROMPT = "You are a software expert working for an investment firm. You are given summaries of a Github organization, and commits to its repositories. The investment firm wants to know two key things: if there could be any red flags for the organization, and if there are any opportunities for the organization. You are to summarize the information in a way that is easy to understand for a non-technical person. You are to focus on the opportunities and red flags. You are to be concise and to the point. Do not mention needed further evaluation or due dilligence needed as this is a given. Do not make unsubstantiated claims."
+
+COMMIT_COLUMNS = ['login', 'avatar_url', 'type', 'date', 'isFork']
+# stands in for a missing author/committer object so nested lookups don't need a branch
+NO_ACCOUNT = {}
+# tokens of commit history in a repo's summary prompt
+REPO_PROMPT_TOKENS = 1024
+# commits a streaming run normalizes and spills at a time: enough to spread pandas' per-call cost,
+# few enough that memory stays flat
+SPILL_BATCH = 2000
+REPO_COLUMNS = ['name', 'description', 'updated_at', 'created_at', 'size', 'stars', 'watchers', 'language', 'issues', 'license', 'isFork', 'forkOf', 'AICommitSummary']
+
+# Worker pools shared by every org analyzed in this process. Repo and member lookups run on the
+# "repos" pool and only ever wait on the "pages" pool, whose tasks are leaf requests, so the two
+# can't deadlock on each other.
+def shared_pool(name, workers):
+  with POOLS_LOCK:
+    if name not in POOLS:
+      POOLS[name] = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+    return POOLS[name]
+
+# Submits fn to a shared pool in a copy of the caller's context, so the requests and tokens it
+# records are charged to the caller's org (see metrics.METER).
+def submit(pool, fn, *args):
+  return pool.submit(contextvars.copy_context().run, fn, *args)
+
+# config.yaml when present, otherwise the keys are taken from the environment
+def settings():
+  global CONFIG
+  with CONFIG_LOCK:
+    if CONFIG is None:
+      CONFIG = loadConfig() if os.path.exists(CONFIG_PATH) else {}
+  return CONFIG
+
+def setting(key):
+  return settings().get(key) or os.environ.get(key)
+
+def anthropic_client():
+  from anthropic import Anthropic
+  return Anthropic(api_key=setting("ANTHROPIC_API_KEY"), base_url=setting("ANTHROPIC_BASE_URL"))
+
+def page_url(url, page, per_page, analysisConfig: OrgAnalysisConfig, repo_name=""):
+  if repo_name:
+    return url.format(org_name=analysisConfig.ORG_NAME, repo_name=repo_name, page=page, per_page=per_page)
+  return url.format(org_name=analysisConfig.ORG_NAME, page=page, per_page=per_page)
+
+def last_page_number(links):
+  last = links.get('last')
+  if not last:
+    return None
+  page = parse_qs(urlparse(last['url']).query).get('page')
+  return int(page[0]) if page else None
+
+# Yields result pages in order. Page 1 is fetched on its own; if its Link header advertises a
+# rel="last" page, the remaining pages are prefetched in parallel, otherwise rel="next" is
+# followed. Stops at the first short or empty page, or once max_entries have been yielded. When
+# streaming, at most CONCURRENCY pages are prefetched ahead of the consumer instead of all of them.
+# The URLs of pages that failed are appended to failed when given.
+def iter_paged_request(url, analysisConfig: OrgAnalysisConfig, repo_name="", max_entries=None, failed=None):
   per_page = analysisConfig.PER_PAGE
-  while num_entries > 0:
-    if num_entries < per_page:
-      per_page = num_entries
-
-    request_url = ""
-    if repo_name:
-      request_url = url.format(org_name=analysisConfig.ORG_NAME, repo_name=repo_name, page=i, per_page=per_page)
-    else:
-      request_url = url.format(org_name=analysisConfig.ORG_NAME, page=i, per_page=per_page)
-
-    result = make_request(request_url)
-
-    if result:
-      resp += result
+  if max_entries is not None:
+    if max_entries <= 0:
+      return
+    per_page = min(per_page, max_entries)
+  max_pages = math.ceil(max_entries / per_page) if max_entries is not None else None
+  remaining = max_entries
+
+  def take(result):
+    nonlocal remaining
+    if remaining is None:
+      return result
+    result = result[:remaining]
+    remaining -= len(result)
+    return result
+
+  def fetch(pageUrl):
+    result, links = make_page_request(pageUrl)
+    if result is None and failed is not None:
+      failed.append(pageUrl)
+    return result, links
+
+  result, links = fetch(page_url(url, 1, per_page, analysisConfig, repo_name))
+  if not result:
+    return
+  yield take(result)
+  if len(result) < per_page or 'next' not in links or remaining == 0:
+    return
 
-    num_entries -= per_page
-    i += 1
+  last = last_page_number(links)
+  if last is None:
+    next_url = links['next']['url']
+    while next_url and remaining != 0:
+      result, links = fetch(next_url)
+      if not result:
+        return
+      yield take(result)
+      if len(result) < per_page:
+        return
+      next_url = links.get('next', {}).get('url')
+    return
 
-  return resp
+  if max_pages is not None:
+    last = min(last, max_pages)
+
+  pool = shared_pool("pages", analysisConfig.CONCURRENCY)
+  pages = iter(range(2, last + 1))
+  futures = deque()
+
+  def prefetch(n):
+    for page in islice(pages, n):
+      futures.append(submit(pool, fetch, page_url(url, page, per_page, analysisConfig, repo_name)))
+
+  prefetch(analysisConfig.CONCURRENCY if analysisConfig.STREAMING else last)
+  try:
+    while futures:
+      result, _ = futures.popleft().result()
+      prefetch(1)
+      if result is None:
+        continue
+      if len(result) > 0:
+        yield take(result)
+      if len(result) < per_page or remaining == 0:
+        return
+  finally:
+    for pending in futures:
+      pending.cancel()
+
+# Every entry of every page, or None if any page failed (an empty list is an empty result).
+def make_paged_request(url, num_entries, analysisConfig: OrgAnalysisConfig, repo_name=""):
+  resp = []
+  failed = []
+  for result in iter_paged_request(url, analysisConfig, repo_name=repo_name, max_entries=num_entries, failed=failed):
+    resp += result
+  return None if failed else resp
 
-def make_request(url):
+def make_page_request(url, ttl=None):
   logger.info(f"Attempting GET: {url}")
 
-  headers = {
-      "Authorization": "Bearer " + CONFIG['GITHUB_API_KEY'],
-      "X-GitHub-Api-Version": "2022-11-28"
-  }
-
-  response = requests.get(url, headers=headers)
+  response = TRANSPORT.get(url, ttl=ttl)
 
-  if response.status_code == 200:
-      return response.json()
+  if response is not None and response.status_code == 200:
+      return response.json(), response.links
   else:
-      logger.info(f"ERROR: {response.status_code}") # TODO: handle rate limit
+      logger.info(f"ERROR: {response.status_code if response is not None else 'no response'}")
+      return None, {}
+
+def make_request(url, ttl=None):
+  return make_page_request(url, ttl=ttl)[0]
 
 def pretty_json(j):
   logger.info(json.dumps(j, indent=2))
@@ -114,18 +331,7 @@ Number of followers: {json.get('followers')}
   return summary
 
 def truncate_to_token_limit(text, max_tokens):
-    tokens = 0
-    words = text.split()
-    truncated = []
-    
-    for word in words:
-        word_tokens = AI_client.count_tokens(word)
-        if tokens + word_tokens > max_tokens:
-            break
-        truncated.append(word)
-        tokens += word_tokens
-    
-    return ' '.join(truncated)
+    return TOKENS.truncate(text, max_tokens)
 
 def print_commit_info(i):
   pretty_json(i)
@@ -136,64 +342,78 @@ def print_commit_info(i):
   # logger.info(f"Message: {i.get('commit').get('message')}") # TODO: feed this and summarise with AI?
   # logger.info(f"Name: {i.get('committer').get('name')}")
 
-def commit_info(j, isFork, orgSummary:str, repoSummary: str):
-  commit_data = {'login': [], 'avatar_url':[],  'type': [], 'date': [], 'isFork':[]}
-  commit_messages = ""
-  count = 1
-  for i in j:
-    # print_commit_info(i)
-    if i.get('author') != None:
-      commit_data['login'].append(i.get('author').get('login'))
-      commit_data['avatar_url'].append(i.get('author').get('avatar_url'))
-      commit_data['type'].append(i.get('author').get('type'))
-    else:
-      commit_data['login'].append(i.get('commit').get('author').get("name"))
-      if i.get('committer') != None:
-        commit_data['avatar_url'].append(i.get('committer').get('avatar_url'))
-        commit_data['type'].append(i.get('committer').get('type'))
-      else:
-        commit_data['avatar_url'].append(None)
-        commit_data['type'].append(None)
-    
-    commit_data['date'].append(i.get('commit').get('committer').get('date'))
-    commit_data['isFork'].append(isFork)
-
-    if "chore" not in i.get('commit').get('message'):
-      commit_messages += f"""
-Date: {commit_data['date'][-1]}
-Message: {i.get('commit').get('message')}
-"""
-    count+=1
+# Flattens the commit payloads into columns in one pass. Commits whose author isn't linked to a
+# GitHub account fall back to the git author name and the committer's avatar and type.
+def normalize_commits(j):
+  import pandas as pd
+
+  def column(objs, key):
+    return pd.Series([o.get(key) for o in objs], dtype=object)
+
+  authors = [c.get('author') or NO_ACCOUNT for c in j]
+  committers = [c.get('committer') or NO_ACCOUNT for c in j]
+  commits = [c.get('commit') for c in j]
+  linked = pd.Series([a is not NO_ACCOUNT for a in authors], dtype=bool)
+
+  return pd.DataFrame({
+    'login': column(authors, 'login').where(linked, column([c.get('author') for c in commits], 'name')),
+    'avatar_url': column(authors, 'avatar_url').where(linked, column(committers, 'avatar_url')),
+    'type': column(authors, 'type').where(linked, column(committers, 'type')),
+    'date': column([c.get('committer') for c in commits], 'date'),
+    'message': column(commits, 'message'),
+  })
+
+def commit_columns(j, isFork):
+  df = normalize_commits(j)
+  commit_data = {
+    'sha': [c.get('sha') for c in j],
+    'login': df['login'].tolist(),
+    'avatar_url': df['avatar_url'].tolist(),
+    'type': df['type'].tolist(),
+    'date': df['date'].tolist(),
+    'isFork': [isFork] * len(df),
+  }
+  return commit_data, df
 
-  AI_info = f"""
-{orgSummary}
-{repoSummary}
-{commit_messages}
-"""
+# Prompt entries for the commits of a normalized frame, leaving out chores.
+def summary_entries(df):
+  kept = df[~df['message'].str.contains("chore", regex=False).astype(bool)]
+  # as the f-string this replaces, a missing date or message reads "None"
+  return ("\nDate: " + kept['date'].map(str) + "\nMessage: " + kept['message'].map(str) + "\n").tolist()
 
-  AI_info = truncate_to_token_limit(AI_info, 1024)
+def repo_prompt(entries, orgSummary: str, repoSummary: str):
+  # the prompt is cut to the token limit anyway, so only the entries that can fit are tokenized
+  AI_info = TOKENS.truncate_parts([f"\n{orgSummary}\n{repoSummary}\n"] + entries + ["\n"], REPO_PROMPT_TOKENS)
   logger.info(AI_info)
-  logger.info(f"Input tokens: {AI_client.count_tokens(AI_info)}")
-
-  message = AI_client.messages.create(
-    max_tokens=1024,
-    system=f"You are a software expert working for an investment firm. You are given summaries of a Github organization, a repository, and a list of commits from that repository. Summarise the commit history in two sentences in general terms. Avoid mentioning the specifics of the changes, instead focusing on how the changes affect the repository. Focus on major changes or updates in the repository and ignore non-substantial changes (documentation changes, minor fixes, package tracker updates, etc.) Read between the lines. If there are no major changes or updates, mention this. Identify any potential risks or concerns in the repository in one sentence. Identify how the repository contriubtes to the organization's product in one sentence. Do not mention needed further evaluation or due dilligence needed as this is a given.",
-    messages=[
-      {
-        "role": "user",
-        "content": AI_info,
-      }
-    ],
-    model="claude-3-opus-20240229",
-  )
-  # logger.info(f"AI response: {message.content}")
-  logger.info(f"AI response: {message.content[0].text}")
-  logger.info(f"AI response tokens: {AI_client.count_tokens(message.content[0].text)}")
-  AI_summary = message.content[0].text
+  logger.info(f"Input tokens: {TOKENS.count(AI_info)}")
+  return AI_info
 
-  df = pd.DataFrame(commit_data)
-  df['date'] = pd.to_datetime(df['date']).dt.date
-  return df, AI_summary
+def submit_summary(prompt):
+  return SUMMARY_PIPELINE.submit(REPO_SUMMARY_SYSTEM_PROMPT, prompt)
+
+def commit_info(j, isFork, orgSummary:str, repoSummary: str):
+  commit_data, df = commit_columns(j, isFork)
+  return commit_data, submit_summary(repo_prompt(summary_entries(df), orgSummary, repoSummary))
+
+# Builds the typed commit table in one go from column buffers. Dates are truncated to the day.
+def commit_frame(columns):
+  import pandas as pd
+  df = pd.DataFrame(columns, columns=COMMIT_COLUMNS)
+  df['login'] = df['login'].astype('category')
+  df['avatar_url'] = df['avatar_url'].astype(object)
+  df['type'] = df['type'].astype('category')
+  df['date'] = pd.to_datetime(df['date'], utc=True).dt.tz_localize(None).dt.normalize()
+  df['isFork'] = df['isFork'].astype(bool)
+  return df
+
+def repo_frame(columns):
+  import pandas as pd
+  df = pd.DataFrame(columns, columns=REPO_COLUMNS)
+  for col in ['size', 'stars', 'watchers', 'issues']:
+    df[col] = pd.to_numeric(df[col])
+  df['language'] = df['language'].astype('category')
+  df['isFork'] = df['isFork'].astype(bool)
+  return df
 
 def print_repo_info(i):
   # pretty_json(i)
@@ -207,158 +427,454 @@ def print_repo_info(i):
   logger.info(f"Language: {i.get('language')}")
   logger.info(f"Open issues: {i.get('open_issues_count')}")
 
-def create_histogram(df, xlabel, ylabel, title, fileName, fileDir):
-  plt.rcParams['font.family'] = ['Quicksand', 'sans-serif']
-  plt.rcParams['font.size'] = 12
-
-  fig, ax = plt.subplots(figsize=(12, 12))
-  fig.patch.set_facecolor('floralwhite')
-  ax.set_facecolor('floralwhite')
-  
-  ax.hist(df, bins=30, color='lightskyblue', edgecolor='steelblue', linewidth=0.5)
-  ax.spines['top'].set_visible(False)
-  ax.spines['right'].set_visible(False)
-
-  ax.set_xlabel(xlabel, labelpad=25)
-  ax.set_ylabel(ylabel, labelpad=25)
-  ax.set_title(title, fontweight='bold', fontsize=16)
-  plt.xticks(rotation=45)
-  plt.savefig(f"{fileDir}{fileName}_{datetime.now().isoformat(timespec='seconds').replace(':', '-')}.png")
-
-def create_pie(countSlice, labelSlice, title, fileName, fileDir, pieChartThreshold):
-  def my_autopct(pct):
-    return f'{pct:.1f}%' if pct >= pieChartThreshold * 100 else ''
-
-  texts = [text if size/countSlice.sum() >= pieChartThreshold else '' for size, text in zip(countSlice, labelSlice)]
-
-  plt.figure(figsize=(15,15), facecolor='floralwhite')
-  
-  plt.rcParams['font.family'] = ['Quicksand', 'sans-serif']
-
-  # Create a donut chart by setting a wedge at the center
-  center_circle = plt.Circle((0,0), 0.50, fc='floralwhite')
-
-  plt.pie(
-    countSlice, 
-    radius=1, 
-    labels=texts, 
-    autopct=my_autopct,
-    pctdistance=0.75,
-    startangle=180, 
-    labeldistance=1.1,
-    colors=plt.cm.Set2.colors, 
-    wedgeprops={'edgecolor': 'white', 'linewidth': 1},
-    textprops={'fontsize': 14}
-  )
+def create_histogram(df, xlabel, ylabel, title, fileName, fileDir, stamp):
+  return CHARTS.histogram(df, xlabel, ylabel, title, fileName, fileDir, stamp)
 
-  # Add the center circle to make it a donut chart
-  fig = plt.gcf()
-  fig.gca().add_artist(center_circle)
+def create_pie(countSlice, labelSlice, title, fileName, fileDir, pieChartThreshold, stamp):
+  return CHARTS.pie(countSlice, labelSlice, title, fileName, fileDir, pieChartThreshold, stamp)
 
-  for text in plt.gca().texts[1::2]:  # Select every other text object (the labels)
-    text.set_color('white')
-    text.set_fontweight('bold')
-    text.set_fontsize(15)
-    text.set_fontname('Quicksand')
-    text.set_path_effects([path_effects.withStroke(linewidth=1, foreground='gray')])
+def fetch_repo_payloads(i, analysisConfig: OrgAnalysisConfig):
+  forkOf, pages = fetch_repo_pages(i, analysisConfig)
+  if pages is None:
+    return forkOf, None
+  return forkOf, [c for page in pages for c in page]
 
-  plt.axis('equal')
-  plt.title(title, pad=70, loc='center', fontweight='bold', fontsize=16)
-  plt.savefig(f"{fileDir}{fileName}_{datetime.now().isoformat(timespec='seconds').replace(':', '-')}.png")
+# The fork parent of a repo and its commits as an iterable of pages, None when its commits aren't
+# read. REST pages are only requested as the iterable is consumed.
+def fetch_repo_pages(i, analysisConfig: OrgAnalysisConfig):
+  forkOf = None
+  pages = None
 
+  # the GraphQL source delivers the fork parent and commits with the listing
+  if '_commits' in i:
+    if i.get('fork') == False or analysisConfig.IGNORE_FORKS == False:
+      # a streaming run lets go of them once the repo is spilled
+      commits = i.pop('_commits') if analysisConfig.STREAMING else i['_commits']
+      pages = [commits[n:n + analysisConfig.PER_PAGE] for n in range(0, len(commits), analysisConfig.PER_PAGE)]
+    return i.get('_forkOf'), pages
+
+  if i.get('fork') == True:
+    logger.info(f"Repo: {analysisConfig.ORG_NAME}/{i.get('name')} is a fork. Checking parent...")
+    full_repo_json = make_request(REPO_FULL_URL.format(org_name=analysisConfig.ORG_NAME, repo_name=i.get('name')))
+    if full_repo_json:
+      forkOf = full_repo_json.get("parent").get("full_name")
+
+  if i.get('fork') == False or analysisConfig.IGNORE_FORKS == False:
+    logger.info(f"Repo: {analysisConfig.ORG_NAME}/{i.get('name')} reading commits...")
+    if analysisConfig.INCREMENTAL:
+      pages = fetch_commits_incremental(i, analysisConfig)
+    else:
+      pages = iter_paged_request(REPO_COMMITS_URL, analysisConfig, repo_name=i.get('name'), max_entries=analysisConfig.NUM_COMMITS)
+
+  return forkOf, pages
+
+# The newest NUM_COMMITS stored commits of a repo as pages; a single one unless streaming.
+def stored_commit_pages(i, analysisConfig: OrgAnalysisConfig):
+  if analysisConfig.STREAMING:
+    return analysisConfig.STATE.iter_commits(i.get('name'), analysisConfig.NUM_COMMITS, analysisConfig.PER_PAGE)
+  return [analysisConfig.STATE.commits(i.get('name'), analysisConfig.NUM_COMMITS)]
+
+# Only asks GitHub for commits newer than the repo's watermark (and nothing at all if pushed_at
+# hasn't moved), merges them into the persisted commit table and returns the newest NUM_COMMITS.
+# A failed fetch leaves the state as it was, so the next run asks again; offline, commits from the
+# cache are merged but the watermark's pushed_at stays where it was, since they may predate it.
+def fetch_commits_incremental(i, analysisConfig: OrgAnalysisConfig):
+  state = analysisConfig.STATE
+  mark = state.watermark(i.get('name'))
+
+  if mark is not None and mark['pushed_at'] == i.get('pushed_at'):
+    logger.info(f"Repo: {analysisConfig.ORG_NAME}/{i.get('name')} unchanged since last run, using stored commits")
+    return stored_commit_pages(i, analysisConfig)
+
+  url = REPO_COMMITS_URL
+  if mark is not None and mark['newest_date']:
+    url += f"&since={quote(mark['newest_date'])}"
+
+  new_commits = make_paged_request(url, analysisConfig.NUM_COMMITS, analysisConfig, repo_name=i.get('name'))
+  if new_commits is None:
+    logger.info(f"Repo: {analysisConfig.ORG_NAME}/{i.get('name')} commits fetch failed, keeping its watermark")
+  elif analysisConfig.OFFLINE:
+    state.merge_commits(i.get('name'), new_commits, mark['pushed_at'] if mark is not None else None)
+  else:
+    state.merge_commits(i.get('name'), new_commits, i.get('pushed_at'))
+  return stored_commit_pages(i, analysisConfig)
+
+# Streaming counterpart of fetch_repo_payloads: commit pages are normalized, appended to the repo's
+# spill file and rolled up SPILL_BATCH commits at a time as they arrive, then dropped. Only the prompt entries the repo's
+# summary can still use are kept. Returns the repo row and the entries, None when its commits
+# aren't read.
+def spill_repo(i, analysisConfig: OrgAnalysisConfig):
+  forkOf, pages = fetch_repo_pages(i, analysisConfig)
+  repoRow = repo_row(i, forkOf)
+  if pages is None:
+    analysisConfig.ROLLUPS.update(repoRow, {})
+    return repoRow, None
+
+  entries = []
+  promptTokens = 0
+  with analysisConfig.SPILL.writer(i.get('name')) as spill:
+    for batch in batched(pages, SPILL_BATCH):
+      commitData, df = commit_columns(batch, False)
+      spill.append(commit_frame(commitData))
+      analysisConfig.ROLLUPS.update(repoRow, commitData)
+      if promptTokens <= REPO_PROMPT_TOKENS:
+        pageEntries = summary_entries(df)
+        entries += pageEntries
+        promptTokens += TOKENS.count("".join(pageEntries))
+  logger.info(f"Spilled {spill.rows} commits of {analysisConfig.ORG_NAME}/{i.get('name')}")
+  return repoRow, entries
+
+# Regroups pages into lists of at least size items (the last one may be short).
+def batched(pages, size):
+  batch = []
+  for page in pages:
+    batch += page
+    if len(batch) >= size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+# Requests every page of a repo for the caches without keeping them (the fetch stage).
+def prefetch_repo(i, analysisConfig: OrgAnalysisConfig):
+  _, pages = fetch_repo_pages(i, analysisConfig)
+  for _ in pages or []:
+    pass
+
+# Fans the per-repo commit and fork-parent lookups (fetch) out over the shared repo pool, keeping
+# at most CONCURRENCY repos in flight and asking the scheduler before starting each one; the first
+# repo it turns away ends the scan. Results are yielded in input order.
+def fetch_repos(repos, analysisConfig: OrgAnalysisConfig, scheduler=None, fetch=fetch_repo_payloads):
+  pool = shared_pool("repos", analysisConfig.CONCURRENCY)
+  pending = deque()
+  remaining = iter(repos)
+  deferred = None
+
+  def fill():
+    nonlocal deferred
+    while len(pending) < analysisConfig.CONCURRENCY:
+      i, deferred = deferred or next(remaining, None), None
+      if i is None:
+        return
+      admitted = True if scheduler is None else scheduler.admit(i)
+      if admitted is None:
+        deferred = i
+        return
+      if not admitted:
+        return
+      future = submit(pool, fetch, i, analysisConfig)
+      if scheduler is not None:
+        future.add_done_callback(lambda _, i=i: scheduler.finish(i))
+      pending.append(future)
+
+  fill()
+  while pending:
+    future = pending.popleft()
+    fill()
+    yield future.result()
+    # a deferred repo is decided once the consumer has handed on the one just yielded
+    if not pending:
+      fill()
+
+# The fetch stage submits no summaries, so it leaves the token budget to summarize.
+def repo_scheduler(analysisConfig: OrgAnalysisConfig, summarizing=True):
+  return RepoScheduler(
+    maxRepos=analysisConfig.MAX_REPOS,
+    maxSeconds=analysisConfig.TIME_BUDGET,
+    maxRequests=analysisConfig.MAX_GITHUB_REQUESTS,
+    maxLLMTokens=analysisConfig.MAX_LLM_TOKENS if summarizing else None,
+    inactiveDays=analysisConfig.INACTIVE_DAYS,
+    skipEmpty=analysisConfig.SKIP_EMPTY,
+    requestsPerRepo=math.ceil(analysisConfig.NUM_COMMITS / analysisConfig.PER_PAGE) if analysisConfig.SOURCE == "rest" else 0,
+    batchSummaries=analysisConfig.LLM_BATCH,
+  )
+
+# Logs which repos were covered and why the others weren't, and records it with the run.
+def write_coverage(scheduler, analysisConfig: OrgAnalysisConfig):
+  coverage = scheduler.coverage()
+  summary = scheduler.summary()
+  logger.info(f"Repo coverage for {analysisConfig.ORG_NAME}: {summary}")
+  METRICS.extra.setdefault("coverage", {})[analysisConfig.ORG_NAME] = summary
+  coveragePath = analysisConfig.MANIFEST.path("coverage", "json")
+  with open(coveragePath, "w") as f:
+    json.dump(coverage, f, indent=2)
+  analysisConfig.MANIFEST.add("coverage", [coveragePath], rows=len(coverage))
+
+def summary_result(future):
+  AI_summary = future.result()
+  logger.info(f"AI response: {AI_summary}")
+  if AI_summary is not None:
+    logger.info(f"AI response tokens: {TOKENS.count(AI_summary)}")
+  return AI_summary
+
+def resolved(value):
+  future = Future()
+  future.set_result(value)
+  return future
+
+# The repo is checkpointed as soon as it's fetched; with batched summaries the future only
+# resolves in the flush, so its summary is added to the checkpoint when it does.
+def checkpoint_repo(analysisConfig: OrgAnalysisConfig, repoRow, commitData, prompt, future):
+  analysisConfig.STATE.save_checkpoint(repoRow['name'], analysisConfig.checkpoint_key(), repoRow, commitData, prompt)
+  checkpoint_summary(analysisConfig, repoRow['name'], future)
+
+def checkpoint_summary(analysisConfig: OrgAnalysisConfig, repo, future):
+  configKey = analysisConfig.checkpoint_key()
+  def save(done):
+    if done.exception() is None:
+      analysisConfig.STATE.save_summary(repo, configKey, done.result())
+  future.add_done_callback(save)
+
+def repo_row(i, forkOf):
+  return {
+    'name': i.get('name'),
+    'description': i.get('description'),
+    'updated_at': i.get('updated_at'),
+    'created_at': i.get('created_at'),
+    'size': i.get('size'),
+    'stars': i.get('stargazers_count'),
+    'watchers': i.get('watchers_count'),
+    'language': i.get('language'),
+    'issues': i.get('open_issues_count'),
+    'license': i.get('license').get('name') if i.get('license') != None else "None",
+    'isFork': i.get('fork') == True,
+    'forkOf': forkOf,
+    'AICommitSummary': None,
+  }
+
+# In a streaming run the commit stats returned are a view of the spill over the repos analyzed
+# rather than a frame.
 def aggRepo(json, analysisConfig: OrgAnalysisConfig, orgSummary: str):
-  count = 5 # len(json) # used for testing to limit the number of repo's analysed
-  commitStats = pd.DataFrame({'login': [], 'avatar_url':[],  'type': [], 'date': [], 'isFork':[]})
-  repoStats = pd.DataFrame({'name':[], 'description': [], 'updated_at': [], 'created_at': [], 'size':[], 'stars': [], 'watchers': [],  'language':[], "issues":[], "license": [], "isFork": [], "forkOf": [], "AICommitSummary": []})
-
-  for i in json:
-    # print_repo_info(i)
-    repoData = {'name':[], 'description': [], 'updated_at': [], 'created_at': [], 'size':[], 'stars': [], 'watchers': [],  'language':[], "issues":[], "license": [], "isFork": [], "forkOf": [], "AICommitSummary": []}
-    repoData['name'].append(i.get('name'))
-    repoData['description'].append(i.get('description'))
-    repoData['updated_at'].append(i.get('updated_at'))
-    repoData['created_at'].append(i.get('created_at'))
-    repoData['size'].append(i.get('size'))
-    repoData['stars'].append(i.get('stargazers_count'))
-    repoData['watchers'].append(i.get('watchers_count'))
-    repoData['language'].append(i.get('language'))
-    repoData['issues'].append(i.get('open_issues_count'))
-
-    repoSummary = f"""
+  commitColumns = {k: [] for k in COMMIT_COLUMNS}
+  repoColumns = {k: [] for k in REPO_COLUMNS}
+
+  scheduler = repo_scheduler(analysisConfig)
+  repos = scheduler.plan(json)
+  completed = {}
+  if analysisConfig.RESUME:
+    completed = analysisConfig.STATE.load_checkpoints(analysisConfig.checkpoint_key())
+    logger.info(f"Resuming {analysisConfig.ORG_NAME}: {len([i for i in repos if i.get('name') in completed])} of {len(repos)} repos already done")
+  else:
+    analysisConfig.STATE.clear_checkpoints()
+    if analysisConfig.STREAMING:
+      analysisConfig.SPILL.clear()
+
+  summaries = []
+  commitsStarted = time.perf_counter()
+  # the scan's requests and summary tokens count against this org's budgets alone
+  with scheduler.charging():
+    fetched = fetch_repos([i for i in repos if i.get('name') not in completed], analysisConfig, scheduler, fetch=spill_repo if analysisConfig.STREAMING else fetch_repo_payloads)
+    for i in repos:
+      if i.get('name') in completed:
+        scheduler.resume(i)
+        repoRow, commitData, AICommitSummary, prompt = completed[i.get('name')]
+        for k in COMMIT_COLUMNS:
+          commitColumns[k].extend(commitData[k])
+        for k in REPO_COLUMNS:
+          repoColumns[k].append(repoRow[k])
+        analysisConfig.ROLLUPS.update(repoRow, commitData)
+        if AICommitSummary is None and prompt is not None:
+          # the previous run stopped before this summary came back
+          AICommitSummary = submit_summary(prompt)
+          scheduler.track(AICommitSummary)
+          checkpoint_summary(analysisConfig, i.get('name'), AICommitSummary)
+          summaries.append(AICommitSummary)
+        else:
+          summaries.append(resolved(AICommitSummary))
+        continue
+
+      payloads = next(fetched, None)
+      if payloads is None:
+        # the budget ran out; checkpointed repos further down are still taken
+        continue
+
+      repoSummary = f"""
 Repository summary:
 Name: {i.get('name')}
 Description: {i.get('description')}
 """
 
-    if i.get('fork') == True:
-      logger.info(f"Repo: {analysisConfig.ORG_NAME}/{i.get('name')} is a fork. Checking parent...")
-      repoData['isFork'].append(True)
-      full_repo_json = make_request(REPO_FULL_URL.format(org_name=analysisConfig.ORG_NAME, repo_name=i.get('name')))
-      if full_repo_json:
-        repoData["forkOf"].append(full_repo_json.get("parent").get("full_name"))
-    else:
-      logger.info(f"Repo: {analysisConfig.ORG_NAME}/{i.get('name')} is not a fork. Reading commits...")
-      repoData['isFork'].append(False)
-      repoData['forkOf'].append(None)
+      commitData = {k: [] for k in COMMIT_COLUMNS}
+      if analysisConfig.STREAMING:
+        # commits are already spilled and rolled up
+        repoRow, entries = payloads
+        prompt = repo_prompt(entries, orgSummary, repoSummary) if entries is not None else None
+        AICommitSummary = submit_summary(prompt) if prompt is not None else resolved("None")
+        scheduler.track(AICommitSummary)
+        summaries.append(AICommitSummary)
+        checkpoint_repo(analysisConfig, repoRow, commitData, prompt, AICommitSummary)
+        for k in REPO_COLUMNS:
+          repoColumns[k].append(repoRow[k])
+        continue
+
+      forkOf, commits_json = payloads
+      # print_repo_info(i)
+      repoRow = repo_row(i, forkOf)
+      prompt = None
+      if commits_json is not None:
+        commitData, df = commit_columns(commits_json, False)
+        prompt = repo_prompt(summary_entries(df), orgSummary, repoSummary)
+        AICommitSummary = submit_summary(prompt)
+        for k in COMMIT_COLUMNS:
+          commitColumns[k].extend(commitData[k])
+      else:
+        AICommitSummary = resolved("None")
+      scheduler.track(AICommitSummary)
+      summaries.append(AICommitSummary)
+      analysisConfig.ROLLUPS.update(repoRow, commitData)
+      checkpoint_repo(analysisConfig, repoRow, commitData, prompt, AICommitSummary)
+
+      for k in REPO_COLUMNS:
+        repoColumns[k].append(repoRow[k])
+
+    METRICS.add_stage_time("commits", time.perf_counter() - commitsStarted, analysisConfig.ORG_NAME)
+    logger.info(f"Done fetching repos for the {analysisConfig.ORG_NAME} organization. Waiting for AI summaries...")
+    with METRICS.stage("llm", analysisConfig.ORG_NAME):
+      SUMMARY_PIPELINE.flush()
+      repoColumns['AICommitSummary'] = [summary_result(f) for f in summaries]
+  write_coverage(scheduler, analysisConfig)
+  analysisConfig.ROLLUPS.reconcile(repoColumns['name'])
+
+  repoStats = repo_frame(repoColumns)
+  commitStats = analysisConfig.SPILL.view(repos=repoColumns['name']) if analysisConfig.STREAMING else commit_frame(commitColumns)
 
-    if i.get('fork') == False or analysisConfig.IGNORE_FORKS == False:
-      commits_json = make_paged_request(REPO_COMMITS_URL, analysisConfig.NUM_COMMITS, analysisConfig, repo_name=i.get('name'))
-      commitDF, AICommitSummary = commit_info(commits_json, False, orgSummary, repoSummary)
-      commitStats = pd.concat([commitStats, commitDF], ignore_index=True)
-      repoData['AICommitSummary'].append(AICommitSummary)
-    else:
-      repoData['AICommitSummary'].append("None")
+  forkedRepos = repoStats[repoStats['isFork'] == True]
+  forkedRepos = forkedRepos.loc[:, ['name', 'forkOf']]
+  forkedRepos.drop_duplicates(inplace=True)
 
+  return repoStats, commitStats, forkedRepos
 
-    if i.get('license') != None:
-      repoData['license'].append(i.get('license').get('name'))
+# Stats identical to the previous run's (same rows, formats and partitioning) aren't written again;
+# the manifest points at the files already on disk.
+def write_stats(df, kind, analysisConfig: OrgAnalysisConfig):
+  import pandas as pd
+
+  if isinstance(df, CommitSpill):
+    return write_spilled_stats(df, kind, analysisConfig)
+  manifest = analysisConfig.MANIFEST
+  inputHash = input_hash(pd.util.hash_pandas_object(df, index=False).to_numpy(), list(df.columns), analysisConfig.OUTPUT_FORMATS, analysisConfig.PARTITION_BY_DATE)
+  if analysisConfig.REUSE_ARTIFACTS and manifest.reuse(kind, inputHash):
+    return
+  paths = []
+  for fmt in analysisConfig.OUTPUT_FORMATS:
+    if fmt == "json":
+      paths.append(manifest.path(kind, "json"))
+      df.to_json(paths[-1], orient='records')
     else:
-      repoData['license'].append("None")
+      paths.append(write_dataset(df, kind, analysisConfig.OUTPUT_PATH, analysisConfig.ORG_NAME, fmt, partitionByDate=analysisConfig.PARTITION_BY_DATE, runId=manifest.RUN_ID))
+  manifest.add(kind, paths, rows=len(df), inputHash=inputHash)
+
+# write_stats for commit stats in a spill: every format is written batch by batch from the spill
+# files, the JSON records exactly as DataFrame.to_json writes them.
+def write_spilled_stats(spill, kind, analysisConfig: OrgAnalysisConfig):
+  manifest = analysisConfig.MANIFEST
+  inputHash = input_hash([file_digest(p)[0] for p in spill.paths()], spill.EXCLUDE_BOTS, spill.EXCLUDE_FORKS, analysisConfig.OUTPUT_FORMATS, analysisConfig.PARTITION_BY_DATE)
+  if analysisConfig.REUSE_ARTIFACTS and manifest.reuse(kind, inputHash):
+    return
+  paths = []
+  rows = 0
+  for fmt in analysisConfig.OUTPUT_FORMATS:
+    if fmt == "json":
+      paths.append(manifest.path(kind, "json"))
+      rows = 0
+      with open(paths[-1], "w") as f:
+        f.write("[")
+        for batch in spill.batches():
+          f.write(("," if rows else "") + batch.to_pandas().to_json(orient='records')[1:-1])
+          rows += batch.num_rows
+        f.write("]")
+    else:
+      path, rows = write_batches(spill.batches(), kind, analysisConfig.OUTPUT_PATH, analysisConfig.ORG_NAME, fmt, partitionByDate=analysisConfig.PARTITION_BY_DATE, runId=manifest.RUN_ID)
+      paths.append(path)
+  manifest.add(kind, paths, rows=rows, inputHash=inputHash)
 
-    repoDataDF = pd.DataFrame(repoData)
-    repoStats = pd.concat([repoStats, repoDataDF], ignore_index=True)
+def repoOutput(repoStats, commitStats, analysisConfig: OrgAnalysisConfig, render=True):
+  logger.info(f"Repos for {analysisConfig.ORG_NAME} GitHub analytics")
+  with METRICS.stage("output", analysisConfig.ORG_NAME):
+    if repoStats.empty == False:
+      write_stats(repoStats, "repo_stats", analysisConfig)
+    if commitStats.empty == False:
+      write_stats(commitStats, "commit_stats", analysisConfig)
+  if render:
+    render_charts(repoStats, commitStats, analysisConfig)
+
+def render_charts(repoStats, commitStats, analysisConfig: OrgAnalysisConfig):
+  with METRICS.stage("rendering", analysisConfig.ORG_NAME):
+    draw_charts(repoStats, commitStats, analysisConfig)
+
+# Commits per day, per author and repos per language for the charts, read from the rollups in
+# O(days + authors) and limited to the last ROLLUP_WINDOW_DAYS days (of UTC dates, like the
+# rollups' days) when set. Without a window the authors are those of the last NUM_COMMITS commits
+# of each repo, as analyzed by the run, unless AUTHORS_ALL_HISTORY. Output directories from before
+# the rollups existed fall back to the stats frames of this run.
+def chart_aggregates(repoStats, commitStats, analysisConfig: OrgAnalysisConfig):
+  rollups = analysisConfig.ROLLUPS
+  exclude = analysisConfig.IGNORE_FORKS
+  if not rollups.is_empty() or commitStats.empty:
+    since = None
+    if analysisConfig.ROLLUP_WINDOW_DAYS:
+      since = (datetime.now(timezone.utc).date() - timedelta(days=analysisConfig.ROLLUP_WINDOW_DAYS)).isoformat()
+      authors, period = rollups.authors(since=since, excludeBots=exclude, excludeForks=exclude), f"in the last {analysisConfig.ROLLUP_WINDOW_DAYS} days"
+    elif analysisConfig.AUTHORS_ALL_HISTORY:
+      authors, period = rollups.authors(excludeBots=exclude, excludeForks=exclude), "since tracking started"
+    else:
+      authors, period = rollups.recent_authors(analysisConfig.NUM_COMMITS, excludeBots=exclude, excludeForks=exclude), f"for the last {analysisConfig.NUM_COMMITS} commits"
+    return rollups.daily(since=since, excludeBots=exclude, excludeForks=exclude), authors, rollups.languages(excludeForks=exclude), period
+
+  byDay = commitStats.groupby("date").size().sort_index()
+  byAuthor = commitStats.groupby('login', observed=True).agg(commits=("date", "size"), type=("type", "first")).sort_values("commits", ascending=False)
+  byLanguage = repoStats.groupby('language', observed=True)["name"].count().sort_values(ascending=False) if not repoStats.empty else []
+  return (
+    [(day.date().isoformat(), count) for day, count in byDay.items()],
+    # not index.map: on a categorical index it also visits logins filtered out above (bots)
+    [(login, authorType, count) for login, authorType, count in zip(byAuthor.index, byAuthor["type"], byAuthor["commits"])],
+    list(byLanguage.items()) if len(byLanguage) else [],
+    f"for the last {analysisConfig.NUM_COMMITS} commits",
+  )
 
-    count -= 1
-    if count <= 0:
-      break
+def draw_charts(repoStats, commitStats, analysisConfig: OrgAnalysisConfig):
+  import numpy as np
+  import pandas as pd
 
-  logger.info(f"Done fetching repos for the {analysisConfig.ORG_NAME} organization.")
+  manifest = analysisConfig.MANIFEST
+  chartJobs = {}
 
-  forkedRepos = repoStats[repoStats['isFork'] == True]
-  forkedRepos = forkedRepos.loc[:, ['name', 'forkOf']]
-  forkedRepos.drop_duplicates(inplace=True)
+  # A chart drawn from the same data, labels and settings as in the previous run is reused.
+  def chart(kind, values, labels, submit, *settings):
+    inputHash = input_hash(np.asarray(values), list(labels), settings, CHARTS.FORMATS, CHARTS.DPI)
+    if analysisConfig.REUSE_ARTIFACTS and manifest.reuse(kind, inputHash):
+      return
+    chartJobs[kind] = (len(values), inputHash, submit())
 
-  return repoStats, commitStats, forkedRepos
+  def histogram(kind, values, xlabel, ylabel, title):
+    fileName = f"{analysisConfig.ORG_NAME}_{kind}"
+    chart(kind, values, (xlabel, ylabel, title), lambda: create_histogram(values, xlabel, ylabel, title, fileName, analysisConfig.OUTPUT_PATH, manifest.RUN_ID))
 
-def repoOutput(repoStats, commitStats, analysisConfig: OrgAnalysisConfig):
-  logger.info(f"Repos for {analysisConfig.ORG_NAME} GitHub analytics")
+  def pie(kind, counts, labels, title):
+    fileName = f"{analysisConfig.ORG_NAME}_{kind}"
+    chart(kind, counts, labels, lambda: create_pie(counts, labels, title, fileName, analysisConfig.OUTPUT_PATH, analysisConfig.PIE_CHART_THRESHOLD, manifest.RUN_ID), title, analysisConfig.PIE_CHART_THRESHOLD)
 
   if repoStats.empty == False:
-    repoStats.to_json(f"{analysisConfig.OUTPUT_PATH}{analysisConfig.ORG_NAME}_repo_stats_{datetime.now().isoformat(timespec='seconds').replace(':', '-')}.json", orient='records')
-    create_histogram(repoStats["stars"], "Number of stars", "Frequency", f'{analysisConfig.ORG_NAME}: Histogram of stars', f"{analysisConfig.ORG_NAME}_stars", analysisConfig.OUTPUT_PATH)
-    create_histogram(repoStats["watchers"], "Number of watchers", "Frequency", f'{analysisConfig.ORG_NAME}: Histogram of watchers', f"{analysisConfig.ORG_NAME}_watchers", analysisConfig.OUTPUT_PATH)
-    create_histogram(repoStats["issues"], "Number of issues", "Frequency", f'{analysisConfig.ORG_NAME}: Histogram of issues', f"{analysisConfig.ORG_NAME}_issues", analysisConfig.OUTPUT_PATH)
-    create_histogram(repoStats["size"], "Size", "Frequency", f'{analysisConfig.ORG_NAME}: Histogram of sizes (kBs)', f"{analysisConfig.ORG_NAME}_sizes", analysisConfig.OUTPUT_PATH)
-
-    by_language = repoStats.groupby('language')["name"].count()
-    by_language = by_language.sort_values(ascending=False)
-    create_pie(by_language, by_language.index, f"{analysisConfig.ORG_NAME} repos by language", f"{analysisConfig.ORG_NAME}_languages", analysisConfig.OUTPUT_PATH, analysisConfig.PIE_CHART_THRESHOLD)
-
-  if commitStats.empty == False:
-    commitStats.to_json(f"{analysisConfig.OUTPUT_PATH}{analysisConfig.ORG_NAME}_commit_stats_{datetime.now().isoformat(timespec='seconds').replace(':', '-')}.json", orient='records')
-    commitData = commitStats.groupby("date").agg({"avatar_url": "count"}).reset_index()
-    commitData.sort_values("date", inplace=True)
-    commitData.rename(columns={'avatar_url': 'count'}, inplace=True)
-    commitData.set_index('date', inplace=True)
-    create_histogram(commitData.index, "Date", "Number of commits", f'{analysisConfig.ORG_NAME}: Histogram of commits', f"{analysisConfig.ORG_NAME}_commits", analysisConfig.OUTPUT_PATH)
-
-    by_author = commitStats.groupby('login').agg({"avatar_url": "count", "type": "first"})
-    by_author = by_author.sort_values("avatar_url", ascending=False)
-    author_label = by_author.index.map(lambda x: f"{by_author.loc[x]['type']}:{x}")
-    create_pie(by_author["avatar_url"], author_label, f"{analysisConfig.ORG_NAME} commit authors for the last {analysisConfig.NUM_COMMITS} commits", f"{analysisConfig.ORG_NAME}_authors", analysisConfig.OUTPUT_PATH, analysisConfig.PIE_CHART_THRESHOLD)
-
-
-def repo_info(json, analysisConfig: OrgAnalysisConfig, orgSummary: str):
+    histogram("stars", repoStats["stars"], "Number of stars", "Frequency", f'{analysisConfig.ORG_NAME}: Histogram of stars')
+    histogram("watchers", repoStats["watchers"], "Number of watchers", "Frequency", f'{analysisConfig.ORG_NAME}: Histogram of watchers')
+    histogram("issues", repoStats["issues"], "Number of issues", "Frequency", f'{analysisConfig.ORG_NAME}: Histogram of issues')
+    histogram("sizes", repoStats["size"], "Size", "Frequency", f'{analysisConfig.ORG_NAME}: Histogram of sizes (kBs)')
+
+  daily, authors, languages, period = chart_aggregates(repoStats, commitStats, analysisConfig)
+  if languages:
+    pie("languages", [count for _, count in languages], [language for language, _ in languages], f"{analysisConfig.ORG_NAME} repos by language")
+
+  if daily:
+    histogram("commits", pd.to_datetime([day for day, _ in daily]), "Date", "Number of commits", f'{analysisConfig.ORG_NAME}: Histogram of commits')
+  if authors:
+    pie("authors", [count for _, _, count in authors], [f"{authorType}:{login}" for login, authorType, _ in authors], f"{analysisConfig.ORG_NAME} commit authors {period}")
+
+  # submitted above, so with chart workers they render in parallel while these wait in turn
+  for kind, (rows, inputHash, job) in chartJobs.items():
+    manifest.add(kind, CHARTS.wait([job]), rows=rows, inputHash=inputHash)
+
+
+def repo_info(json, analysisConfig: OrgAnalysisConfig, orgSummary: str, render=True):
   if json == None:
     logger.info(f"No repos found for {analysisConfig.ORG_NAME}. Exiting...")
     exit()
@@ -368,12 +884,17 @@ def repo_info(json, analysisConfig: OrgAnalysisConfig, orgSummary: str):
 
   if len(forkedRepos) > 0:
     logger.info(f"Forked repos for {analysisConfig.ORG_NAME}")
-    forkedRepos.to_csv(f"{analysisConfig.OUTPUT_PATH}{analysisConfig.ORG_NAME}_forked_repos_{datetime.now().isoformat(timespec='seconds').replace(':', '-')}.csv", index=True)
+    forkedPath = analysisConfig.MANIFEST.path("forked_repos", "csv")
+    forkedRepos.to_csv(forkedPath, index=True)
+    analysisConfig.MANIFEST.add("forked_repos", [forkedPath], rows=len(forkedRepos))
   else:
     logger.info(f"There are no forked repos on the {analysisConfig.ORG_NAME} organization.")
 
   if analysisConfig.IGNORE_FORKS:
-    commitStats = commitStats[(commitStats["type"] != "Bot") & (commitStats["isFork"] == False)]
+    if analysisConfig.STREAMING:
+      commitStats = commitStats.view(excludeBots=True, excludeForks=True)
+    else:
+      commitStats = commitStats[(commitStats["type"] != "Bot") & (commitStats["isFork"] == False)]
     repoStats = repoStats[repoStats["isFork"] == False]
 
   if len(repoStats) <= 0:
@@ -385,40 +906,42 @@ def repo_info(json, analysisConfig: OrgAnalysisConfig, orgSummary: str):
     return
 
   logger.info(f"Showing GitHub analytics for {analysisConfig.ORG_NAME}")
-  repoOutput(repoStats, commitStats, analysisConfig)
+  repoOutput(repoStats, commitStats, analysisConfig, render=render)
 
   AI_repo_summaries = orgSummary
-  AI_repo_summaries += '\n'.join([str(x) for x in repoStats['AICommitSummary'] if pd.notna(x)])
+  AI_repo_summaries += '\n'.join([str(x) for x in repoStats['AICommitSummary'].dropna()])
   logger.info(f"AI repo summaries: {AI_repo_summaries}")
-  logger.info(f"Input tokens: {AI_client.count_tokens(AI_repo_summaries)}")
-  message = AI_client.messages.create(
-    max_tokens=1024,
-    system=f"You are a software expert working for an investment firm. You are given summaries of a Github organization, and commits to its repositories. The investment firm wants to know two key things: if there could be any red flags for the organization, and if there are any opportunities for the organization. You are to summarize the information in a way that is easy to understand for a non-technical person. You are to focus on the opportunities and red flags. You are to be concise and to the point. Do not mention needed further evaluation or due dilligence needed as this is a given. Do not make unsubstantiated claims.",
-    messages=[
-      {
-        "role": "user",
-        "content": AI_repo_summaries,
-      }
-    ],
-    model="claude-3-opus-20240229",
-  )
-  # logger.info(f"AI response: {message.content}")
-  logger.info(f"AI response: {message.content[0].text}")
-  logger.info(f"AI response tokens: {AI_client.count_tokens(message.content[0].text)}")
-  AI_summary = message.content[0].text
-  with open(f"{analysisConfig.OUTPUT_PATH}{analysisConfig.ORG_NAME}_AI_summary_{datetime.now().isoformat(timespec='seconds').replace(':', '-')}.md", "w") as f:
+  logger.info(f"Input tokens: {TOKENS.count(AI_repo_summaries)}")
+  with METRICS.stage("llm", analysisConfig.ORG_NAME):
+    AI_summary = SUMMARIZER.summarize(ORG_SUMMARY_SYSTEM_PROMPT, AI_repo_summaries)
+  logger.info(f"AI response: {AI_summary}")
+  if AI_summary is None:
+    return
+  logger.info(f"AI response tokens: {TOKENS.count(AI_summary)}")
+  summaryPath = analysisConfig.MANIFEST.path("AI_summary", "md")
+  with open(summaryPath, "w") as f:
     f.write(AI_summary)
+  analysisConfig.MANIFEST.add("AI_summary", [summaryPath])
+
+def fetch_member_profile(login, analysisConfig: OrgAnalysisConfig):
+  user_json = make_request(USER_URL.format(login=login), ttl=analysisConfig.USER_CACHE_TTL)
+  user_org_json = make_request(USER_ORGS_URL.format(login=login), ttl=analysisConfig.USER_CACHE_TTL)
+  return user_json or {}, user_org_json or []
+
+# Profile and org lookups for every member run concurrently. Results come back in member order so
+# the sorted HTML is the same as the serial version. Profiles are served from the response cache
+# within USER_CACHE_TTL, which is shared by every org analyzed from the same output directory.
+def fetch_member_profiles(members, analysisConfig: OrgAnalysisConfig):
+  return list(shared_pool("repos", analysisConfig.CONCURRENCY).map(lambda i: fetch_member_profile(i.get('login'), analysisConfig), members))
 
 def org_members_info(j, analysisConfig: OrgAnalysisConfig):
-  if len(j) == 0:
+  if not j:
     logger.info("No public org members.\n")
     return
 
   htmllist = []
 
-  for i in j:
-    user_json = make_request(USER_URL.format(login=i.get('login')))
-    user_org_json = make_request(USER_ORGS_URL.format(login=i.get('login')))
+  for i, (user_json, user_org_json) in zip(j, fetch_member_profiles(j, analysisConfig)):
     user_orgs_list = [org.get('login') for org in user_org_json]
 
     html = "<div style='width: 200px; margin: 10px; text-align: center;'>"
@@ -429,7 +952,7 @@ def org_members_info(j, analysisConfig: OrgAnalysisConfig):
     html += f'<p>Followers: {user_json.get("followers")}</p>'
     html += f'</div>'
 
-    htmllist.append({"followers": user_json.get("followers"), "html": html})
+    htmllist.append({"followers": user_json.get("followers") or 0, "html": html})
 
   htmllist = sorted(htmllist, key=lambda x: x["followers"], reverse=True)
   container = "<div style='width: 100%; display: flex; flex-wrap: wrap; justify-content: center; margin-top: 10px; font-family:\"Quicksand\"'>"
@@ -437,43 +960,353 @@ def org_members_info(j, analysisConfig: OrgAnalysisConfig):
     container += i["html"]
   container += "</div>"
 
-  with open(f"{analysisConfig.OUTPUT_PATH}{analysisConfig.ORG_NAME}_org_members_{datetime.now().isoformat(timespec='seconds').replace(':', '-')}.html", "w") as f:
+  membersPath = analysisConfig.MANIFEST.path("org_members", "html")
+  with open(membersPath, "w") as f:
     f.write(container)
-
-def main(analysisConfig: OrgAnalysisConfig):
+  analysisConfig.MANIFEST.add("org_members", [membersPath], rows=len(htmllist))
+
+def setup_run(analysisConfig: OrgAnalysisConfig, stage="run"):
+  global TRANSPORT
+  needs = STAGES[stage]
+  os.makedirs(analysisConfig.OUTPUT_PATH, exist_ok=True)
+  if "github" in needs:
+    with CONFIG_LOCK:
+      if TRANSPORT is None:
+        TRANSPORT = GitHubTransport(setting("GITHUB_API_KEY"))
+    TRANSPORT.metrics = METRICS
+    TRANSPORT.apiUrl = analysisConfig.GITHUB_API_URL or setting("GITHUB_API_URL")
+    TRANSPORT.offline = analysisConfig.OFFLINE
+    if analysisConfig.USE_CACHE and TRANSPORT.cache is None:
+      TRANSPORT.cache = ResponseCache(analysisConfig.CACHE_PATH, ttl=analysisConfig.CACHE_TTL, maxAge=analysisConfig.CACHE_MAX_AGE, maxEntries=analysisConfig.CACHE_MAX_ENTRIES)
+  if "ai" in needs:
+    SUMMARIZER.metrics = METRICS
+    SUMMARIZER.offline = analysisConfig.OFFLINE
+    if analysisConfig.LLM_STUB:
+      SUMMARIZER.client = StubClient()
+    elif SUMMARIZER.client is None:
+      SUMMARIZER.client = anthropic_client()
+    TOKENS.set_client(SUMMARIZER.client)
+    if analysisConfig.LLM_TOKENS_PER_MINUTE:
+      SUMMARIZER.limiter = TokenRateLimiter(analysisConfig.LLM_TOKENS_PER_MINUTE)
+    SUMMARY_PIPELINE.WORKERS = analysisConfig.LLM_WORKERS
+    SUMMARY_PIPELINE.BATCH = analysisConfig.LLM_BATCH
+    if analysisConfig.USE_CACHE and SUMMARIZER.cache is None:
+      SUMMARIZER.cache = SummaryCache(analysisConfig.SUMMARY_CACHE_PATH, maxAge=analysisConfig.SUMMARY_CACHE_MAX_AGE, maxEntries=analysisConfig.SUMMARY_CACHE_MAX_ENTRIES)
+  if "charts" in needs:
+    CHARTS.WORKERS = analysisConfig.CHART_WORKERS
+    CHARTS.FORMATS = analysisConfig.CHART_FORMATS
+    CHARTS.DPI = analysisConfig.CHART_DPI
+  if analysisConfig.STATE is None:
+    analysisConfig.STATE = OrgState(analysisConfig.STATE_PATH)
+  if analysisConfig.ROLLUPS is None:
+    analysisConfig.ROLLUPS = OrgRollups(analysisConfig.ROLLUP_PATH)
+  if analysisConfig.STREAMING and analysisConfig.SPILL is None:
+    analysisConfig.SPILL = CommitSpill(analysisConfig.SPILL_PATH)
+  if analysisConfig.MANIFEST is None:
+    analysisConfig.MANIFEST = RunManifest(analysisConfig.OUTPUT_PATH, analysisConfig.ORG_NAME, stage, analysisConfig.as_dict())
+
+def main(analysisConfig: OrgAnalysisConfig, render=True):
     logger.info(f"STARTED: GitHub organisation analytics for {analysisConfig.ORG_NAME}.")
+    setup_run(analysisConfig, "run" if render else "summarize")
     
     logger.info(f"1. Org info for {analysisConfig.ORG_NAME}...")
-    org_json = make_request(ORG_URL.format(org_name=analysisConfig.ORG_NAME))
-    org_summary = org_info(org_json, analysisConfig)
+    with METRICS.stage("org", analysisConfig.ORG_NAME):
+      org_json = make_request(ORG_URL.format(org_name=analysisConfig.ORG_NAME))
+      org_summary = org_info(org_json, analysisConfig)
 
     logger.info(f"2. Public org member info for {analysisConfig.ORG_NAME}...")
-    org_members_json = make_request(ORG_MEMBERS_URL.format(org_name=analysisConfig.ORG_NAME))
-    org_members_info(org_members_json, analysisConfig)
+    with METRICS.stage("members", analysisConfig.ORG_NAME):
+      org_members_json = make_paged_request(ORG_MEMBERS_URL, None, analysisConfig)
+      org_members_info(org_members_json, analysisConfig)
 
     logger.info(f"3. Repo and commit info for: {analysisConfig.ORG_NAME}...")
-    repo_json = make_paged_request(ORG_REPO_URL, org_json.get('public_repos'), analysisConfig)
+    with METRICS.stage("repo_listing", analysisConfig.ORG_NAME):
+      repo_json = fetch_repo_listing(analysisConfig)
     # pretty_json(repo_json)
-    repo_info(repo_json, analysisConfig, org_summary)
-
-if __name__ == "__main__":
-  parser = argparse.ArgumentParser(
-      description="Repository analysis script",
-      epilog="Example: python org.py --org-name pendle-finance --num-commits 100 --ignore-forks True --pie-chart-threshold 0.02 --output-dir 'output/'"
+    repo_info(repo_json, analysisConfig, org_summary, render=render)
+    analysisConfig.STATE.clear_checkpoints()
+    if analysisConfig.STREAMING:
+      analysisConfig.SPILL.clear()
+
+# A streaming run keeps only the fields of each listed repo the analysis reads, page by page.
+def fetch_repo_listing(analysisConfig: OrgAnalysisConfig):
+  if analysisConfig.SOURCE == "graphql":
+    return GraphQLSource(TRANSPORT).fetch_org_repos(analysisConfig.ORG_NAME, analysisConfig.NUM_COMMITS, ignoreForks=analysisConfig.IGNORE_FORKS)
+  if analysisConfig.STREAMING:
+    return [trim_repo(r) for page in iter_paged_request(ORG_REPO_URL, analysisConfig) for r in page]
+  # whatever pages of the listing arrived
+  return [r for page in iter_paged_request(ORG_REPO_URL, analysisConfig) for r in page]
+
+def trim_repo(r):
+  license = r.get('license')
+  return dict(
+    {k: r.get(k) for k in ('name', 'description', 'updated_at', 'created_at', 'pushed_at', 'size', 'stargazers_count', 'watchers_count', 'language', 'open_issues_count', 'fork')},
+    license={'name': license.get('name')} if license else None,
   )
 
-  parser.add_argument("--org-name", default="", help="Organization name", required=True)
+# Stage 1: every GitHub request of the analysis and nothing else. Responses land in the HTTP
+# cache (and commits in the incremental state), where summarize picks them up.
+def fetch_org(analysisConfig: OrgAnalysisConfig):
+  logger.info(f"Fetching GitHub data for {analysisConfig.ORG_NAME}")
+  setup_run(analysisConfig, "fetch")
+  with METRICS.stage("org", analysisConfig.ORG_NAME):
+    org_json = make_request(ORG_URL.format(org_name=analysisConfig.ORG_NAME))
+    org_info(org_json, analysisConfig)
+  with METRICS.stage("members", analysisConfig.ORG_NAME):
+    fetch_member_profiles(make_paged_request(ORG_MEMBERS_URL, None, analysisConfig) or [], analysisConfig)
+  with METRICS.stage("repo_listing", analysisConfig.ORG_NAME):
+    repo_json = fetch_repo_listing(analysisConfig)
+  with METRICS.stage("commits", analysisConfig.ORG_NAME):
+    scheduler = repo_scheduler(analysisConfig, summarizing=False)
+    with scheduler.charging():
+      for _ in fetch_repos(scheduler.plan(repo_json or []), analysisConfig, scheduler, fetch=prefetch_repo):
+        pass
+
+# Stage 2: the analysis and AI summaries, writing the stats but no charts.
+def summarize_org(analysisConfig: OrgAnalysisConfig):
+  main(analysisConfig, render=False)
+
+# Stats of the given kind the run manifest points at, in whichever output format is available.
+def load_stats(analysisConfig: OrgAnalysisConfig, kind):
+  import pandas as pd
+
+  for path in sorted(analysisConfig.MANIFEST.resolve(kind), key=lambda p: (not p.endswith(".json"), not p.endswith(".arrow"))):
+    if path.endswith(".json"):
+      return pd.read_json(path, orient='records', convert_dates=['date'])
+    return read_dataset(path)
+
+  # output directories from before run manifests
+  prefix = f"{analysisConfig.ORG_NAME}_{kind}_"
+  written = sorted(f for f in os.listdir(analysisConfig.OUTPUT_PATH) if f.startswith(prefix) and f.endswith(".json"))
+  if written:
+    return pd.read_json(analysisConfig.OUTPUT_PATH + written[-1], orient='records', convert_dates=['date'])
+  for fmt in ("feather", "parquet"):
+    path = dataset_path(analysisConfig.OUTPUT_PATH, analysisConfig.ORG_NAME, kind, fmt)
+    if os.path.exists(path):
+      return read_dataset(path)
+  return pd.DataFrame()
+
+# Stage 3: charts from the stats written by summarize.
+def render_org(analysisConfig: OrgAnalysisConfig):
+  setup_run(analysisConfig, "render")
+  import pandas as pd
+
+  repoStats = load_stats(analysisConfig, "repo_stats")
+  # streaming runs draw the commit charts from the rollups alone rather than load every commit
+  commitStats = pd.DataFrame() if analysisConfig.STREAMING and not analysisConfig.ROLLUPS.is_empty() else load_stats(analysisConfig, "commit_stats")
+  if repoStats.empty and commitStats.empty:
+    logger.info(f"No stats written for {analysisConfig.ORG_NAME} yet. Run summarize first.")
+    return
+  render_charts(repoStats, commitStats, analysisConfig)
+
+# The report over the artifacts of the given run manifest, by default the latest one on disk.
+def write_org_report(analysisConfig: OrgAnalysisConfig, manifest=None):
+  from generate_report import generate_report
+
+  reportPath = f"{os.path.dirname(analysisConfig.OUTPUT_PATH.rstrip('/'))}/{analysisConfig.ORG_NAME}_report.html"
+  with METRICS.stage("report", analysisConfig.ORG_NAME):
+    generate_report(analysisConfig.OUTPUT_PATH, reportPath, manifest=manifest, org=analysisConfig.ORG_NAME, inlineImages=analysisConfig.REPORT_INLINE_IMAGES, pageSize=analysisConfig.REPORT_PAGE_SIZE)
+  return reportPath
+
+# Stage 4: the HTML report over the latest artifacts in the org's output directory.
+def report_org(analysisConfig: OrgAnalysisConfig):
+  setup_run(analysisConfig, "report")
+  reportPath = write_org_report(analysisConfig)
+  print(f"Report generated and saved to {reportPath}")
+
+# Service mode: brings a tracked org's artifacts up to date after changes to CHANGED_REPOS. The
+# other repos are taken over from the checkpoints the previous refresh left behind, so a push costs
+# the (mostly revalidated) listing plus the changed repos' commits and summaries. Stats, charts,
+# the org summary and the report are then rebuilt, reusing whatever came out unchanged. With
+# CHANGED_REPOS None every repo is analyzed, as on the daemon's start.
+def refresh_org(analysisConfig: OrgAnalysisConfig):
+  from generate_report import from_run_manifest
+
+  setup_run(analysisConfig, "refresh")
+  changed = analysisConfig.CHANGED_REPOS
+  analysisConfig.RESUME = changed is not None
+  for repo in changed or []:
+    analysisConfig.STATE.clear_checkpoint(repo)
+
+  with METRICS.stage("org", analysisConfig.ORG_NAME):
+    org_summary = org_info(make_request(ORG_URL.format(org_name=analysisConfig.ORG_NAME)), analysisConfig)
+  if changed is None:
+    with METRICS.stage("members", analysisConfig.ORG_NAME):
+      org_members_info(make_paged_request(ORG_MEMBERS_URL, None, analysisConfig), analysisConfig)
+  with METRICS.stage("repo_listing", analysisConfig.ORG_NAME):
+    repo_json = fetch_repo_listing(analysisConfig)
+  repo_info(repo_json, analysisConfig, org_summary)
+  write_org_report(analysisConfig, from_run_manifest(analysisConfig.MANIFEST.snapshot(), analysisConfig.OUTPUT_PATH))
+
+# Called by the RefreshDaemon for every batch of changes; each refresh is its own run with its own
+# manifest and metrics.
+def refresh_tracked_org(analysisConfig: OrgAnalysisConfig, repos):
+  global METRICS
+  METRICS = RunMetrics()
+  analysisConfig.CHANGED_REPOS = repos
+  run_org(analysisConfig, "refresh")
+
+def poll_org_events(analysisConfig: OrgAnalysisConfig):
+  return make_request(ORG_EVENTS_URL.format(org_name=analysisConfig.ORG_NAME))
+
+# Stage "serve": refreshes every org once, then again whenever webhooks or the events API report
+# changes to its repos, until interrupted.
+def serve(configs, host="127.0.0.1", port=None, pollInterval=None, debounce=30, maxDelay=300):
+  from refresh_daemon import RefreshDaemon
+
+  setup_run(configs[0], "refresh")
+  daemon = RefreshDaemon(configs, refresh_tracked_org, pollEvents=poll_org_events, debounce=debounce, maxDelay=maxDelay, pollInterval=pollInterval, secret=setting("GITHUB_WEBHOOK_SECRET")).start(host, port)
+  print(f"Tracking {', '.join(c.ORG_NAME for c in configs)}" + (f", webhooks on {daemon.url}" if daemon.url else "") + (f", polling events every {pollInterval}s" if pollInterval else ""))
+  try:
+    while True:
+      time.sleep(3600)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    daemon.stop()
+
+STAGE_RUNNERS = {
+  "run": main,
+  "fetch": fetch_org,
+  "summarize": summarize_org,
+  "render": render_org,
+  "report": report_org,
+  "refresh": refresh_org,
+}
+
+def run_org(analysisConfig: OrgAnalysisConfig, stage="run"):
+  if not os.path.exists(analysisConfig.OUTPUT_PATH):
+    os.makedirs(analysisConfig.OUTPUT_PATH)
+
+  print(f"Running {stage} for: {analysisConfig.ORG_NAME}")
+  manifest = analysisConfig.MANIFEST = RunManifest(analysisConfig.OUTPUT_PATH, analysisConfig.ORG_NAME, stage, analysisConfig.as_dict())
+  try:
+    STAGE_RUNNERS[stage](analysisConfig)
+  finally:
+    metricsPath = METRICS.write(manifest.path("run_metrics", "json"), org=analysisConfig.ORG_NAME)
+    manifest.add("run_metrics", [metricsPath])
+    manifest.write()
+    collect_garbage(analysisConfig.OUTPUT_PATH, analysisConfig.ORG_NAME, analysisConfig.KEEP_RUNS, analysisConfig.RETENTION_DAYS)
+
+# The options every stage takes. The CLI registers them before the stage and again on each stage's
+# subparser; the subparser copies have their defaults suppressed, so an option given before the
+# stage isn't overwritten by the subparser's default and both orders parse the same.
+def shared_options(suppressDefaults=False):
+  parser = argparse.ArgumentParser(add_help=False)
+
+  parser.add_argument("--org-name", nargs="+", default=[], help="Organization name(s)")
+  parser.add_argument("--org-file", type=str, default=None, help="File with one organization name per line")
+  parser.add_argument("--max-parallel-orgs", type=int, default=4, help="Number of organizations analyzed at the same time in a batch")
   parser.add_argument("--num-commits", type=int, default=100, help="Number of commits to analyze")
   parser.add_argument("--ignore-forks", type=bool, default=True, help="Ignore forked repositories")
   parser.add_argument("--pie-chart-threshold", type=float, default=0.02, help="Pie chart threshold")
   parser.add_argument("--output-dir", type=str, default="output/", help="Target output directory")
+  parser.add_argument("--concurrency", type=int, default=8, help="Number of repos fetched concurrently")
+  parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk HTTP response cache")
+  parser.add_argument("--cache-ttl", type=int, default=0, help="Seconds a cached response is served without revalidation")
+  parser.add_argument("--cache-max-age", type=int, default=30 * 24 * 3600, help="Seconds after which cached responses are evicted")
+  parser.add_argument("--cache-max-entries", type=int, default=None, help="Maximum number of cached responses (least recently used are evicted)")
+  parser.add_argument("--user-cache-ttl", type=int, default=24 * 3600, help="Seconds cached user profiles are reused across orgs without revalidation")
+  parser.add_argument("--offline", action="store_true", help="Run purely from the HTTP response and AI summary caches")
+  parser.add_argument("--summary-cache-max-age", type=int, default=90 * 24 * 3600, help="Seconds after which cached AI summaries are evicted")
+  parser.add_argument("--summary-cache-max-entries", type=int, default=None, help="Maximum number of cached AI summaries (least recently used are evicted)")
+  parser.add_argument("--llm-workers", type=int, default=4, help="Number of concurrent AI summary requests")
+  parser.add_argument("--llm-tokens-per-minute", type=int, default=None, help="Input-token-per-minute budget for AI summary requests")
+  parser.add_argument("--llm-batch", action="store_true", help="Submit repo summaries through the Message Batches API")
+  parser.add_argument("--llm-stub", action="store_true", help="Use a local stub instead of the Anthropic API")
+  parser.add_argument("--chart-workers", type=int, default=None, help="Processes used to render charts (0 renders inline, default: spare cores up to 4)")
+  parser.add_argument("--chart-formats", nargs="+", choices=CHART_FORMATS, default=["png"], help="Image formats written for every chart")
+  parser.add_argument("--chart-dpi", type=int, default=100, help="Resolution of raster charts")
+  parser.add_argument("--output-formats", nargs="+", choices=OUTPUT_FORMATS, default=["json"], help="Formats the repo and commit stats are written in")
+  parser.add_argument("--partition-by-date", action="store_true", help="Partition the parquet commit dataset by month")
+  parser.add_argument("--source", choices=["rest", "graphql"], default="rest", help="Fetch repos and commits through per-repo REST calls or bulk GraphQL queries")
+  parser.add_argument("--resume", action="store_true", help="Skip repos completed by an interrupted previous run of the same org")
+  parser.add_argument("--report-inline-images", action="store_true", help="Embed downscaled charts in the report so it is a single portable file")
+  parser.add_argument("--report-page-size", type=int, default=50, help="Table rows per page in the report")
+  parser.add_argument("--keep-runs", type=int, default=None, help="Delete the artifacts of all but this many most recent runs of each org")
+  parser.add_argument("--retention-days", type=float, default=None, help="Delete the artifacts of runs older than this many days (runs kept by --keep-runs stay)")
+  parser.add_argument("--no-reuse", action="store_true", help="Rewrite stats and charts even when they are identical to the previous run's")
+  parser.add_argument("--max-repos", type=int, default=None, help="Analyze at most this many repos per org, highest priority first")
+  parser.add_argument("--time-budget", type=float, default=None, help="Stop starting new repos after this many seconds of the repo scan")
+  parser.add_argument("--max-github-requests", type=int, default=None, help="Stop starting new repos once the scan has made this many GitHub requests")
+  parser.add_argument("--max-llm-tokens", type=int, default=None, help="Stop starting new repos once AI summaries could exceed this many tokens")
+  parser.add_argument("--skip-inactive-days", type=float, default=None, help="Skip repos not pushed to for this many days without fetching their commits")
+  parser.add_argument("--skip-empty", action="store_true", help="Skip repos the listing reports as empty (size 0) without fetching their commits")
+  parser.add_argument("--rollup-window-days", type=int, default=None, help="Limit the commit and author charts to this many recent days of the rollups (default: all tracked history for commits, the last --num-commits commits of each repo for authors)")
+  parser.add_argument("--authors-all-history", action="store_true", help="Chart the authors of every tracked commit instead of the last --num-commits commits of each repo")
+  parser.add_argument("--streaming", action="store_true", help="Stream repos and commit pages through an on-disk spill so memory stays flat however large the org")
+  parser.add_argument("--github-api-url", type=str, default=None, help="Base URL of the GitHub API (GitHub Enterprise or a local stand-in)")
+  parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO", help="Level of the org_analysis.log log")
+  parser.add_argument("--profile", type=str, default=None, help="Run under cProfile and write the pstats dump to this path (worker threads are named for py-spy)")
+  parser.add_argument("--incremental", action="store_true", help="Only fetch commits newer than the previous run's per-repo watermark")
+  if suppressDefaults:
+    for action in parser._actions:
+      action.default = argparse.SUPPRESS
+  return parser
+
+# A stage name given after a multi-value option (--org-name foo report) would be taken as one of
+# its values; moving it to the front hands every option to the stage's subparser instead. The
+# stage is the first stage name that isn't the value of a single-value option.
+def stage_first(argv, cli, stageNames):
+  singleValue = {o for a in cli._actions if a.nargs is None for o in a.option_strings}
+  isValue = False
+  for n, arg in enumerate(argv):
+    if arg in stageNames and not isValue:
+      return [arg] + argv[:n] + argv[n + 1:]
+    isValue = arg in singleValue
+  return argv
 
-  args = parser.parse_args()
-  ANALYSIS_CONFIG = OrgAnalysisConfig(args.org_name, args.num_commits, args.ignore_forks, args.pie_chart_threshold, args.output_dir)
-
-  if not os.path.exists(ANALYSIS_CONFIG.OUTPUT_PATH):
-    os.makedirs(ANALYSIS_CONFIG.OUTPUT_PATH)
-
-  print(f"Running analysis for: {ANALYSIS_CONFIG.ORG_NAME}")
-  main(ANALYSIS_CONFIG)
+if __name__ == "__main__":
+  stageOptions = shared_options(suppressDefaults=True)
+  cli = argparse.ArgumentParser(
+      description="Repository analysis script",
+      epilog="Example: python org.py --org-name pendle-finance --num-commits 100 --ignore-forks True --pie-chart-threshold 0.02 --output-dir 'output/'",
+      parents=[shared_options()]
+  )
+  stages = cli.add_subparsers(dest="stage", metavar="{fetch,summarize,render,report,serve}", help="Run a single stage of the analysis (default: all but report)")
+  stages.add_parser("fetch", parents=[stageOptions], help="Fetch org, member, repo and commit data from GitHub into the caches")
+  stages.add_parser("summarize", parents=[stageOptions], help="Build the repo and commit stats and AI summaries")
+  stages.add_parser("render", parents=[stageOptions], help="Render charts from the stats written by summarize")
+  stages.add_parser("report", parents=[stageOptions], help="Generate the HTML report for each org")
+  serveStage = stages.add_parser("serve", parents=[stageOptions], help="Keep each org fresh, re-analyzing only the repos that webhooks or the events API report changed")
+  serveStage.add_argument("--webhook-host", type=str, default="127.0.0.1", help="Address the webhook server listens on")
+  serveStage.add_argument("--webhook-port", type=int, default=None, help="Accept GitHub push and repository webhooks on this port (secret: GITHUB_WEBHOOK_SECRET)")
+  serveStage.add_argument("--poll-interval", type=float, default=None, help="Poll each org's events API every this many seconds")
+  serveStage.add_argument("--debounce", type=float, default=30, help="Seconds without new changes to an org before it is refreshed")
+  serveStage.add_argument("--max-delay", type=float, default=300, help="Refresh an org at the latest this many seconds after its first pending change")
+
+  args = cli.parse_args(stage_first(sys.argv[1:], cli, stages.choices))
+  logging.basicConfig(filename='org_analysis.log', filemode='w', level=getattr(logging, args.log_level), format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s')
+  stage = args.stage or "run"
+  orgNames = read_org_names(args.org_name, args.org_file)
+  if not orgNames:
+    cli.error("one of --org-name or --org-file is required")
+  if stage == "serve" and args.webhook_port is None and not args.poll_interval:
+    cli.error("serve needs --webhook-port or --poll-interval")
+
+  configs = [OrgAnalysisConfig(orgName, numCommits=args.num_commits, ignoreForks=args.ignore_forks, pieChartThreshold=args.pie_chart_threshold, outputDir=args.output_dir, concurrency=args.concurrency, useCache=not args.no_cache, cacheTTL=args.cache_ttl, cacheMaxAge=args.cache_max_age, cacheMaxEntries=args.cache_max_entries, offline=args.offline, incremental=args.incremental, summaryCacheMaxAge=args.summary_cache_max_age, summaryCacheMaxEntries=args.summary_cache_max_entries, llmWorkers=args.llm_workers, llmTokensPerMinute=args.llm_tokens_per_minute, llmBatch=args.llm_batch, llmStub=args.llm_stub, chartWorkers=args.chart_workers, chartFormats=args.chart_formats, chartDPI=args.chart_dpi, userCacheTTL=args.user_cache_ttl, source=args.source, resume=args.resume, outputFormats=args.output_formats, partitionByDate=args.partition_by_date, githubApiUrl=args.github_api_url, reportInlineImages=args.report_inline_images, reportPageSize=args.report_page_size, keepRuns=args.keep_runs, retentionDays=args.retention_days, reuseArtifacts=not args.no_reuse, maxRepos=args.max_repos, timeBudget=args.time_budget, maxGithubRequests=args.max_github_requests, maxLLMTokens=args.max_llm_tokens, inactiveDays=args.skip_inactive_days, skipEmpty=args.skip_empty, rollupWindowDays=args.rollup_window_days, authorsAllHistory=args.authors_all_history, streaming=args.streaming) for orgName in orgNames]
+
+  METRICS.extra["startup_s"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+  logger.info(f"Startup: {time.perf_counter() - IMPORT_STARTED:.3f}s from import to running {stage} (pid {os.getpid()})")
+
+  profiler = None
+  if args.profile:
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+  try:
+    if stage == "serve":
+      serve(configs, host=args.webhook_host, port=args.webhook_port, pollInterval=args.poll_interval, debounce=args.debounce, maxDelay=args.max_delay)
+    elif len(configs) == 1:
+      run_org(configs[0], stage)
+    else:
+      setup_run(configs[0], stage)
+      run_batch(configs, lambda analysisConfig: run_org(analysisConfig, stage), maxParallelOrgs=args.max_parallel_orgs, summaryPath=f"{args.output_dir}/batch_summary.json")
+      METRICS.write(f"{args.output_dir}/run_metrics.json")
+    CHARTS.close()
+  finally:
+    if profiler is not None:
+      profiler.disable()
+      profiler.dump_stats(args.profile)
+      logger.info(f"Profile written to {args.profile}")
   print(f"Done.")
\ No newline at end of file
@@ -0,0 +1,132 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from rollups import add_columns
+
+logger = logging.getLogger(__name__)
+
+# Persistent per-org state kept between runs. Holds a watermark per repo (the pushed_at value of
+# the last ingest and the newest commit seen) and the commit table new commits are merged into,
+# so a refresh only has to ask GitHub for commits since the watermark, plus the checkpoints of
+# repos finished by a run that hasn't completed yet.
+class OrgState:
+  def __init__(self, path):
+    self.PATH = path
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute("""CREATE TABLE IF NOT EXISTS watermarks (
+      repo TEXT PRIMARY KEY,
+      pushed_at TEXT,
+      newest_sha TEXT,
+      newest_date TEXT
+    )""")
+    self._conn.execute("""CREATE TABLE IF NOT EXISTS commits (
+      repo TEXT,
+      sha TEXT,
+      date TEXT,
+      payload TEXT,
+      PRIMARY KEY (repo, sha)
+    )""")
+    self._conn.execute("CREATE INDEX IF NOT EXISTS commits_by_date ON commits (repo, date)")
+    self._conn.execute("""CREATE TABLE IF NOT EXISTS checkpoints (
+      repo TEXT PRIMARY KEY,
+      config_key TEXT,
+      repo_row TEXT,
+      commit_columns TEXT,
+      summary TEXT,
+      created_at REAL
+    )""")
+    add_columns(self._conn, "checkpoints", {"prompt": "TEXT"})
+    self._conn.commit()
+
+  def watermark(self, repo):
+    with self._lock:
+      row = self._conn.execute("SELECT pushed_at, newest_sha, newest_date FROM watermarks WHERE repo = ?", (repo,)).fetchone()
+    if row is None:
+      return None
+    return {"pushed_at": row[0], "newest_sha": row[1], "newest_date": row[2]}
+
+  def merge_commits(self, repo, commits, pushed_at):
+    rows = [(repo, c.get('sha'), c.get('commit').get('committer').get('date'), json.dumps(trim_commit(c))) for c in commits]
+    with self._lock:
+      self._conn.executemany("INSERT OR REPLACE INTO commits VALUES (?, ?, ?, ?)", rows)
+      newest = self._conn.execute("SELECT sha, date FROM commits WHERE repo = ? ORDER BY date DESC LIMIT 1", (repo,)).fetchone()
+      self._conn.execute(
+        "INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?, ?)",
+        (repo, pushed_at, newest[0] if newest else None, newest[1] if newest else None)
+      )
+      self._conn.commit()
+    logger.info(f"Merged {len(rows)} commits into state for {repo}")
+
+  def commits(self, repo, limit):
+    with self._lock:
+      rows = self._conn.execute("SELECT payload FROM commits WHERE repo = ? ORDER BY date DESC LIMIT ?", (repo, limit)).fetchall()
+    return [json.loads(r[0]) for r in rows]
+
+  # The same commits as commits(), read and decoded pageSize at a time.
+  def iter_commits(self, repo, limit, pageSize):
+    offset = 0
+    while offset < limit:
+      with self._lock:
+        rows = self._conn.execute("SELECT payload FROM commits WHERE repo = ? ORDER BY date DESC LIMIT ? OFFSET ?", (repo, min(pageSize, limit - offset), offset)).fetchall()
+      if not rows:
+        return
+      yield [json.loads(r[0]) for r in rows]
+      offset += len(rows)
+
+  # Records a fetched repo (its repo row, commit columns and summary prompt) so an interrupted
+  # run can pick up after it. The summary is added by save_summary once it comes back; until then
+  # it is NULL and a resumed run submits the prompt again. config_key ties the checkpoint to the
+  # settings that produced it.
+  def save_checkpoint(self, repo, configKey, repoRow, commitColumns, prompt):
+    with self._lock:
+      self._conn.execute(
+        "INSERT OR REPLACE INTO checkpoints (repo, config_key, repo_row, commit_columns, summary, prompt, created_at) VALUES (?, ?, ?, ?, NULL, ?, ?)",
+        (repo, configKey, json.dumps(repoRow), json.dumps(commitColumns), prompt, time.time())
+      )
+      self._conn.commit()
+
+  def save_summary(self, repo, configKey, summary):
+    with self._lock:
+      self._conn.execute("UPDATE checkpoints SET summary = ? WHERE repo = ? AND config_key = ?", (json.dumps(summary), repo, configKey))
+      self._conn.commit()
+
+  # Returns {repo: (repoRow, commitColumns, summary, prompt)}; summary is None while it is pending.
+  def load_checkpoints(self, configKey):
+    with self._lock:
+      rows = self._conn.execute("SELECT repo, repo_row, commit_columns, summary, prompt FROM checkpoints WHERE config_key = ?", (configKey,)).fetchall()
+    return {r[0]: (json.loads(r[1]), json.loads(r[2]), json.loads(r[3]) if r[3] is not None else None, r[4]) for r in rows}
+
+  def clear_checkpoint(self, repo):
+    with self._lock:
+      self._conn.execute("DELETE FROM checkpoints WHERE repo = ?", (repo,))
+      self._conn.commit()
+
+  def clear_checkpoints(self):
+    with self._lock:
+      self._conn.execute("DELETE FROM checkpoints")
+      self._conn.commit()
+
+  def close(self):
+    with self._lock:
+      self._conn.close()
+
+# Keeps only the parts of a commit payload the analysis reads.
+def trim_commit(c):
+  author = c.get('author')
+  committer = c.get('committer')
+  commit = c.get('commit')
+  return {
+    'sha': c.get('sha'),
+    'author': {k: author.get(k) for k in ('login', 'avatar_url', 'type')} if author else None,
+    'committer': {k: committer.get(k) for k in ('avatar_url', 'type')} if committer else None,
+    'commit': {
+      'author': {'name': commit.get('author').get('name')},
+      'committer': {'date': commit.get('committer').get('date')},
+      'message': commit.get('message'),
+    },
+  }
@@ -0,0 +1,246 @@
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# webhook events that can change what the analysis sees of a repo
+WEBHOOK_EVENTS = ("push", "repository")
+# org events API types with the same effect
+POLLED_EVENTS = ("PushEvent", "CreateEvent", "DeleteEvent", "PublicEvent", "RepositoryEvent")
+
+# The org and the repos a webhook delivery touches, or None for deliveries that don't matter. A
+# renamed repo counts under its old and new name.
+def webhook_changes(event, payload):
+  if event not in WEBHOOK_EVENTS:
+    return None
+  repository = payload.get('repository') or {}
+  org = (payload.get('organization') or {}).get('login') or (repository.get('owner') or {}).get('login')
+  repos = [repository.get('name')]
+  renamed = ((payload.get('changes') or {}).get('repository') or {}).get('name') or {}
+  repos.append(renamed.get('from'))
+  repos = [r for r in repos if r]
+  if not org or not repos:
+    return None
+  return org, repos
+
+def verify_signature(secret, body, signature):
+  expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+  return hmac.compare_digest(expected, signature or "")
+
+# Repo changes per org, coalesced until the org has had no new change for debounce seconds (or
+# its oldest pending change has waited maxDelay, so a steady stream of pushes still gets
+# refreshed). A change with repos None asks for a full refresh of the org.
+class ChangeQueue:
+  def __init__(self, debounce=30, maxDelay=300):
+    self.DEBOUNCE = debounce
+    self.MAX_DELAY = maxDelay
+    self._cond = threading.Condition()
+    self._pending = {}
+    self._active = 0
+    self._closed = False
+
+  def add(self, org, repos=None):
+    now = time.monotonic()
+    with self._cond:
+      entry = self._pending.setdefault(org, {'repos': set(), 'full': False, 'first': now, 'last': now})
+      entry['last'] = now
+      if repos is None:
+        entry['full'] = True
+      else:
+        entry['repos'].update(repos)
+      self._cond.notify_all()
+
+  def _due(self, entry):
+    return min(entry['last'] + self.DEBOUNCE, entry['first'] + self.MAX_DELAY)
+
+  # Blocks until some org's changes are due and returns (org, repos), repos None for a full
+  # refresh; returns None once closed. Every change taken is to be followed by done().
+  def take(self):
+    with self._cond:
+      while not self._closed:
+        now = time.monotonic()
+        due = [(self._due(e), org) for org, e in self._pending.items()]
+        if due:
+          at, org = min(due)
+          if at <= now:
+            entry = self._pending.pop(org)
+            self._active += 1
+            return org, None if entry['full'] else sorted(entry['repos'])
+          self._cond.wait(at - now)
+        else:
+          self._cond.wait()
+      return None
+
+  def done(self):
+    with self._cond:
+      self._active -= 1
+      self._cond.notify_all()
+
+  # Blocks until nothing is pending or being refreshed; False on timeout.
+  def wait_idle(self, timeout=None):
+    with self._cond:
+      return self._cond.wait_for(lambda: not self._pending and not self._active, timeout)
+
+  def pending(self):
+    with self._cond:
+      return {org: None if e['full'] else sorted(e['repos']) for org, e in self._pending.items()}
+
+  def close(self):
+    with self._cond:
+      self._closed = True
+      self._cond.notify_all()
+
+# Service mode: keeps a set of orgs fresh by re-analyzing only the repos that changed. Changes
+# arrive as GitHub push / repository webhooks POSTed to the built-in server and/or by polling each
+# org's events API (conditional requests, so an idle org costs 304s). They are coalesced per org
+# by a ChangeQueue and handed to refresh(config, repos) on a single worker, so refreshes of the
+# same output directory never overlap. Every org gets a full refresh (repos None) on start.
+class RefreshDaemon:
+  def __init__(self, configs, refresh, pollEvents=None, debounce=30, maxDelay=300, pollInterval=None, secret=None):
+    self.CONFIGS = {c.ORG_NAME.lower(): c for c in configs}
+    self.REFRESH = refresh
+    self.POLL_EVENTS = pollEvents
+    self.POLL_INTERVAL = pollInterval
+    self.SECRET = secret
+    self.queue = ChangeQueue(debounce, maxDelay)
+    self.server = None
+    self.url = None
+    self.stats = {'deliveries': 0, 'ignored': 0, 'rejected': 0, 'polled_events': 0, 'refreshes': 0, 'failed': 0}
+    self.history = []
+    self._lock = threading.Lock()
+    self._stopped = threading.Event()
+    self._threads = []
+    self._lastEvent = {}
+
+  def _count(self, key):
+    with self._lock:
+      self.stats[key] += 1
+
+  # Records changes to repos of a tracked org; False when the org isn't tracked.
+  def notify(self, org, repos=None):
+    if org.lower() not in self.CONFIGS:
+      return False
+    self.queue.add(org.lower(), repos)
+    return True
+
+  def handle_webhook(self, event, body, signature=None):
+    if self.SECRET and not verify_signature(self.SECRET, body, signature):
+      self._count('rejected')
+      return 401
+    self._count('deliveries')
+    if event == "ping":
+      return 200
+    try:
+      changes = webhook_changes(event, json.loads(body))
+    except ValueError:
+      self._count('rejected')
+      return 400
+    if changes is None or not self.notify(*changes):
+      self._count('ignored')
+      return 202
+    logger.info(f"Webhook {event} for {changes[0]}: {', '.join(changes[1])}")
+    return 202
+
+  # New events of interest since the previous poll; the first poll only sets the baseline, since
+  # the full refresh on start covers everything before it.
+  def poll(self, analysisConfig):
+    org = analysisConfig.ORG_NAME.lower()
+    events = self.POLL_EVENTS(analysisConfig) or []
+    last = self._lastEvent.get(org)
+    self._lastEvent[org] = max([last or 0] + [int(e['id']) for e in events if str(e.get('id', '')).isdigit()])
+    if last is None:
+      return []
+    repos = []
+    for e in events:
+      if e.get('type') in POLLED_EVENTS and int(e['id']) > last:
+        self._count('polled_events')
+        repos.append(e['repo']['name'].split('/', 1)[-1])
+    if repos:
+      self.notify(org, sorted(set(repos)))
+    return repos
+
+  def _poll_loop(self):
+    while not self._stopped.is_set():
+      for analysisConfig in self.CONFIGS.values():
+        try:
+          self.poll(analysisConfig)
+        except Exception:
+          logger.exception(f"Polling events of {analysisConfig.ORG_NAME} failed")
+      self._stopped.wait(self.POLL_INTERVAL)
+
+  def _refresh_loop(self):
+    while True:
+      change = self.queue.take()
+      if change is None:
+        return
+      org, repos = change
+      analysisConfig = self.CONFIGS[org]
+      logger.info(f"Refreshing {analysisConfig.ORG_NAME}: {'all repos' if repos is None else ', '.join(repos)}")
+      start = time.time()
+      status = "done"
+      try:
+        self.REFRESH(analysisConfig, repos)
+      except (Exception, SystemExit):
+        logger.exception(f"Refresh of {analysisConfig.ORG_NAME} failed")
+        status = "failed"
+        self._count('failed')
+      self._count('refreshes')
+      with self._lock:
+        self.history.append({'org': analysisConfig.ORG_NAME, 'repos': repos, 'status': status, 'seconds': round(time.time() - start, 2)})
+      self.queue.done()
+
+  def _start_thread(self, target, name):
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    self._threads.append(thread)
+
+  # Queues the initial full refreshes and starts the worker, the webhook server (when a port is
+  # given, 0 for any free one) and the poller (when a poll interval is set).
+  def start(self, host="127.0.0.1", port=None):
+    for org in self.CONFIGS:
+      self.queue.add(org)
+    self._start_thread(self._refresh_loop, "refresh")
+
+    if port is not None:
+      daemon = self
+
+      class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+          body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+          status = daemon.handle_webhook(self.headers.get("X-GitHub-Event"), body, self.headers.get("X-Hub-Signature-256"))
+          self.send_response(status)
+          self.send_header("Content-Length", "0")
+          self.end_headers()
+
+        def log_message(self, *args):
+          pass
+
+      self.server = ThreadingHTTPServer((host, port), Handler)
+      self.server.daemon_threads = True
+      self.url = f"http://{host}:{self.server.server_address[1]}"
+      self._start_thread(self.server.serve_forever, "webhooks")
+      logger.info(f"Accepting webhooks on {self.url}")
+
+    if self.POLL_EVENTS is not None and self.POLL_INTERVAL:
+      self._start_thread(self._poll_loop, "events")
+    return self
+
+  # Blocks until every queued change has been refreshed (or timeout seconds passed).
+  def wait_idle(self, timeout=None):
+    return self.queue.wait_idle(timeout)
+
+  def stop(self):
+    self._stopped.set()
+    self.queue.close()
+    if self.server is not None:
+      self.server.shutdown()
+      self.server.server_close()
+    for thread in self._threads:
+      thread.join(timeout=5)
@@ -0,0 +1,181 @@
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# sqlite's default limit on host parameters is 999 before 3.32
+SHA_CHUNK = 500
+
+# Aggregates of an org kept across runs and updated as new commits and repos arrive: commit counts
+# per repo, day and author (with the author's type and whether the repo is a fork, so bots and
+# forks can be filtered at query time) and the latest attributes of every repo. Commits are
+# counted once by sha however many runs see them. The charts read daily, per-author and
+# per-language counts from here, so their cost grows with days and authors rather than with the
+# commit history, and any time window is an indexed range query. Repos the latest run didn't
+# analyze (deleted, transferred, skipped or over budget) are marked gone by reconcile() and left
+# out of every query until a run analyzes them again.
+class OrgRollups:
+  def __init__(self, path):
+    self.PATH = path
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.execute("""CREATE TABLE IF NOT EXISTS daily_commits (
+      repo TEXT,
+      day TEXT,
+      login TEXT,
+      type TEXT,
+      is_fork INTEGER,
+      commits INTEGER,
+      PRIMARY KEY (repo, day, login, type)
+    )""")
+    self._conn.execute("CREATE INDEX IF NOT EXISTS daily_commits_by_day ON daily_commits (day)")
+    self._conn.execute("""CREATE TABLE IF NOT EXISTS counted_commits (
+      repo TEXT,
+      sha TEXT,
+      date TEXT,
+      login TEXT,
+      type TEXT,
+      is_fork INTEGER,
+      PRIMARY KEY (repo, sha)
+    ) WITHOUT ROWID""")
+    self._conn.execute("""CREATE TABLE IF NOT EXISTS repos (
+      repo TEXT PRIMARY KEY,
+      language TEXT,
+      is_fork INTEGER,
+      stars INTEGER,
+      watchers INTEGER,
+      issues INTEGER,
+      size INTEGER,
+      updated_at TEXT,
+      present INTEGER DEFAULT 1
+    )""")
+    # rollups written before commits kept their author and repos their presence
+    add_columns(self._conn, "counted_commits", {"date": "TEXT", "login": "TEXT", "type": "TEXT", "is_fork": "INTEGER"})
+    add_columns(self._conn, "repos", {"present": "INTEGER DEFAULT 1"})
+    self._conn.execute("CREATE INDEX IF NOT EXISTS counted_commits_by_date ON counted_commits (repo, date)")
+    self._conn.commit()
+
+  # Adds the commits of one repo (columns as built by commit_info) that haven't been counted yet
+  # and refreshes the repo's attributes. Returns the number of commits added.
+  def update(self, repoRow, commitColumns):
+    repo = repoRow['name']
+    shas = commitColumns.get('sha') or []
+    with self._lock:
+      counted = set()
+      for start in range(0, len(shas), SHA_CHUNK):
+        chunk = [s for s in shas[start:start + SHA_CHUNK] if s]
+        if chunk:
+          rows = self._conn.execute(f"SELECT sha FROM counted_commits WHERE repo = ? AND sha IN ({','.join('?' * len(chunk))})", [repo] + chunk)
+          counted.update(r[0] for r in rows)
+
+      increments = {}
+      commits = []
+      newShas = []
+      for n, sha in enumerate(shas):
+        if not sha or not commitColumns['date'][n]:
+          continue
+        isFork = bool(commitColumns['isFork'][n])
+        commits.append((repo, sha, commitColumns['date'][n], commitColumns['login'][n], commitColumns['type'][n], int(isFork)))
+        if sha in counted:
+          continue
+        counted.add(sha)
+        newShas.append(sha)
+        key = (commitColumns['date'][n][:10], commitColumns['login'][n], commitColumns['type'][n], isFork)
+        increments[key] = increments.get(key, 0) + 1
+
+      # commits counted before they kept their date and author get them filled in
+      self._conn.executemany(
+        """INSERT INTO counted_commits (repo, sha, date, login, type, is_fork) VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT (repo, sha) DO UPDATE SET date = excluded.date, login = excluded.login, type = excluded.type, is_fork = excluded.is_fork
+           WHERE counted_commits.date IS NULL""",
+        commits
+      )
+      self._conn.executemany(
+        """INSERT INTO daily_commits VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT (repo, day, login, type) DO UPDATE SET commits = commits + excluded.commits""",
+        [(repo, day, login, authorType, int(isFork), count) for (day, login, authorType, isFork), count in increments.items()]
+      )
+      self._conn.execute(
+        "INSERT OR REPLACE INTO repos (repo, language, is_fork, stars, watchers, issues, size, updated_at, present) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)",
+        (repo, repoRow.get('language'), int(bool(repoRow.get('isFork'))), repoRow.get('stars'), repoRow.get('watchers'), repoRow.get('issues'), repoRow.get('size'), repoRow.get('updated_at'))
+      )
+      self._conn.commit()
+    if newShas:
+      logger.info(f"Rolled up {len(newShas)} new commits of {repo}")
+    return len(newShas)
+
+  # Marks the repos of a run's analysis present and every other repo gone.
+  def reconcile(self, repos):
+    current = set(repos)
+    with self._lock:
+      known = [r[0] for r in self._conn.execute("SELECT repo FROM repos")]
+      self._conn.executemany("UPDATE repos SET present = ? WHERE repo = ?", [(int(r in current), r) for r in known])
+      self._conn.commit()
+    gone = [r for r in known if r not in current]
+    if gone:
+      logger.info(f"Left {len(gone)} repos no longer analyzed out of the rollups: {', '.join(sorted(gone))}")
+
+  def is_empty(self):
+    with self._lock:
+      return self._conn.execute("SELECT 1 FROM repos LIMIT 1").fetchone() is None
+
+  def _where(self, since, until, excludeBots, excludeForks):
+    clauses, params = ["repo IN (SELECT repo FROM repos WHERE present = 1)"], []
+    if since:
+      clauses.append("day >= ?")
+      params.append(since)
+    if until:
+      clauses.append("day <= ?")
+      params.append(until)
+    if excludeBots:
+      clauses.append("(type IS NULL OR type != 'Bot')")
+    if excludeForks:
+      clauses.append("is_fork = 0")
+    return " WHERE " + " AND ".join(clauses), params
+
+  # (day, commits) for every day with commits in [since, until] (ISO dates, either may be None).
+  def daily(self, since=None, until=None, excludeBots=False, excludeForks=False):
+    where, params = self._where(since, until, excludeBots, excludeForks)
+    with self._lock:
+      return self._conn.execute(f"SELECT day, SUM(commits) FROM daily_commits{where} GROUP BY day ORDER BY day", params).fetchall()
+
+  # (login, type, commits) per author in [since, until], most commits first.
+  def authors(self, since=None, until=None, excludeBots=False, excludeForks=False):
+    where, params = self._where(since, until, excludeBots, excludeForks)
+    with self._lock:
+      return self._conn.execute(f"SELECT login, MIN(type), SUM(commits) FROM daily_commits{where} GROUP BY login ORDER BY SUM(commits) DESC, login", params).fetchall()
+
+  # (login, type, commits) per author over the newest perRepo commits of every repo, most commits
+  # first: the authors of the commits a run with NUM_COMMITS = perRepo analyzes.
+  def recent_authors(self, perRepo, excludeBots=False, excludeForks=False):
+    filters = ["n <= ?", "login IS NOT NULL"]
+    if excludeBots:
+      filters.append("(type IS NULL OR type != 'Bot')")
+    if excludeForks:
+      filters.append("is_fork = 0")
+    with self._lock:
+      return self._conn.execute(
+        f"""SELECT login, MIN(type), COUNT(*) FROM (
+             SELECT login, type, is_fork, ROW_NUMBER() OVER (PARTITION BY repo ORDER BY date DESC) AS n FROM counted_commits
+             WHERE date IS NOT NULL AND repo IN (SELECT repo FROM repos WHERE present = 1)
+           ) WHERE {' AND '.join(filters)} GROUP BY login ORDER BY COUNT(*) DESC, login""",
+        (perRepo,)
+      ).fetchall()
+
+  # (language, repos) over repos with a known language, most repos first.
+  def languages(self, excludeForks=False):
+    where = " AND is_fork = 0" if excludeForks else ""
+    with self._lock:
+      return self._conn.execute(f"SELECT language, COUNT(*) FROM repos WHERE present = 1 AND language IS NOT NULL{where} GROUP BY language ORDER BY COUNT(*) DESC, language").fetchall()
+
+  def close(self):
+    with self._lock:
+      self._conn.close()
+
+def add_columns(conn, table, columns):
+  existing = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+  for name, definition in columns.items():
+    if name not in existing:
+      conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+def run_stamp_of(moment):
+  return moment.isoformat(timespec='seconds').replace(':', '-')
+
+def run_stamp():
+  return run_stamp_of(datetime.now())
+
+# Hash of the inputs an artifact is produced from (arrays by their bytes, anything else by its
+# repr), so a run can tell an artifact would come out the same as last time. Datetime arrays are
+# hashed at one resolution since stats read back from disk may come with a different unit.
+def input_hash(*parts):
+  digest = hashlib.sha256()
+  for part in parts:
+    if getattr(getattr(part, "dtype", None), "kind", None) == "M":
+      part = part.astype("datetime64[s]")
+    digest.update(part.tobytes() if hasattr(part, "tobytes") else repr(part).encode())
+    digest.update(b"\0")
+  return digest.hexdigest()
+
+# sha256 and size of a file, or of every file under a directory (a partitioned dataset).
+def file_digest(path):
+  digest = hashlib.sha256()
+  size = 0
+  if os.path.isdir(path):
+    files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+  else:
+    files = [path]
+  for file in files:
+    if file != path:
+      digest.update(os.path.relpath(file, path).encode())
+    with open(file, "rb") as f:
+      for chunk in iter(lambda: f.read(1 << 20), b""):
+        digest.update(chunk)
+        size += len(chunk)
+  return digest.hexdigest(), size
+
+def remove_path(path):
+  if os.path.isdir(path):
+    shutil.rmtree(path, ignore_errors=True)
+  elif os.path.exists(path):
+    os.remove(path)
+
+# Index of the artifacts of one run of one org: every file is stamped with the run ID and
+# recorded under its kind with checksum, size and row count. The latest manifest
+# ({org}_manifest.json) also carries forward the artifacts of kinds this run didn't write (a
+# render-only run keeps pointing at the stats of the last summarize), so consumers look an
+# artifact up by kind instead of listing the directory. Every run's manifest is kept under runs/
+# until collect_garbage expires it.
+class RunManifest:
+  def __init__(self, directory, org, stage="run", config=None):
+    self.DIRECTORY = directory
+    self.ORG = org
+    self.STAGE = stage
+    self.CONFIG = config or {}
+    self.RUN_ID = run_stamp()
+    self.STARTED = time.time()
+    self.PATH = manifest_path(directory, org)
+    self._lock = threading.Lock()
+    previous = load_manifest(self.PATH)
+    # a run started within the same second as the previous one (a busy refresh daemon) gets a suffix
+    if previous and previous.get("run_id", "").startswith(self.RUN_ID):
+      suffix = previous["run_id"][len(self.RUN_ID) + 1:]
+      self.RUN_ID = f"{self.RUN_ID}-{int(suffix) + 1 if suffix.isdigit() else 1}"
+    self._previous = previous["artifacts"] if previous else {}
+    self.artifacts = {}
+
+  def path(self, kind, ext):
+    return f"{self.DIRECTORY}{self.ORG}_{kind}_{self.RUN_ID}.{ext}"
+
+  # The entry for a kind, written by this run or carried forward from an earlier one.
+  def get(self, kind):
+    with self._lock:
+      entry = self.artifacts.get(kind) or self._previous.get(kind)
+    if entry is None or not all(os.path.exists(os.path.join(self.DIRECTORY, p)) for p in entry["paths"]):
+      return None
+    return entry
+
+  def resolve(self, kind):
+    entry = self.get(kind)
+    return [os.path.join(self.DIRECTORY, p) for p in entry["paths"]] if entry else []
+
+  # Takes over the previous run's artifact of this kind when it was produced from the same
+  # inputs and its files are still there. Returns whether it was reused.
+  def reuse(self, kind, inputHash):
+    with self._lock:
+      entry = self._previous.get(kind)
+    if entry is None or entry.get("input_hash") != inputHash:
+      return False
+    if not all(os.path.exists(os.path.join(self.DIRECTORY, p)) for p in entry["paths"]):
+      return False
+    with self._lock:
+      self.artifacts[kind] = entry
+    logger.info(f"Reusing {kind} of run {entry['run_id']} for {self.ORG}")
+    return True
+
+  def add(self, kind, paths, rows=None, inputHash=None):
+    checksum = hashlib.sha256()
+    size = 0
+    for path in paths:
+      digest, nbytes = file_digest(path)
+      checksum.update(digest.encode())
+      size += nbytes
+    entry = {
+      "paths": [os.path.relpath(p, self.DIRECTORY) for p in paths],
+      "sha256": checksum.hexdigest(),
+      "bytes": size,
+      "rows": rows,
+      "input_hash": inputHash,
+      "run_id": self.RUN_ID,
+      "written_at": time.time(),
+    }
+    with self._lock:
+      self.artifacts[kind] = entry
+    return entry
+
+  def snapshot(self):
+    with self._lock:
+      artifacts = dict(self._previous, **self.artifacts)
+    return {
+      "run_id": self.RUN_ID,
+      "org": self.ORG,
+      "stage": self.STAGE,
+      "started_at": self.STARTED,
+      "finished_at": time.time(),
+      "config": self.CONFIG,
+      "artifacts": artifacts,
+      "written": sorted(self.artifacts),
+    }
+
+  # Writes runs/<run id>.json and replaces the latest manifest with it.
+  def write(self):
+    snapshot = self.snapshot()
+    runsDir = os.path.join(self.DIRECTORY, "runs")
+    os.makedirs(runsDir, exist_ok=True)
+    with open(os.path.join(runsDir, f"{self.RUN_ID}.json"), "w") as f:
+      json.dump(snapshot, f, indent=2)
+    tmp = self.PATH + ".tmp"
+    with open(tmp, "w") as f:
+      json.dump(snapshot, f, indent=2)
+    os.replace(tmp, self.PATH)
+    logger.info(f"Run {self.RUN_ID} manifest written to {self.PATH} ({len(self.artifacts)} artifacts)")
+    return self.PATH
+
+def manifest_path(directory, org):
+  return f"{directory}{org}_manifest.json"
+
+def load_manifest(path):
+  if not os.path.exists(path):
+    return None
+  try:
+    with open(path, "r") as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    logger.warning(f"Ignoring unreadable run manifest {path}")
+    return None
+
+# Expires old runs of an org: the newest keepRuns runs and those younger than retentionDays are
+# kept (either limit may be None), older run manifests are deleted together with every file only
+# they reference. Files of the latest manifest are never deleted. Returns the run IDs removed.
+def collect_garbage(directory, org, keepRuns=None, retentionDays=None):
+  runsDir = os.path.join(directory, "runs")
+  if (keepRuns is None and retentionDays is None) or not os.path.isdir(runsDir):
+    return []
+  runIds = sorted((name[:-len(".json")] for name in os.listdir(runsDir) if name.endswith(".json")), reverse=True)
+  cutoff = run_stamp_of(datetime.now() - timedelta(days=retentionDays)) if retentionDays is not None else None
+
+  keep, expire = [], []
+  for n, runId in enumerate(runIds):
+    recent = keepRuns is not None and n < keepRuns
+    young = cutoff is not None and runId >= cutoff
+    (keep if recent or young else expire).append(runId)
+  if not expire:
+    return []
+
+  referenced = set()
+  for manifest in [load_manifest(manifest_path(directory, org))] + [load_manifest(os.path.join(runsDir, f"{r}.json")) for r in keep]:
+    for entry in (manifest or {}).get("artifacts", {}).values():
+      referenced.update(entry["paths"])
+
+  removed = 0
+  for runId in expire:
+    manifest = load_manifest(os.path.join(runsDir, f"{runId}.json")) or {}
+    for entry in manifest.get("artifacts", {}).values():
+      for path in entry["paths"]:
+        if path not in referenced and os.path.exists(os.path.join(directory, path)):
+          remove_path(os.path.join(directory, path))
+          removed += 1
+    os.remove(os.path.join(runsDir, f"{runId}.json"))
+  logger.info(f"Expired {len(expire)} runs of {org} ({removed} files removed)")
+  return expire
@@ -0,0 +1,178 @@
+import logging
+import math
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from metrics import METER, Meter
+
+logger = logging.getLogger(__name__)
+
+# tokens held back for a summary in flight until some have finished: the 1024-token prompt cap
+# plus max_tokens
+SUMMARY_RESERVE = 2048
+# exhausted() verdict when only the repos still being fetched can tell whether the next one fits
+DEFER = "defer"
+
+def age_days(timestamp, now):
+  if not timestamp:
+    return None
+  try:
+    moment = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+  except ValueError:
+    return None
+  if moment.tzinfo is None:
+    moment = moment.replace(tzinfo=timezone.utc)
+  return max(0.0, (now - moment).total_seconds() / 86400)
+
+# Priority of a repo from what the listing already says about it: recent pushes count most
+# (halving every halfLifeDays), stars scale that up logarithmically, and forks (whose commits are
+# usually the upstream's) count half.
+def repo_priority(repo, now, halfLifeDays=90):
+  age = age_days(repo.get('pushed_at') or repo.get('updated_at'), now)
+  activity = 0.0 if age is None else 0.5 ** (age / halfLifeDays)
+  score = (0.25 + activity) * (1 + math.log1p(repo.get('stargazers_count') or 0))
+  if repo.get('fork'):
+    score /= 2
+  return round(score, 4)
+
+# Decides which repos of an org are analyzed and in what order. plan() ranks the listing by
+# priority and drops repos that aren't worth a request (inactive, and empty ones with skipEmpty);
+# admit() is asked before each repo is started and turns repos away once a budget is spent: wall
+# time since the scan started, GitHub requests, LLM tokens or a plain repo count. Repos and
+# summaries still in flight are counted at an estimate (the commit pages a repo needs, the average
+# summary so far), so the request and token budgets are rarely overshot; the time budget can be by
+# the repos in flight. Requests and tokens are counted on the scheduler's own Meter, charged by
+# whatever runs inside charging(), so orgs running alongside in a batch don't count against it.
+# With batchSummaries the summaries only resolve when the batch is flushed after the scan, so the
+# token budget goes by the reserve estimate instead of waiting for them.
+class RepoScheduler:
+  def __init__(self, maxRepos=None, maxSeconds=None, maxRequests=None, maxLLMTokens=None, inactiveDays=None, skipEmpty=False, requestsPerRepo=1, batchSummaries=False):
+    self.MAX_REPOS = maxRepos
+    self.MAX_SECONDS = maxSeconds
+    self.MAX_REQUESTS = maxRequests
+    self.MAX_LLM_TOKENS = maxLLMTokens
+    self.INACTIVE_DAYS = inactiveDays
+    self.SKIP_EMPTY = skipEmpty
+    self.REQUESTS_PER_REPO = requestsPerRepo
+    self.BATCH_SUMMARIES = batchSummaries
+    self.STARTED = time.time()
+    self.meter = Meter()
+    self._lock = threading.Lock()
+    self._summaries = []
+    self._admitted = 0
+    self._finished = 0
+    self._exhausted = None
+    self.entries = {}
+
+  def plan(self, repos):
+    now = datetime.now(timezone.utc)
+    ranked = []
+    for repo in repos:
+      entry = {'name': repo.get('name'), 'priority': repo_priority(repo, now), 'pushed_at': repo.get('pushed_at'), 'status': 'pending'}
+      self.entries[entry['name']] = entry
+      age = age_days(repo.get('pushed_at'), now)
+      if self.SKIP_EMPTY and repo.get('size') == 0:
+        entry['status'] = 'empty'
+      elif self.INACTIVE_DAYS is not None and age is not None and age > self.INACTIVE_DAYS:
+        entry['status'] = 'inactive'
+      else:
+        ranked.append(repo)
+    ranked.sort(key=lambda r: self.entries[r.get('name')]['priority'], reverse=True)
+    return ranked
+
+  # Charges the requests and LLM tokens of the calling context, and of the pool tasks it submits
+  # with a copy of it, to this scheduler's budgets.
+  @contextmanager
+  def charging(self):
+    token = METER.set(self.meter)
+    try:
+      yield self
+    finally:
+      METER.reset(token)
+
+  # Which budget is spent, if any, counting what starting one more repo would cost.
+  def exhausted(self):
+    totals = self.meter.totals()
+    if self.MAX_REPOS is not None and self._admitted >= self.MAX_REPOS:
+      return 'max_repos'
+    if self.MAX_SECONDS is not None and time.time() - self.STARTED >= self.MAX_SECONDS:
+      return 'time'
+    if self.MAX_REQUESTS is not None:
+      inFlight = self._admitted - self._finished
+      if totals['requests'] + (inFlight + 1) * self.REQUESTS_PER_REPO > self.MAX_REQUESTS:
+        return 'github_requests'
+    while self.MAX_LLM_TOKENS is not None:
+      spent = self.meter.totals()['llm_tokens']
+      pending = [f for f in self._summaries if not f.done()]
+      done = len(self._summaries) - len(pending)
+      perSummary = spent / done if done and spent else SUMMARY_RESERVE
+      # repos still being fetched haven't submitted their summary yet
+      unsubmitted = self._admitted - len(self._summaries)
+      if spent + (len(pending) + unsubmitted + 1) * perSummary <= self.MAX_LLM_TOKENS:
+        break
+      # the estimate may be pessimistic; let a summary in flight settle it before deciding (batched
+      # summaries can't settle before the scan is over)
+      if pending and not self.BATCH_SUMMARIES:
+        wait(pending, return_when=FIRST_COMPLETED)
+      elif unsubmitted:
+        return DEFER
+      else:
+        return 'llm_tokens'
+    return None
+
+  # True to start the repo, False once a budget is spent, None to ask again after the next repo in
+  # flight is done.
+  def admit(self, repo):
+    if self._exhausted is None:
+      verdict = self.exhausted()
+      if verdict == DEFER:
+        return None
+      self._exhausted = verdict
+      if self._exhausted is not None:
+        logger.info(f"Budget '{self._exhausted}' spent after {self._admitted} repos; skipping the rest")
+    with self._lock:
+      entry = self.entries.setdefault(repo.get('name'), {'name': repo.get('name'), 'priority': None, 'pushed_at': repo.get('pushed_at')})
+      if self._exhausted is not None:
+        entry['status'] = f"budget:{self._exhausted}"
+        return False
+      self._admitted += 1
+      entry['status'] = 'covered'
+      return True
+
+  def finish(self, repo):
+    with self._lock:
+      self._finished += 1
+
+  # Repos taken over from a checkpoint are covered without costing anything.
+  def resume(self, repo):
+    self.entries[repo.get('name')]['status'] = 'covered'
+
+  def track(self, summaryFuture):
+    with self._lock:
+      self._summaries.append(summaryFuture)
+
+  # Covered and skipped repos in priority order; repos never handed to admit() (the scan stopped
+  # early) count as skipped for the budget that ran out.
+  def coverage(self):
+    rows = []
+    for entry in sorted(self.entries.values(), key=lambda e: -(e['priority'] or 0)):
+      if entry['status'] == 'pending':
+        entry = dict(entry, status=f"budget:{self._exhausted}" if self._exhausted else 'not_reached')
+      rows.append(entry)
+    return rows
+
+  def summary(self):
+    counts = {}
+    for row in self.coverage():
+      counts[row['status']] = counts.get(row['status'], 0) + 1
+    totals = self.meter.totals()
+    return {
+      'repos': counts,
+      'exhausted': self._exhausted,
+      'seconds': round(time.time() - self.STARTED, 2),
+      'github_requests': totals['requests'],
+      'llm_tokens': totals['llm_tokens'],
+    }
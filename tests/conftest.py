@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from fake_github import FakeGitHub, SyntheticOrg
+
+import org_analysis as oa
+from metrics import RunMetrics
+from transport import GitHubTransport
+
+@pytest.fixture
+def org():
+  return SyntheticOrg(repos=3, commitsPerRepo=40, members=3, forkRatio=0.0)
+
+@pytest.fixture
+def github(org):
+  fake = FakeGitHub(org).start()
+  yield fake
+  fake.stop()
+
+# Points org_analysis at the fake GitHub with a fresh transport that doesn't retry, so injected
+# errors fail the request at once. Returns a factory for configs writing under tmp_path.
+@pytest.fixture
+def analysis(github, org, tmp_path, monkeypatch):
+  monkeypatch.setattr(oa, "CONFIG", {"GITHUB_API_KEY": "test", "GITHUB_API_URL": github.url})
+  monkeypatch.setattr(oa, "METRICS", RunMetrics())
+  monkeypatch.setattr(oa, "TRANSPORT", GitHubTransport("test", maxRetries=0))
+  configs = []
+
+  def make(**kwargs):
+    kwargs.setdefault("outputDir", str(tmp_path) + "/")
+    kwargs.setdefault("useCache", False)
+    kwargs.setdefault("chartWorkers", 0)
+    config = oa.OrgAnalysisConfig(org.name, **kwargs)
+    oa.setup_run(config, "fetch")
+    configs.append(config)
+    return config
+
+  yield make
+  for config in configs:
+    config.STATE.close()
+    config.ROLLUPS.close()
+  if oa.TRANSPORT.cache is not None:
+    oa.TRANSPORT.cache.close()
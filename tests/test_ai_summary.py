@@ -0,0 +1,61 @@
+from ai_summary import StubClient, Summarizer, SummaryCache, SummaryPipeline, prompt_key
+from metrics import RunMetrics
+
+def summarizer(tmp_path, cached=True):
+  s = Summarizer(StubClient())
+  if cached:
+    s.cache = SummaryCache(str(tmp_path / "summaries.sqlite"))
+  s.metrics = RunMetrics()
+  return s
+
+def test_cache_miss_then_hit(tmp_path):
+  s = summarizer(tmp_path)
+  first = s.summarize("system", "commits of repo-0")
+  assert first.startswith("Stub summary")
+  assert (s.client.calls, s.cache.misses, s.cache.hits) == (1, 1, 0)
+
+  assert s.summarize("system", "commits of repo-0") == first
+  assert (s.client.calls, s.cache.misses, s.cache.hits) == (1, 1, 1)
+  assert s.metrics.snapshot()["llm"]["cache_hits"] == 1
+
+def test_cache_is_keyed_by_the_whole_prompt(tmp_path):
+  s = summarizer(tmp_path)
+  s.summarize("system", "commits of repo-0")
+  s.summarize("system", "commits of repo-1")
+  s.summarize("other system", "commits of repo-0")
+  assert s.client.calls == 3
+  assert prompt_key(s.MODEL, "system", "a", 1024) != prompt_key(s.MODEL, "system", "a", 512)
+
+def test_offline_miss_does_not_call_the_client(tmp_path):
+  s = summarizer(tmp_path)
+  s.summarize("system", "cached")
+  s.offline = True
+  assert s.summarize("system", "cached") is not None
+  assert s.summarize("system", "not cached") is None
+  assert s.client.calls == 1
+
+def test_batch_only_submits_uncached_prompts(tmp_path):
+  s = summarizer(tmp_path)
+  cached = s.summarize("system", "repo-0")
+  results = s.summarize_batch([("system", "repo-0"), ("system", "repo-1"), ("system", "repo-2")], pollInterval=0)
+  assert results[0] == cached
+  assert all(r.startswith("Stub summary") for r in results[1:])
+  # one call for the first summary, one per uncached prompt in the batch
+  assert s.client.calls == 3
+  assert s.summarize("system", "repo-2") == results[2]
+
+def test_pipeline_workers_resolve_every_future(tmp_path):
+  pipeline = SummaryPipeline(summarizer(tmp_path, cached=False), workers=2)
+  futures = [pipeline.submit("system", f"repo-{n}") for n in range(5)]
+  pipeline.flush()
+  assert [f.result() for f in futures] == [pipeline.summarizer.summarize("system", f"repo-{n}") for n in range(5)]
+  pipeline.close()
+
+def test_pipeline_batch_resolves_on_flush(tmp_path):
+  pipeline = SummaryPipeline(summarizer(tmp_path), batch=True)
+  futures = [pipeline.submit("system", f"repo-{n}") for n in range(3)]
+  assert not any(f.done() for f in futures)
+  pipeline.flush()
+  assert all(f.result().startswith("Stub summary") for f in futures)
+  assert pipeline.summarizer.metrics.snapshot()["llm"]["batches"] == 1
+  pipeline.close()
@@ -0,0 +1,84 @@
+from anthropic import Anthropic
+from fake_anthropic import FakeAnthropic
+from fake_github import SyntheticOrg
+
+from ai_summary import Summarizer, SummaryCache
+from http_cache import ResponseCache
+from transport import GitHubTransport
+
+def transport(github, tmp_path=None):
+  t = GitHubTransport("test", maxRetries=0)
+  t.apiUrl = github.url
+  if tmp_path is not None:
+    t.cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+  return t
+
+def test_synthetic_org_is_deterministic():
+  a, b = SyntheticOrg(repos=3, commitsPerRepo=5), SyntheticOrg(repos=3, commitsPerRepo=5)
+  assert a.repos == b.repos
+  assert a.commits == b.commits
+
+def test_push_moves_pushed_at_and_records_an_event(org):
+  before = org.repos[0]["pushed_at"]
+  org.push("repo-0", count=2)
+  assert org.repos[0]["pushed_at"] > before
+  assert len(org.commits["repo-0"]) == 42
+  assert org.events[0]["type"] == "PushEvent"
+
+def test_commits_are_paginated_and_filtered_by_since(org, github):
+  t = transport(github)
+  url = f"https://api.github.com/repos/{org.name}/repo-0/commits?page=1&per_page=30"
+  first = t.get(url)
+  assert len(first.json()) == 30
+  assert "next" in first.links
+  assert len(t.get(first.links["next"]["url"]).json()) == 10
+
+  since = org.commits["repo-0"][4]["commit"]["committer"]["date"]
+  assert len(t.get(url + f"&since={since}").json()) == 5
+
+def test_response_cache_miss_revalidation_and_hit(org, github, tmp_path):
+  t = transport(github, tmp_path)
+  url = f"https://api.github.com/orgs/{org.name}"
+  assert t.get(url).json()["login"] == org.name
+  # a stale entry is revalidated with its ETag and answered from disk
+  assert t.get(url).json()["login"] == org.name
+  # a fresh one isn't sent at all
+  assert t.get(url, ttl=3600).json()["login"] == org.name
+
+  assert (t.cache.misses, t.cache.revalidated, t.cache.hits) == (1, 1, 1)
+  assert github.total_requests() == 2
+  assert github.notModified == 1
+  t.cache.close()
+
+def test_offline_serves_only_the_cache(org, github, tmp_path):
+  t = transport(github, tmp_path)
+  t.get(f"https://api.github.com/orgs/{org.name}")
+  t.offline = True
+  assert t.get(f"https://api.github.com/orgs/{org.name}").status_code == 200
+  assert t.get(f"https://api.github.com/orgs/{org.name}/members") is None
+  assert t.cache.misses == 2
+  assert github.total_requests() == 1
+  t.cache.close()
+
+def test_errors_and_rate_limits_are_injected(org, github):
+  t = transport(github)
+  github.ERROR_RATE = 1.0
+  assert t.get(f"https://api.github.com/orgs/{org.name}").status_code == 502
+  github.ERROR_RATE, github.THROTTLE_RATE = 0.0, 1.0
+  response = t.get(f"https://api.github.com/orgs/{org.name}")
+  assert response.status_code == 403
+  assert t._is_rate_limited(response)
+  assert github.errors == 2
+
+def test_fake_anthropic_behind_the_summary_cache(tmp_path):
+  fake = FakeAnthropic().start()
+  try:
+    s = Summarizer(Anthropic(api_key="test", base_url=fake.url, max_retries=0))
+    s.cache = SummaryCache(str(tmp_path / "summaries.sqlite"))
+    first = s.summarize("system", "commits of repo-0")
+    assert first.startswith("Synthetic summary")
+    assert s.summarize("system", "commits of repo-0") == first
+    assert fake.requests == 1
+    assert fake.inputTokens > 0
+  finally:
+    fake.stop()
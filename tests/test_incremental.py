@@ -0,0 +1,61 @@
+import org_analysis as oa
+
+def repo(org, name):
+  return next(r for r in org.repos if r["name"] == name)
+
+def stored_shas(config, name):
+  return [c["sha"] for page in oa.stored_commit_pages({"name": name}, config) for c in page]
+
+def test_first_fetch_sets_the_watermark(org, github, analysis):
+  config = analysis(numCommits=20, incremental=True)
+  oa.fetch_commits_incremental(repo(org, "repo-0"), config)
+
+  mark = config.STATE.watermark("repo-0")
+  assert mark["pushed_at"] == repo(org, "repo-0")["pushed_at"]
+  assert mark["newest_sha"] == org.commits["repo-0"][0]["sha"]
+  assert len(stored_shas(config, "repo-0")) == 20
+
+def test_unchanged_repo_is_not_fetched_again(org, github, analysis):
+  config = analysis(numCommits=20, incremental=True)
+  oa.fetch_commits_incremental(repo(org, "repo-0"), config)
+  before = github.total_requests()
+
+  oa.fetch_commits_incremental(repo(org, "repo-0"), config)
+  assert github.total_requests() == before
+
+def test_push_fetches_only_new_commits(org, github, analysis):
+  config = analysis(numCommits=20, incremental=True)
+  oa.fetch_commits_incremental(repo(org, "repo-0"), config)
+  org.push("repo-0", count=2)
+
+  oa.fetch_commits_incremental(repo(org, "repo-0"), config)
+  assert config.STATE.watermark("repo-0")["pushed_at"] == repo(org, "repo-0")["pushed_at"]
+  assert stored_shas(config, "repo-0")[:2] == [c["sha"] for c in org.commits["repo-0"][:2]]
+  # only the page since the watermark is requested
+  assert github.requests["commits"] == 2
+
+def test_failed_fetch_keeps_the_watermark(org, github, analysis):
+  config = analysis(numCommits=20, incremental=True)
+  oa.fetch_commits_incremental(repo(org, "repo-0"), config)
+  before = config.STATE.watermark("repo-0")
+  org.push("repo-0", count=2)
+
+  github.ERROR_RATE = 1.0
+  oa.fetch_commits_incremental(repo(org, "repo-0"), config)
+  assert config.STATE.watermark("repo-0") == before
+
+  # the next run asks again and picks up the pushed commits
+  github.ERROR_RATE = 0.0
+  oa.fetch_commits_incremental(repo(org, "repo-0"), config)
+  assert config.STATE.watermark("repo-0")["pushed_at"] == repo(org, "repo-0")["pushed_at"]
+  assert stored_shas(config, "repo-0")[:2] == [c["sha"] for c in org.commits["repo-0"][:2]]
+
+def test_offline_fetch_keeps_the_pushed_at(org, github, analysis):
+  config = analysis(numCommits=20, incremental=True, useCache=True)
+  oa.fetch_commits_incremental(repo(org, "repo-0"), config)
+  before = config.STATE.watermark("repo-0")
+  org.push("repo-0", count=2)
+
+  offline = analysis(numCommits=20, incremental=True, useCache=True, offline=True)
+  oa.fetch_commits_incremental(repo(org, "repo-0"), offline)
+  assert offline.STATE.watermark("repo-0")["pushed_at"] == before["pushed_at"]
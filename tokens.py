@@ -0,0 +1,82 @@
+import logging
+import re
+import threading
+from bisect import bisect_right
+
+logger = logging.getLogger(__name__)
+
+# Roughly one Claude token per short word piece, number group or punctuation mark, with the
+# leading whitespace folded in. Used when the SDK doesn't ship a local tokenizer.
+ESTIMATE_PATTERN = re.compile(r"\s*(?:[^\W\d_]{1,5}|\d{1,3}|[^\w\s]|_)|\s+$")
+
+COMMIT_BOUNDARY = "\nDate: "
+
+# Token counting and truncation against a single encoding of the text. Uses the SDK's local
+# tokenizer when available (loaded once and shared) and a calibrated regex estimator otherwise.
+class TokenBudget:
+  def __init__(self, client=None):
+    self._client = client
+    self._tokenizer = None
+    self._loaded = False
+    self._lock = threading.Lock()
+
+  # The client may be created after the budget; its tokenizer is looked up again on next use.
+  def set_client(self, client):
+    with self._lock:
+      self._client = client
+      self._tokenizer = None
+      self._loaded = False
+
+  def _get_tokenizer(self):
+    if not self._loaded:
+      with self._lock:
+        if not self._loaded:
+          try:
+            self._tokenizer = self._client.get_tokenizer() if self._client is not None else None
+          except Exception as exc:
+            logger.info(f"Local tokenizer unavailable, estimating tokens: {exc}")
+            self._tokenizer = None
+          self._loaded = True
+    return self._tokenizer
+
+  # End character offset of every token in text.
+  def offsets(self, text):
+    tokenizer = self._get_tokenizer()
+    if tokenizer is not None:
+      return [end for _, end in tokenizer.encode(text).offsets]
+    return [m.end() for m in ESTIMATE_PATTERN.finditer(text)]
+
+  def count(self, text):
+    tokenizer = self._get_tokenizer()
+    if tokenizer is not None:
+      return len(tokenizer.encode(text).ids)
+    return sum(1 for _ in ESTIMATE_PATTERN.finditer(text))
+
+  # Cuts text to at most max_tokens, preferring to end on a commit boundary and otherwise on a
+  # line boundary so no commit entry or line is left half written.
+  def truncate(self, text, max_tokens, boundaries=(COMMIT_BOUNDARY, "\n")):
+    ends = self.offsets(text)
+    if len(ends) <= max_tokens:
+      return text
+    if max_tokens <= 0:
+      return ""
+
+    cut = ends[max_tokens - 1]
+    for boundary in boundaries:
+      pos = text.rfind(boundary, 0, cut)
+      # only back off to a boundary if that keeps at least half of the budget
+      if pos > 0 and bisect_right(ends, pos) >= max_tokens // 2:
+        return text[:pos]
+    return text[:cut]
+
+  # Same result as truncate("".join(parts), ...) without tokenizing parts that can't fit: the
+  # joined prefix grows until it is comfortably over the limit, then that prefix is cut.
+  def truncate_parts(self, parts, max_tokens, boundaries=(COMMIT_BOUNDARY, "\n"), slack=64):
+    n = 8
+    while n < len(parts):
+      prefix = "".join(parts[:n])
+      ends = self.offsets(prefix)
+      if len(ends) > max_tokens + slack:
+        return self.truncate(prefix, max_tokens, boundaries)
+      n *= 2
+    return self.truncate("".join(parts), max_tokens, boundaries)
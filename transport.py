@@ -0,0 +1,237 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+GITHUB_API_VERSION = "2022-11-28"
+GITHUB_API_URL = "https://api.github.com"
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# The rate-limit resource a request to url counts against, as GitHub reports it in
+# X-RateLimit-Resource: GraphQL queries and searches have budgets of their own.
+def rate_limit_resource(url):
+  path = url.split("?", 1)[0].rstrip("/")
+  if path.endswith("/graphql"):
+    return "graphql"
+  if "/search/" in path:
+    return "search"
+  return "core"
+
+# Shared keep-alive session for the GitHub API. Paces requests off the X-RateLimit-*
+# headers, honours Retry-After and retries 5xx / rate-limited responses with backoff. Each rate-limit
+# resource (core REST, graphql, search) is paced off its own budget. Pacing is shared by every
+# calling thread: each request takes the next send slot of its resource, so however many threads
+# send, what is left of the budget is spread over the window once. An exhausted budget only holds
+# back requests against the same resource; rate-limited responses without Retry-After (secondary
+# limits, which span resources) hold back everything for at least rateLimitBackoff seconds,
+# doubling per retry, as GitHub asks.
+class GitHubTransport:
+  def __init__(self, token, maxRetries=5, backoffFactor=1.0, maxBackoff=60, poolSize=32, paceThreshold=100, rateLimitBackoff=60, maxRateLimitBackoff=900):
+    self.MAX_RETRIES = maxRetries
+    self.BACKOFF_FACTOR = backoffFactor
+    self.MAX_BACKOFF = maxBackoff
+    self.PACE_THRESHOLD = paceThreshold
+    self.RATE_LIMIT_BACKOFF = rateLimitBackoff
+    self.MAX_RATE_LIMIT_BACKOFF = maxRateLimitBackoff
+
+    self.session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+    self.session.mount("https://", adapter)
+    self.session.mount("http://", adapter)
+    self.session.headers.update({
+      "X-GitHub-Api-Version": GITHUB_API_VERSION,
+      "Accept": "application/vnd.github+json",
+    })
+    # without a token GitHub still answers, at the much lower unauthenticated rate limit
+    if token:
+      self.session.headers["Authorization"] = "Bearer " + token
+
+    self._lock = threading.Lock()
+    # resource -> {"remaining", "reset", "nextSend", "blockedUntil"}; the None entry holds
+    # blocks that apply to every resource
+    self.rateLimits = {}
+    # the resource GitHub last reported for requests rate_limit_resource put under each name
+    self._reported = {}
+
+    self.cache = None
+    self.offline = False
+    self.metrics = None
+    # requests for https://api.github.com are sent here instead (a GitHub Enterprise host or a
+    # local stand-in); cache keys keep the canonical URL
+    self.apiUrl = None
+
+  def _record(self, name, *args):
+    if self.metrics is not None:
+      getattr(self.metrics, name)(*args)
+
+  def _limit(self, resource):
+    limit = self.rateLimits.get(resource)
+    if limit is None:
+      limit = self.rateLimits[resource] = {"remaining": None, "reset": None, "nextSend": 0.0, "blockedUntil": 0.0}
+    return limit
+
+  def _pace(self, resource):
+    with self._lock:
+      now = time.time()
+      resource = self._reported.get(resource, resource)
+      limit = self._limit(resource)
+      remaining = limit["remaining"]
+      reset = limit["reset"]
+      blockedUntil = max(limit["blockedUntil"], self._limit(None)["blockedUntil"])
+      if blockedUntil > now:
+        delay = blockedUntil - now
+      elif remaining is None or reset is None or remaining >= self.PACE_THRESHOLD or reset <= now:
+        return
+      elif remaining <= 0:
+        delay = reset - now + 1
+        logger.info(f"Rate limit for {resource} exhausted, sleeping {delay:.0f}s until reset")
+      else:
+        # spread what is left of the budget evenly over the remaining window: every request takes
+        # the next free slot, one interval after the previous one whichever thread sent it
+        slot = max(now, limit["nextSend"])
+        limit["nextSend"] = slot + (reset - now) / remaining
+        delay = slot - now
+
+    if delay > 0:
+      self._record("record_pacing", delay)
+      time.sleep(delay)
+
+  def _update_rate_limit(self, response, resource):
+    reported = response.headers.get("X-RateLimit-Resource")
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    reset = response.headers.get("X-RateLimit-Reset")
+    with self._lock:
+      if reported is not None:
+        self._reported[resource] = reported
+      resource = self._reported.get(resource, resource)
+      limit = self._limit(resource)
+      if remaining is not None:
+        limit["remaining"] = int(remaining)
+      if reset is not None:
+        limit["reset"] = int(reset)
+    if remaining is not None:
+      self._record("record_rate_limit", int(remaining), resource)
+    return resource
+
+  def _is_rate_limited(self, response):
+    if response.status_code == 429:
+      return True
+    if response.status_code != 403:
+      return False
+    if "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0":
+      return True
+    return "rate limit" in response.text.lower()
+
+  def _retry_delay(self, response, attempt):
+    if response is not None:
+      retryAfter = response.headers.get("Retry-After")
+      if retryAfter is not None and retryAfter.isdigit():
+        return int(retryAfter)
+      if response.headers.get("X-RateLimit-Remaining") == "0" and response.headers.get("X-RateLimit-Reset"):
+        return max(int(response.headers["X-RateLimit-Reset"]) - time.time(), 0) + 1
+      if self._is_rate_limited(response):
+        # a secondary limit without Retry-After: at least a minute, then exponentially longer
+        delay = self.RATE_LIMIT_BACKOFF * (2 ** attempt)
+        return min(delay + random.uniform(0, self.BACKOFF_FACTOR), self.MAX_RATE_LIMIT_BACKOFF)
+    delay = self.BACKOFF_FACTOR * (2 ** attempt)
+    return min(delay + random.uniform(0, self.BACKOFF_FACTOR), self.MAX_BACKOFF)
+
+  # Serves from the response cache when one is attached: fresh entries (within TTL, or the
+  # per-request ttl when given) are returned
+  # directly, stale ones are revalidated with If-None-Match/If-Modified-Since and a 304 is
+  # answered from disk. In offline mode only the cache is consulted.
+  def get(self, url, headers=None, ttl=None):
+    if self.cache is None:
+      if self.offline:
+        logger.info(f"Offline and no cache attached, skipping GET {url}")
+        return None
+      return self._send("GET", url, headers)
+
+    entry = self.cache.get(url)
+    if entry is not None and (self.offline or self.cache.is_fresh(entry, ttl)):
+      self._record("record_cache", "hit")
+      self.cache.count("hits")
+      self.cache.touch(url)
+      return self.cache.to_response(url, entry)
+
+    if self.offline:
+      logger.info(f"Offline cache miss for {url}")
+      self._record("record_cache", "offline_miss")
+      self.cache.count("misses")
+      return None
+
+    requestHeaders = dict(headers or {})
+    if entry is not None:
+      requestHeaders.update(self.cache.conditional_headers(entry))
+
+    response = self._send("GET", url, requestHeaders)
+    if response is None:
+      return None
+
+    if response.status_code == 304 and entry is not None:
+      self._record("record_cache", "revalidated")
+      self.cache.count("revalidated")
+      self.cache.touch(url, refreshed=True)
+      return self.cache.to_response(url, entry)
+
+    self._record("record_cache", "miss")
+    self.cache.count("misses")
+    if response.status_code == 200:
+      self.cache.put(url, response)
+    return response
+
+  # Uncached POST with the same pacing and retries, used for GraphQL queries.
+  def post(self, url, json=None, headers=None):
+    if self.offline:
+      logger.info(f"Offline, skipping POST {url}")
+      return None
+    return self._send("POST", url, headers, json)
+
+  def _send(self, method, url, headers=None, json=None):
+    if self.apiUrl and url.startswith(GITHUB_API_URL):
+      url = self.apiUrl.rstrip("/") + url[len(GITHUB_API_URL):]
+    resource = rate_limit_resource(url)
+    response = None
+    for attempt in range(self.MAX_RETRIES + 1):
+      self._pace(resource)
+      start = time.perf_counter()
+      try:
+        if method == "GET":
+          response = self.session.get(url, headers=headers, timeout=30)
+        else:
+          response = self.session.request(method, url, headers=headers, json=json, timeout=60)
+      except requests.RequestException as exc:
+        logger.info(f"{method} {url} failed: {exc}")
+        self._record("record_request", "error", 0, time.perf_counter() - start, attempt > 0)
+        response = None
+        if attempt == self.MAX_RETRIES:
+          return None
+        time.sleep(self._retry_delay(None, attempt))
+        continue
+
+      self._record("record_request", response.status_code, len(response.content or b""), time.perf_counter() - start, attempt > 0)
+      limited = self._update_rate_limit(response, resource)
+
+      if response.status_code in RETRY_STATUSES or self._is_rate_limited(response):
+        if attempt == self.MAX_RETRIES:
+          break
+        delay = self._retry_delay(response, attempt)
+        logger.info(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+        if self._is_rate_limited(response):
+          # an exhausted budget holds back its own resource, a secondary limit every resource
+          blocked = limited if response.headers.get("X-RateLimit-Remaining") == "0" else None
+          with self._lock:
+            limit = self._limit(blocked)
+            limit["blockedUntil"] = max(limit["blockedUntil"], time.time() + delay)
+        else:
+          time.sleep(delay)
+        continue
+
+      return response
+
+    return response